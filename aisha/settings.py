@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 from pathlib import Path
 import os
+import tempfile
 import dj_database_url
 from dotenv import load_dotenv
 
@@ -51,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.metrics.MetricsMiddleware',  # Outermost, so latency covers the whole middleware stack
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -147,10 +149,59 @@ DATABASES = {
     )
 }
 
+# SQLite: take the write lock when a transaction begins, so concurrent writers (shard workers,
+# the analysis worker and web requests) wait their turn instead of deadlocking on lock upgrades
+if DATABASES['default'].get('ENGINE') == 'django.db.backends.sqlite3':
+    DATABASES['default'].setdefault('OPTIONS', {})['transaction_mode'] = 'IMMEDIATE'
 
 
 
 
+
+# Cache
+# Dashboard and results data are cached under a data-version key (see app/caching.py).
+# The file-based default is shared by all gunicorn workers and the analysis worker on one node;
+# set CACHE_BACKEND=django.core.cache.backends.locmem.LocMemCache for a single process.
+# The data version and the metrics live in the separate 'counters' cache, which must increment
+# atomically across processes and never evict: the default locks a file-based cache on this node.
+# With several nodes, point COUNTER_CACHE_BACKEND at a shared backend with an atomic incr
+# (django.core.cache.backends.redis.RedisCache) and COUNTER_CACHE_LOCATION at its URL.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'aisha_cache')),
+        'TIMEOUT': 24 * 60 * 60,  # Only ages out superseded versions; freshness comes from the data version
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    'counters': {
+        'BACKEND': os.environ.get('COUNTER_CACHE_BACKEND', 'app.cache_backends.CounterFileBasedCache'),
+        'LOCATION': os.environ.get('COUNTER_CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'aisha_counters')),
+        'TIMEOUT': None,
+    },
+}
+
+# /metrics is denied unless the scraper sends METRICS_TOKEN as a bearer token or connects from one
+# of METRICS_ALLOWED_IPS (comma-separated, matched against REMOTE_ADDR; empty = token only)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+
+# Structured analysis and request logs (one key=value line per phase and per run)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'plain'},
+    },
+    'loggers': {
+        'app': {'handlers': ['console'], 'level': os.environ.get('APP_LOG_LEVEL', 'INFO')},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -194,6 +245,10 @@ STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGOUT_REDIRECT_URL = 'home'  # or any other URL name
 
+# Attrition analysis triggered by record saves is batched per transaction;
+# a positive value also waits this many seconds to merge saves from several transactions.
+ATTRITION_SIGNAL_DEBOUNCE_SECONDS = float(os.environ.get('ATTRITION_SIGNAL_DEBOUNCE_SECONDS', 0))
+
 
 
 
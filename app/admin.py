@@ -1,7 +1,7 @@
 from django.contrib import admin
 # Register your models here.
 from django.contrib import admin
-from .models import Faculty, Course, Student, AcademicRecord, AttritionAnalysisResult
+from .models import Faculty, Course, Student, AcademicRecord, AttritionAnalysisResult, AnalysisJob, AnalysisRun, RuleSet
 
 # Faculty Admin
 @admin.register(Faculty)
@@ -23,6 +23,7 @@ class StudentAdmin(admin.ModelAdmin):
     list_filter = ('faculty', 'course', 'academic_year', 'enrollment_status', 'financial_status', 'gender')
     search_fields = ('first_name', 'last_name')
     autocomplete_fields = ['faculty', 'course']
+    readonly_fields = Student.AGGREGATE_FIELDS  # Maintained from academic records
 
 # Academic Record Admin
 @admin.register(AcademicRecord)
@@ -35,10 +36,43 @@ class AcademicRecordAdmin(admin.ModelAdmin):
 # Attrition Analysis Result Admin
 @admin.register(AttritionAnalysisResult)
 class AttritionAnalysisResultAdmin(admin.ModelAdmin):
-    list_display = ('student', 'risk_level', 'certainty_score')
-    list_filter = ('risk_level',)
+    list_display = ('student', 'risk_level', 'certainty_score', 'rule_version')
+    list_filter = ('risk_level', 'rule_version')
     search_fields = ('student__first_name', 'student__last_name')
     autocomplete_fields = ['student']
+
+# Analysis Job Admin
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'phase', 'processed', 'total', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('attempts', 'started_at', 'heartbeat_at', 'finished_at', 'stats', 'error')
+
+# Analysis Run Admin
+@admin.register(AnalysisRun)
+class AnalysisRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'rule_version', 'chunks_committed', 'last_student_id', 'attempts', 'started_at', 'finished_at')
+    list_filter = ('status', 'rule_version')
+    readonly_fields = ('last_student_id', 'chunks_committed', 'attempts', 'stats', 'error', 'started_at', 'updated_at', 'finished_at')
+
+# Rule Set Admin: saved versions are read-only; a change is added as a new version, then activated
+@admin.register(RuleSet)
+class RuleSetAdmin(admin.ModelAdmin):
+    list_display = ('version', 'description', 'is_active', 'created_at')
+    readonly_fields = ('is_active', 'created_at')
+    actions = ['activate']
+
+    def get_readonly_fields(self, request, obj=None):
+        return self.readonly_fields + (('version', 'spec') if obj else ())
+
+    @admin.action(description="Activate the selected rule set")
+    def activate(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, "Select exactly one rule set to activate.", level='error')
+            return
+        rule_set = queryset.get()
+        rule_set.activate()
+        self.message_user(request, f"{rule_set} is now used by new analysis runs.")
     
 '''
 What This Admin Setup Does:
@@ -0,0 +1,169 @@
+"""
+Single-scan chart aggregation for the dashboards.
+Instead of one GROUP BY per chart, the table is grouped once by every dimension the charts need
+and each chart's breakdown is rolled up from those rows in Python. The grouped result has one
+row per distinct combination (faculties x courses x years x ...), which stays small however
+many students there are, and adding a chart adds no query.
+The dashboards read the pre-aggregated risk cube (RiskCubeCell), so they never scan the
+per-student tables at all.
+Also maintains the per-student GPA aggregates that analysis reads instead of averaging records.
+"""
+from django.db.models import Avg, Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import AcademicRecord, AttritionAnalysisResult, RiskCubeCell, Student
+
+
+def grouped_counts(queryset, dimensions, count=None):
+    """
+    Counts `queryset` grouped by all `dimensions` together in one query.
+    `count` is the aggregate to use (default: number of rows).
+    Returns a list of (values tuple, count) pairs in `dimensions` order.
+    """
+    rows = queryset.values(*dimensions).annotate(count=count or Count('pk')).order_by()
+    return [(tuple(row[dimension] for dimension in dimensions), row['count']) for row in rows]
+
+
+def breakdown(grouped, dimensions, dimension, where=None):
+    """
+    Rolls grouped counts up to one dimension, optionally keeping only rows whose other
+    dimensions match `where` (e.g. {'risk_level': 'High'}).
+    Returns (labels, counts) sorted by label, ready for Chart.js.
+    """
+    index = dimensions.index(dimension)
+    conditions = [(dimensions.index(name), value) for name, value in (where or {}).items()]
+
+    totals = {}
+    for values, count in grouped:
+        if all(values[i] == value for i, value in conditions):
+            totals[values[index]] = totals.get(values[index], 0) + count
+
+    labels = sorted((label for label, total in totals.items() if total), key=lambda label: (label is None, label))
+    return labels, [totals[label] for label in labels]
+
+
+# -----------------------------------------
+# Chart data for the two dashboards
+# -----------------------------------------
+
+STUDENT_DIMENSIONS = ['academic_year', 'gender', 'faculty__name', 'course__name']
+RISK_DIMENSIONS = ['risk_level', 'faculty__name', 'academic_year', 'course__name', 'gender']
+
+# Query parameter -> RiskCubeCell lookup accepted as slice filters by the dashboards
+CUBE_FILTERS = {
+    'faculty': 'faculty_id',
+    'course': 'course_id',
+    'year': 'academic_year',
+    'gender': 'gender',
+    'financial_status': 'financial_status',
+}
+
+
+def cube_filters(params):
+    """
+    Picks the dimension filters out of request parameters, ignoring empty and malformed values.
+    """
+    filters = {}
+    for param, lookup in CUBE_FILTERS.items():
+        value = params.get(param)
+        if not value:
+            continue
+        if lookup.endswith('_id') or lookup == 'academic_year':
+            if not value.isdigit():
+                continue
+        filters[lookup] = value
+    return filters
+
+
+def student_overview(filters=None):
+    """
+    Chart data for dashboard_view (students per year, gender, faculty and course) from one cube query.
+    """
+    cells = RiskCubeCell.objects.filter(**(filters or {}))
+    grouped = grouped_counts(cells, STUDENT_DIMENSIONS, Sum('student_count'))
+    years, year_counts = breakdown(grouped, STUDENT_DIMENSIONS, 'academic_year')
+    genders, gender_counts = breakdown(grouped, STUDENT_DIMENSIONS, 'gender')
+    faculties, faculty_counts = breakdown(grouped, STUDENT_DIMENSIONS, 'faculty__name')
+    courses, course_counts = breakdown(grouped, STUDENT_DIMENSIONS, 'course__name')
+
+    return {
+        'total_students': sum(count for _, count in grouped),
+        'years': years,
+        'year_counts': year_counts,
+        'genders': genders,
+        'gender_counts': gender_counts,
+        'faculties': faculties,
+        'faculty_counts': faculty_counts,
+        'courses': courses,
+        'course_counts': course_counts,
+    }
+
+
+def risk_overview(filters=None):
+    """
+    Chart data for risk_level_distribution (all risk levels, then High risk by faculty, year,
+    course and gender) from one cube query.
+    """
+    cells = RiskCubeCell.objects.filter(**(filters or {})).exclude(risk_level=RiskCubeCell.NOT_ANALYSED)
+    grouped = grouped_counts(cells, RISK_DIMENSIONS, Sum('student_count'))
+    high = {'risk_level': AttritionAnalysisResult.HIGH}
+    labels, counts = breakdown(grouped, RISK_DIMENSIONS, 'risk_level')
+    faculty_labels, faculty_counts = breakdown(grouped, RISK_DIMENSIONS, 'faculty__name', high)
+    year_labels, year_counts = breakdown(grouped, RISK_DIMENSIONS, 'academic_year', high)
+    course_labels, course_counts = breakdown(grouped, RISK_DIMENSIONS, 'course__name', high)
+    gender_labels, gender_counts = breakdown(grouped, RISK_DIMENSIONS, 'gender', high)
+
+    return {
+        'labels': labels,
+        'counts': counts,
+        'faculty_labels': faculty_labels,
+        'faculty_counts': faculty_counts,
+        'year_labels': year_labels,
+        'year_counts': year_counts,
+        'course_labels': course_labels,
+        'course_counts': course_counts,
+        'gender_labels': gender_labels,
+        'gender_counts': gender_counts,
+    }
+
+
+# -----------------------------------------
+# Datasets served by the JSON chart API
+# -----------------------------------------
+
+# Overview name -> (cache name shared with the dashboard views, function building it)
+OVERVIEWS = {
+    'students': ('dashboard', student_overview),
+    'risk': ('risk_distribution', risk_overview),
+}
+
+# Chart dataset -> (overview, labels key, counts key)
+CHART_DATASETS = {
+    'students_per_year': ('students', 'years', 'year_counts'),
+    'students_by_gender': ('students', 'genders', 'gender_counts'),
+    'students_by_faculty': ('students', 'faculties', 'faculty_counts'),
+    'students_by_course': ('students', 'courses', 'course_counts'),
+    'risk_levels': ('risk', 'labels', 'counts'),
+    'high_risk_by_faculty': ('risk', 'faculty_labels', 'faculty_counts'),
+    'high_risk_by_year': ('risk', 'year_labels', 'year_counts'),
+    'high_risk_by_course': ('risk', 'course_labels', 'course_counts'),
+    'high_risk_by_gender': ('risk', 'gender_labels', 'gender_counts'),
+}
+
+
+# -----------------------------------------
+# Per-student GPA aggregates (Student.avg_gpa and Student.record_count)
+# -----------------------------------------
+
+def refresh_gpa_aggregates(students=None):
+    """
+    Recomputes avg_gpa and record_count from academic_records for a Student queryset (default:
+    all students) in a single UPDATE with correlated subqueries. Returns the number of students updated.
+    """
+    if students is None:
+        students = Student.objects.all()
+    records = AcademicRecord.objects.filter(student=OuterRef('pk')).order_by().values('student')
+    return students.update(
+        avg_gpa=Coalesce(Subquery(records.annotate(value=Avg('gpa')).values('value')), Value(0.0)),
+        record_count=Coalesce(Subquery(records.annotate(value=Count('id')).values('value')), Value(0)),
+    )
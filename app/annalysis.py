@@ -1,12 +1,17 @@
 # Imports
-import pandas as pd
 import numpy as np
-from django.db.models import Avg
-import skfuzzy as fuzz  # scikit-fuzzy, used for fuzzy logic computations
-from django.db import transaction
-from .models import Student, AcademicRecord, AttritionAnalysisResult
+from django.db.models import Max, Min
+from django.db import connections, transaction
+from .models import Student, AttritionAnalysisResult, RuleSet
+from .rules import get_rule_set
+from .cube import patch_risk_cube, rebuild_risk_cube, snapshot_students
+from .caching import bump_data_version
+from . import checkpoints, metrics
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import contextlib
+import hashlib
 import logging
-import traceback
+import multiprocessing
 
 logger = logging.getLogger(__name__)  # Configures logger for error reporting
 
@@ -14,65 +19,71 @@ logger = logging.getLogger(__name__)  # Configures logger for error reporting
 # Step 1: Data Retrieval
 # -----------------------------------------
 
-def fetch_student_data():
+STUDENT_COLUMNS = ('id', 'first_name', 'financial_status', 'course__complexity_level', 'avg_gpa')
+
+def fetch_student_data(students=None):
     """
-    Fetches student data along with their GPA and related metadata (course, faculty, financial status, etc.)
-    and returns it as a Pandas DataFrame for easier processing.
+    Loads the cohort (all students, or the given Student queryset) in a single query: the
+    maintained average GPA (Student.avg_gpa), course complexity level and financial status.
+    Returns a dict of typed NumPy columns, the inputs of the rule set evaluators.
     """
-    students = Student.objects.select_related('course', 'faculty').all()
-    data = []
-
-    for student in students:
-        records = AcademicRecord.objects.filter(student=student)
-        avg_gpa = records.aggregate(Avg('gpa'))['gpa__avg'] or 0  # Computes average GPA; fallback is 0 if no records
+    if students is None:
+        students = Student.objects.all()
+    # avg_gpa is kept on the student row, so academic records are never joined
+    return _student_columns(list(students.order_by('id').values_list(*STUDENT_COLUMNS)))
 
-        data.append({
-            'student_id': student.id,
-            'name': student.first_name,
-            'age': student.age,
-            'gender': student.gender,
-            'faculty': student.faculty.name if student.faculty else None,
-            'course': student.course.name if student.course else None,
-            'complexity': student.course.complexity if (student.course and hasattr(student.course, 'complexity')) else 'Simple',
-            'avg_gpa': avg_gpa,
-            'financial_status': student.financial_status,
-        })
+def iter_student_chunks(students=None, chunk_size=2000, after=None):
+    """
+    Streams the cohort in id order as successive column dicts of at most chunk_size students,
+    starting after student id `after` if given. Each chunk is its own keyset query
+    (id > last id ORDER BY id LIMIT chunk_size) on the primary key, so only one chunk is held in
+    memory and no cursor or snapshot stays open while the caller commits between chunks.
+    """
+    if students is None:
+        students = Student.objects.all()
+    students = students.order_by('id').values_list(*STUDENT_COLUMNS)
+    while True:
+        rows = list((students if after is None else students.filter(id__gt=after))[:chunk_size])
+        if rows:
+            yield _student_columns(rows)
+        if len(rows) < chunk_size:
+            return
+        after = rows[-1][0]
+
+def _student_columns(rows):
+    ids, names, statuses, complexities, gpas = zip(*rows) if rows else ((), (), (), (), ())
+    return {
+        'student_id': np.array(ids, dtype=np.int64),
+        'name': np.array(names, dtype=object),
+        'avg_gpa': np.array(gpas, dtype=float),  # 0 for students without records
+        'finance_score': _map_column(statuses, map_financial_status_to_score),
+        'complexity_level': _map_column(
+            complexities, lambda level: map_complexity_to_numeric(map_complexity_to_fuzzy_set(level))
+        ),
+    }
 
-    return pd.DataFrame(data)  # Converts list of dicts into DataFrame
+def _map_column(values, mapper):
+    """
+    Applies a label -> score mapping to a column by mapping each distinct label once.
+    """
+    if not values:
+        return np.array([], dtype=float)
+    labels, inverse = np.unique(np.array(values, dtype=object), return_inverse=True)
+    return np.array([mapper(label) for label in labels], dtype=float)[inverse]
 
 # -----------------------------------------
-# Step 2: Define Fuzzy Membership Functions
+# Step 2: Fuzzy Rule Sets
 # -----------------------------------------
 
-def define_fuzzy_membership_functions():
+# Membership functions, rule weights and the borderline policy are versioned data (RuleSet,
+# compiled by app/rules.py); version 1 is rules.DEFAULT_RULE_SPEC.
+
+def get_compiled_fis(rule_version=None):
     """
-    Defines fuzzy membership functions for GPA, financial status, and course complexity.
-    Fuzzy logic allows reasoning with degrees of truth rather than fixed binary values.
+    Returns the compiled evaluator for a rule version (default: the active rule set).
+    Each version is compiled once and cached for the process.
     """
-    gpa_range = np.arange(0, 5.1, 0.1)         # GPA values from 0 to 5
-    finance_range = np.arange(0, 11, 1)        # Finance score values from 0 to 10
-    complexity_range = np.arange(0, 11, 1)     # Complexity values from 0 to 10
-
-    return {
-        'gpa': {
-            'range': gpa_range,
-            'low': fuzz.trimf(gpa_range, [0, 0, 2.0]),         # Triangular fuzzy set: low GPA
-            'medium': fuzz.trimf(gpa_range, [1.8, 3.0, 3.8]),  # Medium GPA
-            'high': fuzz.trimf(gpa_range, [3.7, 4.3, 5.0]),    # High GPA
-        },
-        'finance': {
-            'range': finance_range,
-            'struggling': fuzz.trimf(finance_range, [0, 0, 3]),       # Poor financial background
-            'good': fuzz.trimf(finance_range, [2, 5, 7]),             # Average financial standing
-            'scholarship': fuzz.trimf(finance_range, [6, 9, 10]),     # High/Scholarship status
-        },
-        'complexity': {
-            'range': complexity_range,
-            'easy': fuzz.trimf(complexity_range, [0, 0, 3]),          # Easy course
-            'moderate': fuzz.trimf(complexity_range, [2, 5, 8]),      # Moderate course
-            'hard': fuzz.trimf(complexity_range, [7, 10, 10]),        # Difficult course
-        }
-    }
+    return get_rule_set(rule_version or RuleSet.active_version())
 
 # -----------------------------------------
 # Step 3: Helper Mapping Functions
@@ -100,112 +111,357 @@ def map_complexity_to_fuzzy_set(level):
     return {'Simple': 'easy', 'Moderate': 'moderate', 'Difficult': 'hard'}.get(level, 'easy')
 
 # -----------------------------------------
-# Step 4: Fuzzy Logic Evaluation
+# Step 4: Change Detection
 # -----------------------------------------
 
-def compute_risk_for_student(gpa, finance_score, complexity_level, fuzzy_sets):
+def compute_input_fingerprints(avg_gpa, finance_score, complexity_level, rule_version):
+    """
+    Builds a fingerprint per student from the scoring inputs (average GPA, financial status score,
+    course complexity) and the rule version. A result whose stored fingerprint differs is stale.
+    """
+    return [
+        hashlib.md5(f"{gpa:.6f}|{finance:g}|{complexity:g}|{rule_version}".encode()).hexdigest()
+        for gpa, finance, complexity in zip(
+            np.asarray(avg_gpa, dtype=float).tolist(),
+            np.asarray(finance_score, dtype=float).tolist(),
+            np.asarray(complexity_level, dtype=float).tolist(),
+        )
+    ]
+
+def select_changed_students(columns, fingerprints):
     """
-    Uses fuzzy logic to compute a student's attrition risk level (High, Medium, Low)
-    and a certainty score based on GPA, financial score, and course complexity.
+    Returns a boolean mask over the cohort columns selecting students whose current fingerprint
+    differs from the one stored on their AttritionAnalysisResult, or who have no result yet.
     """
-    if isinstance(complexity_level, str):
-        complexity_level = map_complexity_to_numeric(complexity_level)
+    student_ids = columns['student_id'].tolist()
+    if not student_ids:
+        return np.zeros(0, dtype=bool)
+    results = AttritionAnalysisResult.objects.all()
+    if student_ids[-1] - student_ids[0] < 2 * len(student_ids):
+        # A dense id range (a chunk of the whole cohort) reads faster as a range scan than a long IN list
+        results = results.filter(student_id__gte=student_ids[0], student_id__lte=student_ids[-1])
+    else:
+        results = results.filter(student_id__in=student_ids)
+    stored = dict(results.values_list('student_id', 'input_fingerprint'))
+    return np.array(
+        [stored.get(student_id) != fingerprint for student_id, fingerprint in zip(student_ids, fingerprints)],
+        dtype=bool,
+    )
 
-    # Membership degrees for GPA
-    gpa_vals = {
-        'low': fuzz.interp_membership(fuzzy_sets['gpa']['range'], fuzzy_sets['gpa']['low'], gpa),
-        'medium': fuzz.interp_membership(fuzzy_sets['gpa']['range'], fuzzy_sets['gpa']['medium'], gpa),
-        'high': fuzz.interp_membership(fuzzy_sets['gpa']['range'], fuzzy_sets['gpa']['high'], gpa),
-    }
+# -----------------------------------------
+# Step 5: Bulk Persistence of Results
+# -----------------------------------------
 
-    # Membership degrees for finance
-    finance_vals = {
-        'struggling': fuzz.interp_membership(fuzzy_sets['finance']['range'], fuzzy_sets['finance']['struggling'], finance_score),
-        'good': fuzz.interp_membership(fuzzy_sets['finance']['range'], fuzzy_sets['finance']['good'], finance_score),
-        'scholarship': fuzz.interp_membership(fuzzy_sets['finance']['range'], fuzzy_sets['finance']['scholarship'], finance_score),
-    }
+PERSIST_CHUNK_SIZE = 2000  # Rows written per INSERT ... ON CONFLICT statement
 
-    # Membership degrees for course complexity
-    complexity_vals = {
-        'easy': fuzz.interp_membership(fuzzy_sets['complexity']['range'], fuzzy_sets['complexity']['easy'], complexity_level),
-        'moderate': fuzz.interp_membership(fuzzy_sets['complexity']['range'], fuzzy_sets['complexity']['moderate'], complexity_level),
-        'hard': fuzz.interp_membership(fuzzy_sets['complexity']['range'], fuzzy_sets['complexity']['hard'], complexity_level),
-    }
+def persist_results(student_ids, risk_levels, certainties, fingerprints, rule_version, chunk_size=PERSIST_CHUNK_SIZE, on_chunk=None):
+    """
+    Upserts analysis results in chunks, one INSERT ... ON CONFLICT (student) DO UPDATE per chunk,
+    each result recording the rule version that produced it.
+    Each chunk commits in its own transaction so row locks are only held for that chunk.
+    on_chunk, if given, is called with the number of rows written so far after each commit.
+    Returns a dict with the number of rows inserted and updated, and the risk level changes
+    as {'old->new': count} ('none' for students without a previous result).
+    """
+    stats = {'inserted': 0, 'updated': 0, 'transitions': {}}
+    student_ids = list(student_ids)
+    risk_levels = list(risk_levels)
+    certainties = list(certainties)
+    fingerprints = list(fingerprints)
+
+    for start in range(0, len(student_ids), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        chunk_ids = student_ids[chunk]
+        results = [
+            AttritionAnalysisResult(
+                student_id=student_id, risk_level=risk_level, certainty_score=certainty,
+                input_fingerprint=fingerprint, rule_version=rule_version,
+            )
+            for student_id, risk_level, certainty, fingerprint in zip(
+                chunk_ids, risk_levels[chunk], certainties[chunk], fingerprints[chunk]
+            )
+        ]
+
+        with transaction.atomic():
+            previous = dict(
+                AttritionAnalysisResult.objects.filter(student_id__in=chunk_ids).values_list('student_id', 'risk_level')
+            )
+            AttritionAnalysisResult.objects.bulk_create(
+                results,
+                update_conflicts=True,
+                unique_fields=['student'],
+                update_fields=['risk_level', 'certainty_score', 'input_fingerprint', 'rule_version'],
+            )
+
+        stats['updated'] += len(previous)
+        stats['inserted'] += len(results) - len(previous)
+        for result in results:
+            old = previous.get(result.student_id, 'none')
+            if old != result.risk_level:
+                transition = f'{old}->{result.risk_level}'
+                stats['transitions'][transition] = stats['transitions'].get(transition, 0) + 1
+        if on_chunk:
+            on_chunk(stats['inserted'] + stats['updated'])
+
+    return stats
 
-    # Aggregated risk scores using weighted influence of factors
-    high_risk = 0.6 * gpa_vals['low'] + 0.25 * finance_vals['struggling'] + 0.15 * complexity_vals['hard']
-    medium_risk = 0.4 * gpa_vals['medium'] + 0.3 * finance_vals['good'] + 0.3 * complexity_vals['moderate']
-    low_risk = 0.6 * gpa_vals['high'] + 0.25 * finance_vals['scholarship'] + 0.15 * complexity_vals['easy']
+# -----------------------------------------
+# Step 6: Cohort Analysis and Sharding
+# -----------------------------------------
 
-    scores = {'High': high_risk, 'Medium': medium_risk, 'Low': low_risk}
-    sorted_scores = sorted(scores.items(), key=lambda x: x[1], reverse=True)  # Sort by highest score
-    risk_level, top_score = sorted_scores[0]
-    certainty = int(top_score * 100)  # Convert to percentage
+PIPELINE_PHASES = ('fetch', 'score', 'persist')  # Run once per chunk; the cube is updated once per run
 
-    # Handle borderline results where two risk levels are very close
-    diff = sorted_scores[0][1] - sorted_scores[1][1]
-    if diff < 0.12:
-        alt = sorted_scores[1][0]
-        if 'High' in (risk_level, alt):
-            risk_level = 'High'
-        elif 'Medium' in (risk_level, alt):
-            risk_level = 'Medium'
-        certainty = int((sorted_scores[0][1] + sorted_scores[1][1]) / 2 * 100)
+def analyse_cohort(students=None, chunk_size=PERSIST_CHUNK_SIZE, incremental=False, exact=False, progress=None, update_cube=True, resume=True):
+    """
+    Streams a cohort (all students, or the given Student queryset) through the pipeline one chunk
+    at a time: each chunk of chunk_size students is read, scored, written and committed before
+    the next one is read. Memory stays flat whatever the cohort size, and if the
+    run dies every chunk committed so far is kept.
+    Runs over the whole cohort are checkpointed as an AnalysisRun (see app.checkpoints): an
+    interrupted run with the same rule version and options is resumed after its last committed
+    chunk unless resume=False, and the run is marked Completed only once every chunk is in.
+    progress, if given, is called as progress(phase, processed, total) as the run advances.
+    Afterwards the risk cube is rebuilt (whole cohort) or patched (queryset) unless update_cube=False.
+    Each phase is timed and its queries counted over all chunks (see app.metrics); the figures
+    are also returned under stats['phases'].
+    Errors propagate to the caller; returns a dict with rows inserted, updated and skipped.
+    """
+    fis = get_compiled_fis()  # Compiled once per rule version and reused across runs
+    timings = {}
+
+    run = None
+    if students is None and update_cube:  # Subsets and shards are short and retried whole instead
+        run = checkpoints.start_run(fis.rule_version, incremental, exact, resume)
+        stats = checkpoints.carried_stats(run)
+    else:
+        stats = {'inserted': 0, 'updated': 0, 'skipped': 0, 'transitions': {}}
+
+    with metrics.analysis_phase('fetch', timings, record=False):
+        cube_before = snapshot_students(students) if (update_cube and students is not None) else None
+        total = None
+        if progress:  # The total is only needed to report progress
+            total = (Student.objects.all() if students is None else students).count()
+    progress = progress or (lambda phase, processed, total: None)
+
+    # Pulled one chunk at a time: each stage below holds a single chunk, never the cohort
+    chunks = iter_student_chunks(students, chunk_size, after=run.last_student_id if run else None)
+    processed = stats['inserted'] + stats['updated'] + stats['skipped']  # Non-zero when resuming
+    try:
+        while True:
+            progress('fetch', processed, total)
+            with metrics.analysis_phase('fetch', timings, record=False):
+                columns = next(chunks, None)
+                if columns is None:
+                    break
+                last_student_id = int(columns['student_id'][-1])
+                fingerprints = compute_input_fingerprints(
+                    columns['avg_gpa'], columns['finance_score'], columns['complexity_level'], fis.rule_version
+                )
+                size = len(fingerprints)
+                if incremental:
+                    # Keep only students whose inputs or rule version changed since their last result
+                    changed = select_changed_students(columns, fingerprints)
+                    columns = {name: column[changed] for name, column in columns.items()}
+                    fingerprints = [fingerprint for fingerprint, keep in zip(fingerprints, changed.tolist()) if keep]
+                stats['skipped'] += size - len(fingerprints)
+
+            # One vectorized pass over the chunk
+            progress('score', processed, total)
+            with metrics.analysis_phase('score', timings, record=False):
+                risk_levels, certainties = fis.score(columns, exact=exact)
+
+            # One upsert, committed (with the run's checkpoint) before the next chunk is read
+            progress('persist', processed, total)
+            with metrics.analysis_phase('persist', timings, record=False):
+                with transaction.atomic() if run else contextlib.nullcontext():
+                    merge_stats(stats, persist_results(
+                        columns['student_id'].tolist(), risk_levels.tolist(), certainties.tolist(), fingerprints,
+                        fis.rule_version, chunk_size,
+                    ))
+                    if run:
+                        checkpoints.checkpoint(run, last_student_id, stats)
+            processed += size
+    except Exception as e:
+        if run:
+            checkpoints.interrupt_run(run, e)
+        bump_data_version()  # The chunks committed before the failure are kept; don't serve stale views of them
+        raise
+
+    metrics.record_phases(timings, PIPELINE_PHASES)
+    if update_cube:
+        progress('cube', processed, total)
+        with metrics.analysis_phase('cube', timings):
+            if students is None:
+                rebuild_risk_cube()
+            else:
+                patch_risk_cube(cube_before, snapshot_students(students))
+    bump_data_version()  # Bulk writes send no signals, so invalidate cached views here
+    if run:
+        checkpoints.finish_run(run, stats)
+        stats['run'] = run.pk
+
+    stats['phases'] = timings['phases']
+    # Shards (update_cube=False) record their students; the run itself is counted by run_sharded_analysis
+    metrics.record_run(('cohort' if students is None else 'subset') if update_cube else None, stats)
+    metrics.flush()
+    return stats
+
+def merge_stats(stats, other):
+    """
+    Adds the rows inserted, updated and skipped and the risk transitions of `other` into `stats`.
+    """
+    for key in ('inserted', 'updated', 'skipped'):
+        stats[key] += other.get(key, 0)
+    for transition, count in other['transitions'].items():
+        stats['transitions'][transition] = stats['transitions'].get(transition, 0) + count
+
+def plan_shards(shard_count, students=None):
+    """
+    Splits the cohort into up to shard_count contiguous student-id ranges, as (low, high) pairs with high exclusive.
+    """
+    if students is None:
+        students = Student.objects.all()
+    bounds = students.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return []
 
-    return risk_level, certainty
+    edges = np.linspace(bounds['low'], bounds['high'] + 1, shard_count + 1).astype(np.int64).tolist()
+    return [(low, high) for low, high in zip(edges[:-1], edges[1:]) if high > low]
+
+def _analyse_shard(shard, chunk_size, incremental, exact):
+    """
+    Process-pool entry point: analyses one id-range shard on the worker's own DB connection.
+    """
+    low, high = shard
+    try:
+        # The parent rebuilds the cube once all shards are in
+        return analyse_cohort(Student.objects.filter(id__gte=low, id__lt=high), chunk_size, incremental, exact, update_cube=False)
+    finally:
+        connections.close_all()
+
+def run_sharded_analysis(workers, chunk_size=PERSIST_CHUNK_SIZE, incremental=False, exact=False, max_retries=1, progress=None):
+    """
+    Runs batch analysis across a pool of worker processes, one id-range shard per task.
+    Each shard commits on its own, so a failed shard is retried alone without rolling back the others.
+    progress, if given, is called as progress(phase, processed, total) each time a shard finishes.
+    Returns the merged stats plus the errors met and any shards that still failed after retrying.
+    Phase timings in stats['phases'] are summed over the shards.
+    """
+    progress = progress or (lambda phase, processed, total: None)
+    stats = {'inserted': 0, 'updated': 0, 'skipped': 0, 'transitions': {}, 'phases': {}, 'errors': [], 'failed_shards': []}
+    pending = plan_shards(workers)
+    total = Student.objects.count()
+    progress('persist', 0, total)
+
+    # Workers are forked, so they must not inherit the parent's open connections or unflushed metrics
+    connections.close_all()
+    metrics.flush()
+
+    for attempt in range(max_retries + 1):
+        if not pending:
+            break
+
+        failed = []
+        # A fresh pool per attempt, in case a crashed worker broke the previous one
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            futures = {pool.submit(_analyse_shard, shard, chunk_size, incremental, exact): shard for shard in pending}
+            for future in as_completed(futures):
+                shard = futures[future]
+                try:
+                    shard_stats = future.result()
+                except Exception as e:
+                    failed.append(shard)
+                    stats['errors'].append(f"Shard {shard[0]}-{shard[1]} failed on attempt {attempt + 1}: {e}")
+                    metrics.inc('aisha_analysis_errors_total')
+                    continue
+                merge_stats(stats, shard_stats)
+                for phase, totals in shard_stats['phases'].items():
+                    metrics.add_phase(stats, phase, totals['seconds'], totals['queries'])
+                progress('persist', stats['inserted'] + stats['updated'] + stats['skipped'], total)
+        pending = failed
+
+    stats['failed_shards'] = pending
+    progress('cube', total, total)
+    with metrics.analysis_phase('cube', stats):
+        rebuild_risk_cube()
+    bump_data_version()
+    metrics.inc('aisha_analysis_runs_total', labels={'mode': 'sharded'})  # Students were counted by the shards
+    metrics.flush()
+    return stats
 
 # -----------------------------------------
-# Step 5: Run Analysis for One or All Students
+# Step 7: Run Analysis for One or All Students
 # -----------------------------------------
 
-def run_attrition_analysis(student=None):
+def run_attrition_analysis(student=None, chunk_size=PERSIST_CHUNK_SIZE, incremental=False, exact=False, workers=1, students=None, progress=None):
     """
     Runs the fuzzy-based attrition risk analysis on:
     - a single student if specified
+    - a Student queryset through the batch path if `students` is passed
     - all students if no specific student is passed.
+    With incremental=True, batch mode only re-scores students whose input fingerprint
+    changed since their last result (or who have no result yet).
+    Scores come from the compiled lookup table unless exact=True asks for full interpolation.
+    With workers > 1, batch mode is split into shards scored in parallel processes.
+    progress, if given, is passed to the batch run as progress(phase, processed, total).
     
     Results are stored in the database (AttritionAnalysisResult).
+    Returns a dict with the number of result rows inserted, updated and skipped,
+    or None if the run failed (the error is logged and counted in the metrics).
     """
-    fuzzy_sets = define_fuzzy_membership_functions()  # Load fuzzy logic rules
-
     try:
-        with transaction.atomic():  # Ensures DB integrity for batch operations
-            if student:
+        if student:
+            fis = get_compiled_fis()
+            cube_students = Student.objects.filter(pk=student.pk)
+            with transaction.atomic():
                 # Single student analysis
-                records = AcademicRecord.objects.filter(student=student)
-                avg_gpa = records.aggregate(Avg('gpa'))['gpa__avg'] or 0
-                finance_score = map_financial_status_to_score(student.financial_status)
-                complexity_level = student.course.complexity if (student.course and hasattr(student.course, 'complexity')) else 'Simple'
-
-                risk_level, certainty = compute_risk_for_student(avg_gpa, finance_score, complexity_level, fuzzy_sets)
+                cube_before = snapshot_students(cube_students)
+                avg_gpa = cube_students.values_list('avg_gpa', flat=True).get()  # Maintained on the row; the instance may be stale
+                inputs = {
+                    'avg_gpa': avg_gpa,
+                    'finance_score': map_financial_status_to_score(student.financial_status),
+                    'complexity_level': map_complexity_to_numeric(map_complexity_to_fuzzy_set(student.course.complexity_level)),
+                }
+
+                risk_level, certainty = fis.score_one(inputs, exact=exact)
+                fingerprint, = compute_input_fingerprints(
+                    [avg_gpa], [inputs['finance_score']], [inputs['complexity_level']], fis.rule_version
+                )
 
-                AttritionAnalysisResult.objects.update_or_create(
+                _, created = AttritionAnalysisResult.objects.update_or_create(
                     student=student,
-                    defaults={'risk_level': risk_level, 'certainty_score': certainty}
+                    defaults={
+                        'risk_level': risk_level, 'certainty_score': certainty,
+                        'input_fingerprint': fingerprint, 'rule_version': fis.rule_version,
+                    }
                 )
-                print(f"Analysis for {student.first_name} complete. Risk: {risk_level}, Certainty: {certainty}%")
-
-            else:
-                # Batch analysis for all students
-                df = fetch_student_data()
-                for _, row in df.iterrows():
-                    student = Student.objects.get(id=row['student_id'])
-
-                    gpa = row['avg_gpa']
-                    finance_score = map_financial_status_to_score(row['financial_status'])
-                    complexity_level = row['complexity']
-
-                    risk_level, certainty = compute_risk_for_student(gpa, finance_score, complexity_level, fuzzy_sets)
-
-                    AttritionAnalysisResult.objects.update_or_create(
-                        student=student,
-                        defaults={'risk_level': risk_level, 'certainty_score': certainty}
-                    )
-                    print(f"Analysis for {student.first_name} complete. Risk: {risk_level}, Certainty: {certainty}%")
-
-    except Exception as e:
-        logger.error(f"Attrition analysis failed: {e}")
-        traceback.print_exc()  # Logs detailed error trace for debugging
+                patch_risk_cube(cube_before, snapshot_students(cube_students))
+
+            old_level = cube_before[student.pk][1] or 'none'
+            stats = {
+                'inserted': int(created),
+                'updated': int(not created),
+                'skipped': 0,
+                'transitions': {f'{old_level}->{risk_level}': 1} if old_level != risk_level else {},
+            }
+            logger.debug(f"Analysis for student {student.pk} complete. Risk: {risk_level}, Certainty: {certainty}%")
+            metrics.record_run('single', stats)
+            return stats
+
+        # Batch analysis for all students (or the given queryset)
+        if students is not None:
+            stats = analyse_cohort(students, chunk_size=chunk_size, incremental=incremental, exact=exact, progress=progress)
+        elif workers > 1:
+            stats = run_sharded_analysis(workers, chunk_size, incremental, exact, progress=progress)
+            for error in stats['errors']:
+                logger.error(f"Attrition analysis shard error: {error}")
+        else:
+            stats = analyse_cohort(chunk_size=chunk_size, incremental=incremental, exact=exact, progress=progress)
+        return stats
+
+    except Exception:
+        logger.exception("Attrition analysis failed")  # Logs the full traceback
+        metrics.inc('aisha_analysis_errors_total')
 
 """
 READ ME PLEASE, I AM AN OVERVIEW OF WHAT THIS CODE IS ALL ABOUT
@@ -238,16 +494,21 @@ and store the result along with a certainty score in the `AttritionAnalysisResul
 
 FLOW & FUNCTION SUMMARY:
 ------------------------
-1. **fetch_student_data()**
-   - Loads all students and calculates their average GPA.
-   - Also fetches course, faculty, financial status, and course complexity.
-
-2. **define_fuzzy_membership_functions()**
-   - Defines fuzzy sets (membership functions) for:
-     - GPA: low, medium, high
-     - Financial status: struggling, good, scholarship
-     - Complexity: easy, moderate, hard
-   - These sets are triangular functions defined using `skfuzzy`.
+1. **fetch_student_data(students=None) / iter_student_chunks(students=None, chunk_size)**
+   - Loads all students (or a queryset) and their maintained average GPA (Student.avg_gpa)
+     without joining academic records.
+   - Also fetches financial status and course complexity, returned as typed
+     NumPy columns (student_id, name, avg_gpa, finance_score, complexity_level).
+   - iter_student_chunks yields those columns one chunk at a time, each chunk a keyset
+     query on the student id, so batch runs never hold the whole cohort in memory.
+
+2. **RuleSet / get_compiled_fis(rule_version=None)**
+   - The fuzzy rules are data: a RuleSet row holds one immutable version of the
+     variables (GPA, financial status, complexity), their triangular or trapezoidal
+     fuzzy sets, one weighted rule per risk level and the borderline policy.
+     Version 1 is DEFAULT_RULE_SPEC in app/rules.py; new versions are loaded with
+     the load_rule_set command or the admin, and one version is active.
+   - get_compiled_fis returns the active (or given) version compiled once per process.
 
 3. **map_financial_status_to_score(status)**
    - Maps textual financial status to a numeric score usable by the FIS.
@@ -259,20 +520,54 @@ FLOW & FUNCTION SUMMARY:
    - Maps stored course complexity values (Simple, Moderate, Difficult)
      to fuzzy variable labels (easy, moderate, hard).
 
-6. **compute_risk_for_student(gpa, finance_score, complexity_level, fuzzy_sets)**
-   - Calculates degrees of membership for each input using `interp_membership`.
-   - Applies weighted rules to calculate High, Medium, and Low risk scores.
-   - Selects the risk category with the highest confidence score.
-   - If two values are close (borderline), applies adjusted logic for more nuance.
-   - Returns the most probable **risk level** and its **certainty percentage**.
-
-7. **run_attrition_analysis(student=None)**
+6. **CompiledRuleSet.score(columns, exact=False) / score_one(inputs, exact=False)** (app/rules.py)
+   - Each variable compiles to a table of its weighted contribution to the High,
+     Medium and Low rule scores, so scoring a cohort is one lookup and add per
+     variable (exact=True interpolates the memberships instead of rounding inputs).
+   - Selects the risk category with the highest score; if the two closest scores
+     are within the margin (borderline), the rule set's tie-break policy decides.
+   - Returns the **risk levels** and their **certainty percentages**; score_one does
+     the same for a single student.
+
+7. **compute_input_fingerprints(...) / select_changed_students(columns, fingerprints)**
+   - Hash each student's scoring inputs together with the rule version, so activating
+     a new version re-scores everyone on the next incremental run.
+   - Incremental runs only re-score students whose stored fingerprint differs
+     (looked up chunk by chunk).
+
+8. **persist_results(student_ids, risk_levels, certainties, fingerprints, rule_version, chunk_size)**
+   - Bulk upserts results with one INSERT ... ON CONFLICT (student) DO UPDATE per chunk,
+     each result tagged with the rule version that produced it.
+   - Each chunk is its own transaction; reports rows inserted and updated and the
+     risk level transitions (e.g. Low->High) it made.
+
+9. **analyse_cohort(...) / run_sharded_analysis(workers, ...)**
+   - analyse_cohort streams one cohort or queryset through fetch, score and persist a
+     chunk at a time; each chunk commits before the next is read, so memory stays flat
+     and a crash keeps every chunk already written.
+   - Whole-cohort runs are checkpointed as an AnalysisRun (app/checkpoints.py): the last
+     committed student id moves in each chunk's transaction, an interrupted run with the
+     same rule version resumes from there, and the run is marked Completed (consistent)
+     only once every chunk is in.
+   - run_sharded_analysis splits the cohort into student-id ranges and runs them
+     in a process pool; each shard has its own connection and transactions, and
+     failed shards are retried alone.
+
+    - After a run the risk cube (app/cube.py) is rebuilt, or patched with the
+      risk transitions when only some students were re-scored.
+    - Each phase (fetch, score, persist, cube) is timed and its queries counted;
+      app/metrics.py exposes these with the students and transitions on /metrics.
+
+10. **run_attrition_analysis(student=None, chunk_size=PERSIST_CHUNK_SIZE, incremental=False, exact=False, workers=1, students=None, progress=None)**
    - Main orchestrator function.
    - If a specific student is passed, analyzes that student only.
-   - Otherwise, runs analysis for all students.
+   - If a `students` queryset is passed, scores just those through the batch path.
+   - Otherwise, runs analysis for all students (streamed in vectorized chunks,
+     or sharded across `workers` processes).
+   - incremental=True skips students whose inputs have not changed.
    - Each result is saved or updated in the `AttritionAnalysisResult` table.
-   - Uses atomic transactions to ensure database integrity.
-   - Exceptions are logged for review.
+   - Uses atomic transactions (per chunk in batch mode) to ensure database integrity.
+   - Exceptions are logged with their traceback and counted as analysis errors.
 
 EXAMPLE:
 --------
@@ -286,12 +581,16 @@ A student with:
     - Finance → membership in "good"
     - Complexity → membership in "moderate"
     
-The FIS combines these using weighted rules to decide the likely **risk level**.
+The active rule set combines these using weighted rules to decide the likely **risk level**.
 
 USAGE NOTES:
 ------------
 - This logic supports both batch and individual student analysis.
 - The certainty score (e.g., 82%) helps identify borderline predictions.
+- What-if scenarios (app/simulations.py, the simulate_scenario command and /simulate/)
+  re-score a cohort in memory with the same evaluators and never write results.
+- backtest_rules (app/backtesting.py) checks a rule set against students' real outcomes
+  (Dropped Out / Graduated) and sweeps grids of spec values to tune it.
 - Designed to be extended — more features like attendance or mental health score
   could be added as new fuzzy input variables in the future.
 """
@@ -0,0 +1,266 @@
+"""
+Backtesting of fuzzy rule sets against real outcomes, and parameter sweeps to tune them.
+The history is every student whose enrollment_status is final (Dropped Out or Graduated), scored
+from their last recorded inputs. A student is predicted to drop out when their risk level is one
+of the flagged levels (High by default); precision, recall and confusion matrices follow, overall
+and per academic year.
+A sweep evaluates every combination of a grid of spec values (membership breakpoints, rule
+weights, the borderline margin) in a process pool. Combinations are first scored on a sample of
+the history and only the best fraction is evaluated on all of it (early pruning); combinations
+that are not valid rule sets (e.g. breakpoints out of order) are dropped before any scoring.
+"""
+import itertools
+import json
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.core.exceptions import ValidationError
+from django.db import connections
+
+from .annalysis import fetch_student_data
+from .models import Student
+from .rules import RISK_LEVELS, CompiledRuleSet, validate_spec
+
+OUTCOMES = (Student.GRADUATED, Student.DROPPED_OUT)  # Indexed by the dropped_out column
+OBJECTIVES = ('f1', 'precision', 'recall', 'accuracy')
+SWEEP_BATCH_SIZE = 32  # Combinations per pool task; consecutive ones share scores when only the borderline differs
+MIN_PRUNING_SAMPLE = 1000  # Histories whose sample would be smaller are evaluated in full, in one stage
+
+# -----------------------------------------
+# History and metrics
+# -----------------------------------------
+
+def load_history(students=None):
+    """
+    Rule inputs (the columns of fetch_student_data) of the students with a final outcome, plus
+    their 'dropped_out' (bool) and 'academic_year' columns.
+    """
+    if students is None:
+        students = Student.objects.all()
+    students = students.filter(enrollment_status__in=OUTCOMES)
+    history = fetch_student_data(students)
+    outcomes = list(students.order_by('id').values_list('enrollment_status', 'academic_year'))
+    history['dropped_out'] = np.array([status == Student.DROPPED_OUT for status, _ in outcomes], dtype=bool)
+    history['academic_year'] = np.array([year for _, year in outcomes], dtype=np.int64)
+    return history
+
+def _subset(history, index):
+    return {name: column[index] for name, column in history.items()}
+
+def evaluate(risk_index, dropped_out, flagged=('High',)):
+    """
+    Compares risk levels (indices into RISK_LEVELS) with outcomes. Returns the risk level x outcome
+    counts and, reading a flagged level as a dropout prediction, the confusion matrix, precision,
+    recall, F1 and accuracy.
+    """
+    levels = len(RISK_LEVELS)
+    by_level = np.bincount(risk_index.astype(np.intp) * 2 + dropped_out, minlength=levels * 2).reshape(levels, 2)
+    is_flagged = np.isin(RISK_LEVELS, flagged)
+    true_negative, false_negative = by_level[~is_flagged].sum(axis=0).tolist()
+    false_positive, true_positive = by_level[is_flagged].sum(axis=0).tolist()
+
+    students = true_positive + false_positive + false_negative + true_negative
+    precision = true_positive / (true_positive + false_positive) if true_positive + false_positive else 0.0
+    recall = true_positive / (true_positive + false_negative) if true_positive + false_negative else 0.0
+    return {
+        'students': students,
+        'by_risk_level': {level: dict(zip(OUTCOMES, by_level[i].tolist())) for i, level in enumerate(RISK_LEVELS)},
+        'confusion': {
+            'true_positive': true_positive,
+            'false_positive': false_positive,
+            'false_negative': false_negative,
+            'true_negative': true_negative,
+        },
+        'precision': round(precision, 4),
+        'recall': round(recall, 4),
+        'f1': round(2 * precision * recall / (precision + recall), 4) if precision + recall else 0.0,
+        'accuracy': round((true_positive + true_negative) / students, 4) if students else 0.0,
+    }
+
+def backtest(rule_set, history, flagged=('High',), exact=False):
+    """
+    Scores the history with a compiled rule set; returns evaluate()'s metrics overall plus
+    precision and recall for each academic year's cohort.
+    """
+    risk_index, _ = rule_set.rank_indices(rule_set.risk_scores(history, exact))
+    report = evaluate(risk_index, history['dropped_out'], flagged)
+    report['by_year'] = {}
+    for year in np.unique(history['academic_year']).tolist():
+        in_year = history['academic_year'] == year
+        metrics = evaluate(risk_index[in_year], history['dropped_out'][in_year], flagged)
+        report['by_year'][year] = {name: metrics[name] for name in ('students', 'precision', 'recall', 'f1')}
+    return report
+
+# -----------------------------------------
+# Parameter grids
+# -----------------------------------------
+
+def parse_grid(params):
+    """
+    Turns 'path=v1,v2,...' strings into a {path: [values]} grid. Paths are dotted keys into a
+    rule spec, e.g. variables.gpa.sets.low.points.2, rules.High.gpa.weight or borderline.margin
+    (in a rule's term list a variable name picks that variable's term). Values are parsed as
+    JSON where possible, so numbers stay numbers.
+    """
+    grid = {}
+    for param in params:
+        path, separator, values = param.partition('=')
+        if not separator or not path or not values:
+            raise ValidationError(f"'{param}' must look like path=value1,value2.")
+        grid[path.strip()] = [_parse_value(value.strip()) for value in values.split(',')]
+    return grid
+
+def _parse_value(value):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+def set_path(spec, path, value):
+    """
+    Sets the value at a dotted path of a spec in place; raises ValidationError if the path does not exist.
+    """
+    *parents, last = path.split('.')
+    target = spec
+    try:
+        for key in parents:
+            target = _child(target, key)
+        if isinstance(target, list):
+            target[_list_index(target, last)] = value
+        elif last in target:
+            target[last] = value
+        else:
+            raise KeyError(last)
+    except (KeyError, IndexError, TypeError, ValueError):
+        raise ValidationError(f"No such parameter in the rule spec: {path}")
+
+def _child(node, key):
+    return node[_list_index(node, key)] if isinstance(node, list) else node[key]
+
+def _list_index(items, key):
+    if key.isdigit():
+        if int(key) >= len(items):
+            raise IndexError(key)
+        return int(key)
+    matches = [i for i, item in enumerate(items) if isinstance(item, dict) and item.get('variable') == key]
+    if len(matches) != 1:
+        raise KeyError(key)
+    return matches[0]
+
+def expand_grid(base_spec, grid):
+    """
+    Every combination of the grid's values applied to a copy of base_spec, as (params, spec) pairs.
+    Borderline parameters vary fastest, so runs of consecutive specs differ only in the borderline
+    policy and can share one set of rule scores.
+    """
+    base_json = json.dumps(base_spec)  # Specs are plain JSON; a round trip is a cheap deep copy
+    for path in grid:
+        set_path(json.loads(base_json), path, grid[path][0])  # Fail on a bad path before expanding
+    paths = sorted(grid, key=lambda path: path.startswith('borderline.'))
+    for values in itertools.product(*(grid[path] for path in paths)):
+        spec = json.loads(base_json)
+        for path, value in zip(paths, values):
+            set_path(spec, path, value)
+        yield dict(zip(paths, values)), spec
+
+# -----------------------------------------
+# Sweeps
+# -----------------------------------------
+
+# The histories being swept ('sample' and 'full'). Set by the parent before the pool forks, so
+# workers inherit the arrays instead of receiving a copy with every task.
+_histories = {}
+
+def _evaluate_batch(batch, stage, flagged, exact):
+    """
+    Pool task: evaluates (number, spec) pairs on one of the sweep's histories. Returns (number,
+    metrics) pairs, with None as the metrics of specs that are not valid rule sets.
+    """
+    history = _histories[stage]
+    results = []
+    compiled_key = compiled = scores = None
+    for number, spec in batch:
+        try:
+            validate_spec(spec)
+        except ValidationError:
+            results.append((number, None))
+            continue
+        # Neither the compiled tables nor the rule scores depend on the borderline policy;
+        # reuse them while only it changes
+        key = json.dumps({name: value for name, value in spec.items() if name != 'borderline'}, sort_keys=True)
+        if key != compiled_key:
+            compiled_key, compiled = key, CompiledRuleSet(0, spec)
+            scores = compiled.risk_scores(history, exact)
+        risk_index, _ = compiled.with_borderline(spec['borderline']).rank_indices(scores)
+        results.append((number, evaluate(risk_index, history['dropped_out'], flagged)))
+    return results
+
+def _run_stage(specs, stage, flagged, exact, workers):
+    batches = [specs[start:start + SWEEP_BATCH_SIZE] for start in range(0, len(specs), SWEEP_BATCH_SIZE)]
+    if workers <= 1 or len(batches) <= 1:
+        return dict(result for batch in batches for result in _evaluate_batch(batch, stage, flagged, exact))
+
+    # Workers are forked and never use the database; they must not inherit the parent's connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+        futures = [pool.submit(_evaluate_batch, batch, stage, flagged, exact) for batch in batches]
+        return dict(result for future in futures for result in future.result())
+
+def _ranking_key(objective):
+    return lambda metrics: (metrics[objective], metrics['f1'], metrics['recall'])
+
+def sweep(base_spec, grid, history, objective='f1', flagged=('High',), exact=False, workers=None, sample=0.2, keep=0.25, seed=42):
+    """
+    Evaluates every combination of `grid` (see parse_grid) applied to base_spec against the history.
+    With sample < 1 and a large enough history, combinations are first scored on a random `sample`
+    fraction of it and only the best `keep` fraction by `objective` is scored on the whole history.
+    Returns counts of combinations evaluated, invalid and pruned, and the fully evaluated results
+    ranked by `objective`, each with its parameter values.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective must be one of {', '.join(OBJECTIVES)}")
+    workers = workers or os.cpu_count() or 1
+    combinations = list(expand_grid(base_spec, grid))
+    specs = [(number, spec) for number, (_, spec) in enumerate(combinations)]
+    students = len(history['dropped_out'])
+    sample_size = int(students * sample)
+
+    _histories.clear()
+    _histories['full'] = history
+    invalid = pruned = 0
+    screened_on = None  # Students in the pruning sample, if combinations were screened
+    try:
+        if 0 < sample < 1 and keep < 1 and sample_size >= MIN_PRUNING_SAMPLE:
+            screened_on = sample_size
+            index = np.sort(np.random.default_rng(seed).choice(students, sample_size, replace=False))
+            _histories['sample'] = _subset(history, index)
+            screened = _run_stage(specs, 'sample', flagged, exact, workers)
+            valid = sorted(
+                (number for number, metrics in screened.items() if metrics),
+                key=lambda number: _ranking_key(objective)(screened[number]), reverse=True,
+            )
+            invalid = len(specs) - len(valid)
+            survivors = sorted(valid[:max(1, math.ceil(len(valid) * keep))])
+            pruned = len(valid) - len(survivors)
+            specs = [specs[number] for number in survivors]
+        results = _run_stage(specs, 'full', flagged, exact, workers)
+    finally:
+        _histories.clear()
+
+    invalid += sum(1 for metrics in results.values() if metrics is None)
+    ranked = sorted(
+        ({'number': number, 'params': combinations[number][0], **metrics} for number, metrics in results.items() if metrics),
+        key=_ranking_key(objective), reverse=True,
+    )
+    return {
+        'combinations': len(combinations),
+        'invalid': invalid,
+        'pruned': pruned,
+        'screened_on': screened_on,
+        'objective': objective,
+        'results': ranked,
+        'best_spec': combinations[ranked[0]['number']][1] if ranked else None,
+    }
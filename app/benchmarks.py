@@ -0,0 +1,380 @@
+"""
+Reproducible benchmarks for the analysis pipeline (used by the benchmark_analysis command).
+A seeded synthetic institution (faculties, courses, students, academic records) is generated into
+an empty database, then run_attrition_analysis is timed in each mode. Every run reports wall time
+per phase (fetch, score, persist, cube), query count, peak RSS and students/sec, so a JSON report
+can be compared against a baseline from an earlier commit.
+measure_startup() times a web worker's boot in a fresh interpreter (used by benchmark_startup).
+"""
+import contextlib
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import django
+import psutil
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from .aggregates import refresh_gpa_aggregates
+from .annalysis import run_attrition_analysis
+from .cube import rebuild_risk_cube
+from .models import Faculty, Course, Student, AcademicRecord, AttritionAnalysisResult
+
+GENERATE_CHUNK_SIZE = 5000
+
+DEFAULT_CONFIG = {
+    'faculties': 5,
+    'courses_per_faculty': 8,
+    'students': 10000,
+    'records_per_student': 3,
+    'seed': 42,
+    'single_sample': 500,  # Students timed one by one in the 'single' mode
+    'workers': 4,
+    'changed_fraction': 0.1,  # Share of students whose GPA changes before 'incremental_changed'
+}
+
+# -----------------------------------------
+# Synthetic data
+# -----------------------------------------
+
+def generate_institution(faculties, courses_per_faculty, students, records_per_student, seed=42, **_):
+    """
+    Fills an empty database with a synthetic institution. The same arguments always produce the
+    same data. Student.gpa is the current-year record, as the Student signal would have made it.
+    Returns the number of rows created per model.
+    """
+    rng = random.Random(seed)
+    current_year = datetime.datetime.now().year
+    complexities = [level for level, _ in Course.COMPLEXITY_CHOICES]
+    finances = [status for status, _ in Student.FINANCIAL_STATUS_CHOICES]
+    enrollments = [status for status, _ in Student.ENROLLMENT_STATUS_CHOICES]
+
+    faculty_rows = Faculty.objects.bulk_create([Faculty(name=f'Faculty {i + 1}') for i in range(faculties)])
+    course_rows = Course.objects.bulk_create([
+        Course(name=f'Course {f + 1}.{c + 1}', faculty=faculty, complexity_level=rng.choice(complexities))
+        for f, faculty in enumerate(faculty_rows)
+        for c in range(courses_per_faculty)
+    ])
+
+    for start in range(0, students, GENERATE_CHUNK_SIZE):
+        batch, gpas = [], []
+        for _ in range(min(GENERATE_CHUNK_SIZE, students - start)):
+            course = rng.choice(course_rows)
+            base_gpa = rng.uniform(0.5, 5.0)
+            history = [round(min(5.0, max(0.0, base_gpa + rng.gauss(0, 0.4))), 2) for _ in range(records_per_student)]
+            gpas.append(history)
+            batch.append(Student(
+                first_name=f'Student{start + len(batch) + 1}',
+                last_name='Synthetic',
+                age=rng.randint(17, 35),
+                gender=rng.choice((Student.MALE, Student.FEMALE)),
+                faculty_id=course.faculty_id,
+                course=course,
+                academic_year=rng.randint(1, 4),
+                financial_status=rng.choices(finances, weights=(6, 3, 1))[0],
+                enrollment_status=rng.choices(enrollments, weights=(8, 1, 1))[0],
+                gpa=history[0] if history else 1.0,
+            ))
+        Student.objects.bulk_create(batch)
+        AcademicRecord.objects.bulk_create([
+            AcademicRecord(student=student, gpa=gpa, year=current_year - k)
+            for student, history in zip(batch, gpas)
+            for k, gpa in enumerate(history)
+        ], batch_size=GENERATE_CHUNK_SIZE)
+
+    refresh_gpa_aggregates()
+    rebuild_risk_cube()
+    return {
+        'faculties': len(faculty_rows),
+        'courses': len(course_rows),
+        'students': Student.objects.count(),
+        'academic_records': AcademicRecord.objects.count(),
+    }
+
+# -----------------------------------------
+# Measuring one run
+# -----------------------------------------
+
+class PhaseTimer:
+    """
+    A progress(phase, processed, total) callback that accumulates wall time per phase.
+    """
+    def __init__(self):
+        self.phases = {}
+        self._phase = None
+        self._started = None
+
+    def __call__(self, phase, processed, total):
+        if phase != self._phase:
+            self._switch(phase)
+
+    def _switch(self, phase):
+        now = time.perf_counter()
+        if self._phase is not None:
+            self.phases[self._phase] = self.phases.get(self._phase, 0.0) + now - self._started
+        self._phase, self._started = phase, now
+
+    def stop(self):
+        self._switch(None)
+        return {phase: round(seconds, 4) for phase, seconds in self.phases.items()}
+
+
+class PeakRSS:
+    """
+    Samples the resident memory of this process and its children (shard workers) in a
+    background thread while the block runs; `peak` is the highest total seen and `start` the
+    total when the block began, in bytes.
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self.start = 0
+        self._process = psutil.Process(os.getpid())
+        self._stop = threading.Event()
+
+    def _sample(self):
+        rss = self._process.memory_info().rss
+        for child in self._process.children(recursive=True):
+            with contextlib.suppress(psutil.Error):
+                rss += child.memory_info().rss
+        self.peak = max(self.peak, rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self.start = self.peak
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+# -----------------------------------------
+# Modes: each is (prepare, run). prepare(config) sets up the database and is not timed;
+# run(config, prepared, progress) is timed and returns how many students it covered and re-scored.
+# -----------------------------------------
+
+def _clear_results(config):
+    # A raw DELETE: queryset.delete() would send post_delete (and a cache bump) for every row
+    AttritionAnalysisResult.objects.all()._raw_delete(connection.alias)
+    rebuild_risk_cube()
+
+
+def _ensure_results(config):
+    if AttritionAnalysisResult.objects.count() != Student.objects.count():
+        run_attrition_analysis()
+
+
+def _change_some_gpas(config):
+    # Moves the current-year GPA of a seeded sample of students, as a term's grade upload would
+    _ensure_results(config)
+    ids = list(Student.objects.order_by('id').values_list('id', flat=True))
+    sample = random.Random(config['seed']).sample(ids, int(len(ids) * config['changed_fraction']))
+    records = AcademicRecord.objects.filter(student_id__in=sample, year=datetime.datetime.now().year)
+    for record in records:
+        record.gpa = round(min(5.0, record.gpa + 0.25), 2)
+    AcademicRecord.objects.bulk_update(records, ['gpa'], batch_size=GENERATE_CHUNK_SIZE)
+    refresh_gpa_aggregates(Student.objects.filter(id__in=sample))
+
+
+def _single_students(config):
+    _clear_results(config)
+    return list(Student.objects.select_related('course').order_by('id')[:config['single_sample']])
+
+
+def _run_single(config, students, progress):
+    for student in students:
+        if run_attrition_analysis(student) is None:
+            raise RuntimeError(f"Analysis failed for student {student.pk}")
+    return {'students': len(students), 'scored': len(students)}
+
+
+def _batch_run(**options):
+    def run(config, prepared, progress):
+        return _analyse_all(progress, **options)
+    return run
+
+
+def _run_sharded(config, prepared, progress):
+    return _analyse_all(progress, workers=config['workers'])
+
+
+def _analyse_all(progress, **options):
+    stats = run_attrition_analysis(progress=progress, **options)
+    if stats is None:
+        raise RuntimeError("Analysis failed; see the log for the traceback")
+    if stats.get('failed_shards'):
+        raise RuntimeError('; '.join(stats['errors']))
+    scored = stats['inserted'] + stats['updated']
+    return {'students': scored + stats['skipped'], 'scored': scored}
+
+
+BENCHMARK_MODES = {
+    'single': (_single_students, _run_single),
+    'batch': (_clear_results, _batch_run()),
+    'batch_exact': (_clear_results, _batch_run(exact=True)),
+    'incremental_unchanged': (_ensure_results, _batch_run(incremental=True)),
+    'incremental_changed': (_change_some_gpas, _batch_run(incremental=True)),
+    'sharded': (_clear_results, _run_sharded),
+}
+
+
+def run_mode(name, config):
+    """
+    Prepares and times one mode. Returns its measurements as a JSON-serialisable dict.
+    """
+    prepare, run = BENCHMARK_MODES[name]
+    prepared = prepare(config)
+    gc.collect()
+
+    timer = PhaseTimer()
+    error = None
+    counts = {'students': 0, 'scored': 0}
+    with PeakRSS() as memory, CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        try:
+            counts = run(config, prepared, timer)
+        except Exception as e:
+            error = str(e)
+        wall = time.perf_counter() - started
+    phases = timer.stop()
+
+    return {
+        'mode': name,
+        **counts,  # students covered (incremental runs skip most of them) and students re-scored
+        'wall_seconds': round(wall, 4),
+        'phases': phases,
+        'queries': len(queries),  # Parent process only; shard workers use their own connections
+        'peak_rss_mb': round(memory.peak / 2 ** 20, 1),
+        'rss_growth_mb': round((memory.peak - memory.start) / 2 ** 20, 1),  # Flat across cohort sizes when streaming
+        'students_per_sec': round(counts['students'] / wall, 1) if wall else 0.0,
+        'error': error,
+    }
+
+
+def run_benchmarks(config, modes=None):
+    """
+    Times every requested mode (default: all) against the data already in the database.
+    Returns the full report: configuration, environment and one entry per mode.
+    """
+    return {
+        'config': config,
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'cpus': os.cpu_count(),
+            'platform': platform.platform(),
+        },
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'runs': [run_mode(name, config) for name in (modes or BENCHMARK_MODES)],
+    }
+
+
+def compare_reports(report, baseline):
+    """
+    Lines comparing each mode's wall time and throughput with the same mode in a baseline report.
+    """
+    previous = {run['mode']: run for run in baseline.get('runs', [])}
+    lines = []
+    for run in report['runs']:
+        before = previous.get(run['mode'])
+        if not before or not before['wall_seconds'] or run['error'] or before.get('error'):
+            continue
+        change = (run['wall_seconds'] - before['wall_seconds']) / before['wall_seconds'] * 100
+        lines.append(
+            f"{run['mode']}: {before['wall_seconds']:.3f}s -> {run['wall_seconds']:.3f}s ({change:+.1f}%), "
+            f"{before['students_per_sec']:,.0f} -> {run['students_per_sec']:,.0f} students/sec, "
+            f"{before['queries']} -> {run['queries']} queries"
+        )
+    return lines
+
+# -----------------------------------------
+# Web worker startup: each sample boots a fresh interpreter the way gunicorn does
+# (settings, apps, WSGI handler, URLconf and views) and reports its import time and RSS.
+# -----------------------------------------
+
+# Libraries that only the analysis stack needs; a web worker should never load them
+HEAVY_MODULES = ('numpy', 'scipy', 'skfuzzy', 'pandas', 'matplotlib', 'seaborn')
+
+STARTUP_PROFILES = {
+    'web': '',  # What every gunicorn worker pays
+    'web_with_analysis': 'import app.annalysis',  # What it paid before the analysis imports were made lazy
+}
+
+_STARTUP_SCRIPT = """
+import json, os, sys, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'aisha.settings')
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns  # Imports the views, as the first request would
+{extra}
+seconds = time.perf_counter() - started
+import psutil
+print(json.dumps({{
+    'seconds': seconds,
+    'rss': psutil.Process().memory_info().rss,
+    'modules': len(sys.modules),
+    'heavy_modules': sorted(name for name in {heavy!r} if name in sys.modules),
+}}))
+"""
+
+
+def _boot_worker(profile, importtime=False):
+    script = _STARTUP_SCRIPT.format(extra=STARTUP_PROFILES[profile], heavy=HEAVY_MODULES)
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', script]
+    process = subprocess.run(command, cwd=settings.BASE_DIR, capture_output=True, text=True, check=True)
+    return json.loads(process.stdout.strip().splitlines()[-1]), process.stderr
+
+
+def slowest_imports(importtime_log, limit=10):
+    """
+    Top-level packages from a `python -X importtime` log, by cumulative import time (seconds).
+    """
+    packages = []
+    for line in importtime_log.splitlines():
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2][1:]
+        if not name.startswith(' '):  # Nested imports are indented under their parent
+            packages.append((name, int(parts[1]) / 10 ** 6))
+    return [{'module': name, 'seconds': round(seconds, 4)} for name, seconds in sorted(packages, key=lambda p: -p[1])[:limit]]
+
+
+def measure_startup(profiles=None, runs=5):
+    """
+    Boots `runs` fresh workers per profile (default: all) and reports the median import time and
+    RSS, the modules loaded, any HEAVY_MODULES among them and the slowest top-level imports.
+    """
+    report = {}
+    for profile in profiles or STARTUP_PROFILES:
+        samples = [_boot_worker(profile)[0] for _ in range(runs)]
+        sample, log = _boot_worker(profile, importtime=True)
+        report[profile] = {
+            'runs': runs,
+            'import_seconds': round(statistics.median(s['seconds'] for s in samples), 4),
+            'rss_mb': round(statistics.median(s['rss'] for s in samples) / 2 ** 20, 1),
+            'modules': sample['modules'],
+            'heavy_modules': sample['heavy_modules'],
+            'slowest_imports': slowest_imports(log),
+        }
+    return report
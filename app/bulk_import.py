@@ -0,0 +1,178 @@
+"""
+Bulk loading of registrar files (CSV or JSON Lines) into Student and AcademicRecord.
+Rows are streamed in chunks and written with bulk_create, which skips the per-row post_save
+signals: new students are added to the risk cube here, and the caller runs one batch analysis
+for the affected students afterwards.
+"""
+import csv
+import datetime
+import json
+from itertools import islice
+
+from django.db import transaction
+
+from .aggregates import refresh_gpa_aggregates
+from .cube import add_students_to_cube
+from .models import Faculty, Course, Student, AcademicRecord
+
+IMPORT_CHUNK_SIZE = 5000
+
+# -----------------------------------------
+# Reading input files
+# -----------------------------------------
+
+def read_rows(path, file_format=None):
+    """
+    Streams rows from a CSV (with header) or JSON Lines file as (line_number, dict) pairs.
+    The format is taken from the file extension unless given explicitly.
+    """
+    file_format = file_format or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as handle:
+        if file_format == 'csv':
+            for line_number, row in enumerate(csv.DictReader(handle), start=2):
+                yield line_number, row
+        else:
+            for line_number, line in enumerate(handle, start=1):
+                if line.strip():
+                    yield line_number, json.loads(line)
+
+def chunked(rows, size):
+    """
+    Groups an iterator into lists of at most `size` items.
+    """
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+def _choice(value, choices, field):
+    value = (value or '').strip()
+    for stored, label in choices:
+        if value.lower() in (stored.lower(), label.lower()):
+            return stored
+    raise ValueError(f"invalid {field} '{value}'")
+
+def _required(row, field):
+    value = row.get(field)
+    if value is None or str(value).strip() == '':
+        raise ValueError(f"missing {field}")
+    return str(value).strip()
+
+# -----------------------------------------
+# Students
+# -----------------------------------------
+
+def import_students(rows, chunk_size=IMPORT_CHUNK_SIZE, dry_run=False):
+    """
+    Validates and bulk inserts students, plus the initial current-year AcademicRecord the
+    Student post_save signal would have created. Faculty and course names are resolved
+    through in-memory name -> id maps loaded once.
+    Returns a dict with rows read, rows created, the errors found and the new student ids.
+    """
+    faculty_ids = dict(Faculty.objects.values_list('name', 'id'))
+    course_ids = {
+        (faculty_id, name): course_id
+        for course_id, name, faculty_id in Course.objects.values_list('id', 'name', 'faculty_id')
+    }
+    current_year = datetime.datetime.now().year
+    stats = {'read': 0, 'created': 0, 'errors': [], 'student_ids': []}
+
+    for chunk in chunked(rows, chunk_size):
+        students = []
+        for line_number, row in chunk:
+            stats['read'] += 1
+            try:
+                faculty_id = faculty_ids.get(_required(row, 'faculty'))
+                if faculty_id is None:
+                    raise ValueError(f"unknown faculty '{row['faculty']}'")
+                course_id = course_ids.get((faculty_id, _required(row, 'course')))
+                if course_id is None:
+                    raise ValueError(f"unknown course '{row['course']}' in faculty '{row['faculty']}'")
+
+                gpa = float(row.get('gpa') or 1.0)
+                students.append(Student(
+                    first_name=_required(row, 'first_name'),
+                    last_name=_required(row, 'last_name'),
+                    age=int(_required(row, 'age')),
+                    gender=_choice(row.get('gender'), Student.GENDER_CHOICES, 'gender'),
+                    faculty_id=faculty_id,
+                    course_id=course_id,
+                    academic_year=int(_required(row, 'academic_year')),
+                    financial_status=_choice(row.get('financial_status') or Student.GOOD, Student.FINANCIAL_STATUS_CHOICES, 'financial_status'),
+                    enrollment_status=_choice(row.get('enrollment_status') or Student.ACTIVE, Student.ENROLLMENT_STATUS_CHOICES, 'enrollment_status'),
+                    gpa=gpa,
+                    avg_gpa=gpa,  # Aggregates over the single initial record created below
+                    record_count=1,
+                ))
+            except (ValueError, TypeError) as e:
+                stats['errors'].append(f"line {line_number}: {e}")
+
+        if dry_run or not students:
+            continue
+
+        with transaction.atomic():
+            Student.objects.bulk_create(students)
+            AcademicRecord.objects.bulk_create([
+                AcademicRecord(student_id=student.id, gpa=student.gpa, year=current_year, notes='Initial record from student import')
+                for student in students
+            ])
+            # Counted in the risk cube as not analysed, as the post_save signal would have done
+            add_students_to_cube(students)
+        stats['created'] += len(students)
+        stats['student_ids'].extend(student.id for student in students)
+
+    return stats
+
+# -----------------------------------------
+# Academic records
+# -----------------------------------------
+
+def import_records(rows, chunk_size=IMPORT_CHUNK_SIZE, dry_run=False):
+    """
+    Validates and bulk inserts academic records keyed by student_id.
+    Student ids are checked with one query per chunk. A record for a (student, year) that already
+    exists replaces its GPA and notes, and within a file the last row for a (student, year) wins.
+    Returns a dict with rows read, rows created, the errors found and the affected student ids.
+    """
+    stats = {'read': 0, 'created': 0, 'errors': [], 'student_ids': []}
+
+    for chunk in chunked(rows, chunk_size):
+        parsed = []
+        for line_number, row in chunk:
+            stats['read'] += 1
+            try:
+                parsed.append((line_number, AcademicRecord(
+                    student_id=int(_required(row, 'student_id')),
+                    gpa=float(_required(row, 'gpa')),
+                    year=int(_required(row, 'year')),
+                    notes=(row.get('notes') or '').strip(),
+                )))
+            except (ValueError, TypeError) as e:
+                stats['errors'].append(f"line {line_number}: {e}")
+
+        known_ids = set(
+            Student.objects.filter(id__in={record.student_id for _, record in parsed}).values_list('id', flat=True)
+        )
+        records = {}
+        for line_number, record in parsed:
+            if record.student_id in known_ids:
+                records[(record.student_id, record.year)] = record
+            else:
+                stats['errors'].append(f"line {line_number}: unknown student_id {record.student_id}")
+
+        if dry_run or not records:
+            continue
+
+        records = list(records.values())
+        with transaction.atomic():
+            AcademicRecord.objects.bulk_create(
+                records,
+                update_conflicts=True,
+                unique_fields=['student', 'year'],
+                update_fields=['gpa', 'notes'],
+            )
+            # Bulk writes send no signals, so refresh the students' GPA aggregates here
+            refresh_gpa_aggregates(Student.objects.filter(id__in={record.student_id for record in records}))
+        stats['created'] += len(records)
+        stats['student_ids'].extend({record.student_id for record in records})
+
+    return stats
@@ -0,0 +1,40 @@
+"""
+Cache backend for the counters shared by every process on a node: the data version
+(app/caching.py) and the request and analysis metrics (app/metrics.py).
+Django's FileBasedCache implements incr as a read followed by a write, so two processes
+incrementing at once lose one of the increments, and it culls random entries once MAX_ENTRIES
+is reached. This subclass serialises incr/decr/add with an exclusive lock on a file in the
+cache directory and never culls. Reads stay lock-free: every write replaces its file atomically.
+"""
+import contextlib
+import os
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+
+LOCK_FILE = 'counters.lock'  # Not a .djcache file, so clear() leaves it alone
+
+
+class CounterFileBasedCache(FileBasedCache):
+
+    @contextlib.contextmanager
+    def _locked(self):
+        self._createdir()
+        with open(os.path.join(self._dir, LOCK_FILE), 'ab') as f:
+            locks.lock(f, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(f)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._locked():
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        with self._locked():
+            return super().incr(key, delta, version)
+
+    def _cull(self):
+        pass  # Counters are few (bounded by the metric label sets) and must never be dropped
@@ -0,0 +1,99 @@
+"""
+Versioned caching for the dashboard and results views.
+Every cache key embeds a data-version counter that analysis runs and model signals bump whenever
+students, records or results change. A bump makes all older entries unreachable at once, so a
+stale entry is never served and no TTL has to be guessed; old entries simply age out.
+Cached data works with any Django cache backend shared by the processes involved (file-based for
+a single node with several workers, local-memory for a single process). The data version and the
+hit/miss counters live in the 'counters' cache, whose increments are atomic across processes and
+whose entries are never evicted, so concurrent bumps can't collapse into one.
+"""
+import hashlib
+import json
+import time
+
+from django.core.cache import cache, caches
+from django.utils.connection import ConnectionProxy
+
+DATA_VERSION_KEY = 'attrition:data_version'
+HITS_KEY = 'attrition:cache_hits'
+MISSES_KEY = 'attrition:cache_misses'
+
+counters = ConnectionProxy(caches, 'counters')
+
+
+def get_data_version():
+    """
+    Returns the current data version, initialising it if the backend lost it.
+    The initial value is time-based so a lost counter never comes back at an old version.
+    """
+    version = counters.get(DATA_VERSION_KEY)
+    if version is None:
+        counters.add(DATA_VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = counters.get(DATA_VERSION_KEY)
+    return version
+
+
+def bump_data_version():
+    """
+    Invalidates every cached view by moving to a new data version.
+    Call it once the changes are committed: a request reading the old rows in between would
+    cache them under the new version. Inside a transaction, use transaction.on_commit.
+    """
+    try:
+        return counters.incr(DATA_VERSION_KEY)
+    except ValueError:  # Key missing: start a fresh, never-used version
+        get_data_version()
+        return counters.incr(DATA_VERSION_KEY)
+
+
+def _count(key):
+    try:
+        counters.incr(key)
+    except ValueError:
+        counters.add(key, 0, timeout=None)
+        counters.incr(key)
+
+
+def _params_digest(params):
+    return hashlib.md5(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def cached_data(name, params, compute):
+    """
+    Returns compute() for (name, params) at the current data version, from the cache when possible.
+    `params` must be JSON-serialisable (e.g. the view's filters).
+    """
+    key = f"attrition:{name}:{get_data_version()}:{_params_digest(params)}"
+
+    value = cache.get(key)
+    if value is not None:
+        _count(HITS_KEY)
+        return value
+
+    _count(MISSES_KEY)
+    value = compute()
+    cache.set(key, value)
+    return value
+
+
+def data_etag(name, params):
+    """
+    ETag for the data cached_data would return for (name, params): it changes exactly when the
+    data version or the parameters do, so clients can revalidate without the data being rebuilt.
+    """
+    return hashlib.md5(f"{name}:{get_data_version()}:{_params_digest(params)}".encode()).hexdigest()
+
+
+def cache_stats():
+    """
+    Hit/miss counters for cached_data, shared by all processes using the cache.
+    """
+    hits = counters.get(HITS_KEY) or 0
+    misses = counters.get(MISSES_KEY) or 0
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else None,
+        'data_version': get_data_version(),
+    }
@@ -0,0 +1,96 @@
+"""
+Checkpoints for batch analysis runs over the whole cohort (AnalysisRun).
+Each committed chunk moves the run's cursor (last_student_id) in the same transaction as its results,
+so an interrupted run resumes after its last committed chunk and loses at most the chunk in flight.
+"""
+import datetime
+import logging
+
+from django.db import DatabaseError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import AnalysisRun
+
+logger = logging.getLogger(__name__)
+
+RUN_STALE_AFTER = datetime.timedelta(minutes=5)  # A Running run without a checkpoint for this long is presumed dead
+
+# Counters carried over when a run resumes; phase timings belong to each attempt
+RUN_STATS = ('inserted', 'updated', 'skipped', 'transitions')
+
+# -----------------------------------------
+# Starting and resuming
+# -----------------------------------------
+
+def start_run(rule_version, incremental=False, exact=False, resume=True):
+    """
+    Returns the run to carry on with: the latest resumable run with the same rule version and options
+    (interrupted, or left Running by a process that died), or a new run. With resume=False a new run
+    is always started. Any other unfinished run is marked Abandoned, since its results are superseded.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        unfinished = AnalysisRun.objects.select_for_update().filter(
+            Q(status=AnalysisRun.INTERRUPTED) | Q(status=AnalysisRun.RUNNING, updated_at__lt=now - RUN_STALE_AFTER)
+        )
+        run = None
+        if resume:
+            run = unfinished.filter(rule_version=rule_version, incremental=incremental, exact=exact).order_by('-started_at').first()
+        unfinished.exclude(pk=run.pk if run else None).update(status=AnalysisRun.ABANDONED, finished_at=now)
+
+        if run is None:
+            return AnalysisRun.objects.create(rule_version=rule_version, incremental=incremental, exact=exact)
+        run.status = AnalysisRun.RUNNING
+        run.attempts += 1
+        run.error = ''
+        run.save(update_fields=['status', 'attempts', 'error', 'updated_at'])
+
+    logger.info(f"Resuming analysis run #{run.pk} after student {run.last_student_id} ({run.chunks_committed} chunks committed)")
+    return run
+
+def carried_stats(run):
+    """
+    The counters a resumed run starts from (zeros for a new run).
+    """
+    stats = {'inserted': 0, 'updated': 0, 'skipped': 0, 'transitions': {}}
+    stats.update({key: run.stats[key] for key in RUN_STATS if key in run.stats})
+    stats['transitions'] = dict(stats['transitions'])
+    return stats
+
+# -----------------------------------------
+# Checkpointing and finishing
+# -----------------------------------------
+
+def checkpoint(run, last_student_id, stats):
+    """
+    Moves the cursor past a chunk. Call inside the chunk's transaction, so the cursor never runs ahead
+    of the results it vouches for.
+    """
+    AnalysisRun.objects.filter(pk=run.pk).update(
+        last_student_id=last_student_id,
+        chunks_committed=F('chunks_committed') + 1,
+        stats={key: stats[key] for key in RUN_STATS},
+        updated_at=timezone.now(),
+    )
+    run.last_student_id = last_student_id
+
+def finish_run(run, stats):
+    """
+    Marks the run Completed (consistent): every chunk is committed and the risk cube rebuilt.
+    """
+    AnalysisRun.objects.filter(pk=run.pk).update(
+        status=AnalysisRun.COMPLETED,
+        stats={key: stats[key] for key in RUN_STATS},
+        finished_at=timezone.now(),
+    )
+
+def interrupt_run(run, error):
+    """
+    Marks the run Interrupted so the next run resumes it. If the database itself is gone the run is
+    left Running, and is resumed once it goes stale (RUN_STALE_AFTER).
+    """
+    try:
+        AnalysisRun.objects.filter(pk=run.pk).update(status=AnalysisRun.INTERRUPTED, error=str(error))
+    except DatabaseError:
+        logger.warning(f"Could not mark analysis run #{run.pk} as interrupted; it resumes once stale")
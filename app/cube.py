@@ -0,0 +1,138 @@
+"""
+Maintenance of the pre-aggregated risk cube (RiskCubeCell).
+A cell holds the number of students and the sum of their certainty scores for one combination of
+faculty x course x academic year x gender x financial status x risk level. The cube is rebuilt
+after full batch analyses and patched with deltas when a few students are re-scored, created,
+edited (e.g. moving faculty) or deleted.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Count, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Student, RiskCubeCell
+
+DIMENSION_FIELDS = ('faculty_id', 'course_id', 'academic_year', 'gender', 'financial_status')
+CELL_FIELDS = DIMENSION_FIELDS + ('risk_level',)
+
+
+def rebuild_risk_cube():
+    """
+    Recomputes every cell from Student LEFT JOIN AttritionAnalysisResult in one GROUP BY
+    and swaps the cube contents in a single transaction. Returns the number of cells.
+    """
+    rows = (
+        Student.objects
+        .values(*DIMENSION_FIELDS, risk=Coalesce('attrition_result__risk_level', Value(RiskCubeCell.NOT_ANALYSED)))
+        .annotate(students=Count('id'), certainty=Coalesce(Sum('attrition_result__certainty_score'), Value(0.0)))
+        .order_by()
+    )
+    cells = [
+        RiskCubeCell(
+            **{field: row[field] for field in DIMENSION_FIELDS},
+            risk_level=row['risk'],
+            student_count=row['students'],
+            certainty_sum=row['certainty'],
+        )
+        for row in rows
+    ]
+    with transaction.atomic():
+        RiskCubeCell.objects.all().delete()
+        RiskCubeCell.objects.bulk_create(cells, batch_size=2000)
+    return len(cells)
+
+
+def snapshot_students(students):
+    """
+    Returns {student_id: (dimensions, risk_level, certainty)} for a Student queryset, where
+    risk_level is NOT_ANALYSED for students without a result. Taken before re-scoring so
+    patch_risk_cube knows which cells to move each student out of.
+    """
+    rows = students.values_list(
+        'id', *DIMENSION_FIELDS, 'attrition_result__risk_level', 'attrition_result__certainty_score'
+    )
+    return {
+        row[0]: (tuple(row[1:-2]), row[-2] or RiskCubeCell.NOT_ANALYSED, row[-1] or 0.0)
+        for row in rows
+    }
+
+
+def patch_risk_cube(before, after):
+    """
+    Applies the difference between two snapshot_students() results to the cube: each student is
+    moved out of its old (dimensions, risk level) cell and into its new one.
+    Students missing from `before` are treated as new to the cube.
+    """
+    deltas = defaultdict(lambda: [0, 0.0])
+    for student_id, (dimensions, risk_level, certainty) in after.items():
+        if student_id in before:
+            old_dimensions, old_risk_level, old_certainty = before[student_id]
+            delta = deltas[old_dimensions + (old_risk_level,)]
+            delta[0] -= 1
+            delta[1] -= old_certainty
+        delta = deltas[dimensions + (risk_level,)]
+        delta[0] += 1
+        delta[1] += certainty
+    _apply_deltas(deltas)
+
+
+def remove_students_from_cube(before):
+    """
+    Takes students out of the cells recorded in a snapshot_students() result taken before they
+    were deleted (their results are deleted with them, so it can't be taken afterwards).
+    A cell that no longer exists went with its faculty or course, which cascades to the students too.
+    """
+    deltas = defaultdict(lambda: [0, 0.0])
+    for dimensions, risk_level, certainty in before.values():
+        delta = deltas[dimensions + (risk_level,)]
+        delta[0] -= 1
+        delta[1] -= certainty
+    _apply_deltas(deltas, create=False)
+
+
+def _apply_deltas(deltas, create=True):
+    # deltas: {cell key (CELL_FIELDS values): [student count, certainty sum]}
+    # create=False only updates existing cells
+    with transaction.atomic():
+        for key, (count, certainty) in deltas.items():
+            if count == 0 and certainty == 0:
+                continue
+            cell = dict(zip(CELL_FIELDS, key))
+            updated = RiskCubeCell.objects.filter(**cell).update(
+                student_count=F('student_count') + count,
+                certainty_sum=F('certainty_sum') + certainty,
+            )
+            if not updated and create:
+                RiskCubeCell.objects.create(**cell, student_count=count, certainty_sum=certainty)
+
+
+def add_student_to_cube(student):
+    """
+    Counts a newly created student in its cell as not analysed yet. Deltas commute, so this is
+    correct whether or not the student's first analysis has already been patched in.
+    """
+    add_students_to_cube([student])
+
+
+def add_students_to_cube(students):
+    """
+    add_student_to_cube for many new students (e.g. a bulk_create, which sends no post_save),
+    with one update per cell.
+    """
+    patch_risk_cube({}, {student.pk: (student_dimensions(student), RiskCubeCell.NOT_ANALYSED, 0.0) for student in students})
+
+
+def move_student_in_cube(before, student):
+    """
+    Moves a saved student to the cell of its current dimensions, keeping its risk level and
+    certainty. `before` is the student's snapshot_students() entry from before the save; nothing
+    is written if no dimension changed.
+    """
+    dimensions, risk_level, certainty = before
+    if student_dimensions(student) != dimensions:
+        patch_risk_cube({student.pk: before}, {student.pk: (student_dimensions(student), risk_level, certainty)})
+
+
+def student_dimensions(student):
+    return tuple(getattr(student, field) for field in DIMENSION_FIELDS)
@@ -0,0 +1,71 @@
+"""
+Streaming export of AttritionAnalysisResult joined with student, faculty and course.
+Rows are read with .iterator() (a server-side cursor on PostgreSQL) and written out one
+at a time, so memory stays flat however many results there are.
+"""
+import csv
+import json
+
+from .models import AttritionAnalysisResult
+
+EXPORT_CHUNK_SIZE = 2000
+
+# (column name, ORM lookup from AttritionAnalysisResult)
+EXPORT_COLUMNS = [
+    ('student_id', 'student_id'),
+    ('first_name', 'student__first_name'),
+    ('last_name', 'student__last_name'),
+    ('gender', 'student__gender'),
+    ('age', 'student__age'),
+    ('academic_year', 'student__academic_year'),
+    ('financial_status', 'student__financial_status'),
+    ('enrollment_status', 'student__enrollment_status'),
+    ('gpa', 'student__gpa'),
+    ('faculty', 'student__faculty__name'),
+    ('course', 'student__course__name'),
+    ('course_complexity', 'student__course__complexity_level'),
+    ('risk_level', 'risk_level'),
+    ('certainty_score', 'certainty_score'),
+    ('rule_version', 'rule_version'),
+]
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def export_queryset(risk_level=None, faculty=None, year=None):
+    """
+    Returns the joined result rows as tuples, optionally filtered by risk level,
+    faculty name and academic year.
+    """
+    results = AttritionAnalysisResult.objects.all()
+    if risk_level:
+        results = results.filter(risk_level=risk_level)
+    if faculty:
+        results = results.filter(student__faculty__name=faculty)
+    if year:
+        results = results.filter(student__academic_year=year)
+    return results.order_by('student_id').values_list(*(lookup for _, lookup in EXPORT_COLUMNS))
+
+
+class _Echo:
+    """File-like object whose write() hands the line straight back, for csv.writer."""
+    def write(self, value):
+        return value
+
+
+def iter_export(rows, file_format='csv', chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields the export line by line (header first for CSV) in the requested format.
+    """
+    names = [name for name, _ in EXPORT_COLUMNS]
+    if file_format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(names)
+        for row in rows.iterator(chunk_size=chunk_size):
+            yield writer.writerow(row)
+    else:
+        for row in rows.iterator(chunk_size=chunk_size):
+            yield json.dumps(dict(zip(names, row))) + '\n'
@@ -0,0 +1,121 @@
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import AnalysisJob
+from .checkpoints import RUN_STALE_AFTER
+from . import metrics
+import logging
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# A Running job without a heartbeat (progress report) for this long is presumed dead: its worker
+# crashed, ran out of memory or was killed by a deploy. Longer than RUN_STALE_AFTER, so by the time
+# the job is retried its interrupted AnalysisRun can be resumed rather than started over.
+JOB_STALE_AFTER = 2 * RUN_STALE_AFTER
+MAX_JOB_ATTEMPTS = 3  # Claims before a job that keeps dying is failed instead of re-queued
+
+# -----------------------------------------
+# Recovering jobs of dead workers
+# -----------------------------------------
+
+def recover_stale_jobs():
+    """
+    Re-queues Running jobs whose worker stopped sending heartbeats, or fails them once they have
+    used up MAX_JOB_ATTEMPTS. Call inside a transaction. Returns the number of jobs recovered.
+    """
+    now = timezone.now()
+    cutoff = now - JOB_STALE_AFTER
+    stale = AnalysisJob.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),  # Claimed before heartbeats existed
+        status=AnalysisJob.RUNNING,
+    )
+    failed = stale.filter(attempts__gte=MAX_JOB_ATTEMPTS).update(
+        status=AnalysisJob.FAILED, phase='done', error='The worker stopped responding on every attempt.', finished_at=now,
+    )
+    requeued = stale.update(status=AnalysisJob.QUEUED, error='The previous worker stopped responding; re-queued.')
+    if failed or requeued:
+        logger.warning(f"Recovered stale analysis jobs: {requeued} re-queued, {failed} failed")
+    return failed + requeued
+
+# -----------------------------------------
+# Queueing analysis runs from the web
+# -----------------------------------------
+
+def enqueue_analysis(incremental=False, workers=1):
+    """
+    Queues a batch analysis run and returns (job, created).
+    If a run is already queued or running, that job is returned instead of starting a duplicate.
+    """
+    with transaction.atomic():
+        recover_stale_jobs()  # A dead job must not absorb every later request
+        job = (
+            AnalysisJob.objects.select_for_update()
+            .filter(status__in=AnalysisJob.ACTIVE_STATUSES)
+            .order_by('created_at')
+            .first()
+        )
+        if job:
+            return job, False
+        return AnalysisJob.objects.create(incremental=incremental, workers=workers), True
+
+# -----------------------------------------
+# Running queued jobs (used by the run_analysis_worker command)
+# -----------------------------------------
+
+def claim_next_job():
+    """
+    Marks the oldest queued job as running and returns it, or None if the queue is empty.
+    Locked rows are skipped so several workers never pick up the same job.
+    """
+    with transaction.atomic():
+        recover_stale_jobs()
+        job = (
+            AnalysisJob.objects.select_for_update(skip_locked=True)
+            .filter(status=AnalysisJob.QUEUED)
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = AnalysisJob.RUNNING
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.attempts += 1
+        job.save(update_fields=['status', 'started_at', 'heartbeat_at', 'attempts'])
+    return job
+
+def run_job(job):
+    """
+    Runs a claimed job through the batch analysis pipeline, recording phase and progress as it goes.
+    """
+    from .annalysis import analyse_cohort, run_sharded_analysis  # Only the worker needs the analysis stack
+
+    # The worker's claim on the job: a job recovered as stale (and maybe claimed again) is no longer ours
+    claimed = AnalysisJob.objects.filter(pk=job.pk, status=AnalysisJob.RUNNING, attempts=job.attempts)
+
+    def progress(phase, processed, total):
+        # Doubles as the heartbeat that keeps the job from being recovered as stale
+        claimed.update(phase=phase, processed=processed, total=total, heartbeat_at=timezone.now())
+
+    try:
+        if job.workers > 1:
+            stats = run_sharded_analysis(job.workers, incremental=job.incremental, progress=progress)
+        else:
+            stats = analyse_cohort(incremental=job.incremental, progress=progress)
+    except Exception as e:
+        logger.error(f"Analysis job #{job.pk} failed: {e}")
+        traceback.print_exc()
+        metrics.inc('aisha_analysis_errors_total')
+        job.status = AnalysisJob.FAILED
+        job.error = str(e)
+    else:
+        job.status = AnalysisJob.FAILED if stats.get('failed_shards') else AnalysisJob.COMPLETED
+        job.error = '\n'.join(stats.get('errors', []))
+        job.stats = stats
+
+    job.phase = 'done'
+    job.finished_at = timezone.now()
+    if not claimed.update(status=job.status, phase=job.phase, error=job.error, stats=job.stats, finished_at=job.finished_at):
+        logger.warning(f"Analysis job #{job.pk} was recovered as stale while running; its result is not recorded")
+    job.refresh_from_db()
+    return job
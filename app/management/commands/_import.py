@@ -0,0 +1,87 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.bulk_import import IMPORT_CHUNK_SIZE, read_rows
+from app.caching import bump_data_version
+
+ANALYSIS_BATCH_SIZE = 5000  # Students per subset analysis; keeps id lists well under SQLite's variable limit
+FULL_RUN_FRACTION = 0.5  # Above this share of the cohort, one incremental run over all students is cheaper
+
+
+class BaseImportCommand(BaseCommand):
+    """
+    Shared options and reporting for import_students / import_records.
+    Subclasses set `importer` to one of the app.bulk_import functions.
+    """
+    importer = None
+    max_errors_shown = 20
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV (with header) or JSON Lines file.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Input format; defaults to the file extension.")
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help="Rows validated and inserted per batch.")
+        parser.add_argument('--dry-run', action='store_true', help="Validate the file without writing anything.")
+        parser.add_argument('--skip-analysis', action='store_true', help="Do not run the attrition analysis afterwards.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = read_rows(options['path'], options['format'])
+        stats = self.importer(rows, chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+        elapsed = time.perf_counter() - started
+
+        for error in stats['errors'][:self.max_errors_shown]:
+            self.stderr.write(error)
+        if len(stats['errors']) > self.max_errors_shown:
+            self.stderr.write(f"... and {len(stats['errors']) - self.max_errors_shown} more errors")
+
+        rate = stats['read'] / elapsed if elapsed else 0
+        self.stdout.write(
+            f"{stats['read']} rows read, {stats['read'] - len(stats['errors'])} valid, {len(stats['errors'])} rejected, "
+            f"{stats['created']} written in {elapsed:.1f}s ({rate:,.0f} rows/sec)."
+        )
+
+        if options['dry_run'] or not stats['created']:
+            return
+        if options['skip_analysis']:
+            # bulk_create sends no signals; new students are already in the risk cube as not analysed
+            bump_data_version()
+            return
+
+        # Batch analyses of the imported students instead of one per row; students whose inputs
+        # did not change are not re-scored
+        from app.annalysis import run_attrition_analysis
+        from app.models import Student
+
+        student_ids = sorted(set(stats['student_ids']))
+        self.stdout.write(f"Running attrition analysis for {len(student_ids)} affected students...")
+        if len(student_ids) > FULL_RUN_FRACTION * Student.objects.count():
+            stats = run_attrition_analysis(incremental=True)  # One pass over everyone is cheaper
+        else:
+            stats = self.analyse_students(student_ids)
+        if stats is None:
+            self.stderr.write("Attrition analysis failed; see the log for details.")
+        else:
+            self.stdout.write(f"Analysis: {stats['inserted']} results inserted, {stats['updated']} updated, {stats['skipped']} unchanged.")
+
+    def analyse_students(self, student_ids):
+        """
+        Incremental analysis of the given students (sorted ids) in batches of ANALYSIS_BATCH_SIZE,
+        so each query carries a bounded id list, or just an id range for runs of consecutive ids
+        (bulk-created students). Returns the merged stats, or None if a batch failed.
+        """
+        from app.annalysis import merge_stats, run_attrition_analysis
+        from app.models import Student
+
+        totals = {'inserted': 0, 'updated': 0, 'skipped': 0, 'transitions': {}}
+        for start in range(0, len(student_ids), ANALYSIS_BATCH_SIZE):
+            batch = student_ids[start:start + ANALYSIS_BATCH_SIZE]
+            if batch[-1] - batch[0] + 1 == len(batch):
+                students = Student.objects.filter(id__range=(batch[0], batch[-1]))
+            else:
+                students = Student.objects.filter(id__in=batch)
+            stats = run_attrition_analysis(incremental=True, students=students)
+            if stats is None:
+                return None
+            merge_stats(totals, stats)
+        return totals
@@ -0,0 +1,107 @@
+import json
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from app.backtesting import OBJECTIVES, backtest, load_history, parse_grid, sweep
+from app.models import RuleSet
+from app.rules import RISK_LEVELS, CompiledRuleSet, load_spec
+
+
+class Command(BaseCommand):
+    help = (
+        "Scores every student with a final outcome (Dropped Out or Graduated) and reports precision, recall and "
+        "confusion matrices for a rule set. With --param or --grid, also sweeps every combination of spec values "
+        "across worker processes and ranks them, e.g. "
+        "--param rules.High.gpa.weight=0.5,0.6,0.7 --param borderline.margin=0.08,0.12,0.16"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rule-version', type=int, help="Rule set to test and sweep from (default: the active one).")
+        parser.add_argument('--flag', default='High',
+                            help=f"Comma-separated risk levels read as a dropout prediction (from {', '.join(RISK_LEVELS)}).")
+        parser.add_argument('--exact', action='store_true', help="Interpolate memberships instead of using score tables.")
+        parser.add_argument('--param', action='append', default=[], metavar='PATH=V1,V2',
+                            help="Spec values to sweep (repeatable), e.g. variables.gpa.sets.low.points.2=1.8,2.0,2.2")
+        parser.add_argument('--grid', help="JSON file mapping spec paths to lists of values, added to --param.")
+        parser.add_argument('--objective', choices=OBJECTIVES, default='f1', help="Metric the sweep ranks by.")
+        parser.add_argument('--workers', type=int, help="Sweep processes (default: one per CPU).")
+        parser.add_argument('--sample', type=float, default=0.2,
+                            help="Fraction of the history every combination is screened on first (1 disables pruning).")
+        parser.add_argument('--keep', type=float, default=0.25,
+                            help="Fraction of screened combinations, best first, evaluated on the whole history.")
+        parser.add_argument('--top', type=int, default=10, help="Sweep results to print.")
+        parser.add_argument('--output', help="JSON report to write.")
+        parser.add_argument('--best-spec', help="File to write the best swept spec to, ready for load_rule_set.")
+
+    def handle(self, *args, **options):
+        flagged = [level.strip() for level in options['flag'].split(',') if level.strip()]
+        if not flagged or set(flagged) - set(RISK_LEVELS):
+            raise CommandError(f"--flag takes risk levels from {', '.join(RISK_LEVELS)}")
+        version = options['rule_version'] or RuleSet.active_version()
+        try:
+            base_spec = load_spec(version)
+            grid = parse_grid(options['param'])
+            if options['grid']:
+                with open(options['grid'], encoding='utf-8') as f:
+                    grid.update(json.load(f))
+        except ValueError as e:  # Unknown rule version
+            raise CommandError(str(e))
+        except ValidationError as e:
+            raise CommandError(' '.join(e.messages))
+
+        started = time.perf_counter()
+        history = load_history()
+        self.stdout.write(
+            f"{len(history['dropped_out'])} students with a final outcome, {int(history['dropped_out'].sum())} dropped out "
+            f"(loaded in {time.perf_counter() - started:.2f}s)"
+        )
+        report = {'rule_version': version, 'flagged': flagged, 'baseline': backtest(CompiledRuleSet(version, base_spec), history, flagged, options['exact'])}
+        self._write_metrics(f"Rule set v{version}", report['baseline'])
+        for year, metrics in report['baseline']['by_year'].items():
+            self.stdout.write(f"  Year {year}: {metrics['students']} students, precision {metrics['precision']:.3f}, recall {metrics['recall']:.3f}")
+
+        if grid:
+            started = time.perf_counter()
+            try:
+                report['sweep'] = sweep(
+                    base_spec, grid, history, objective=options['objective'], flagged=flagged, exact=options['exact'],
+                    workers=options['workers'], sample=options['sample'], keep=options['keep'],
+                )
+            except ValidationError as e:
+                raise CommandError(' '.join(e.messages))
+            elapsed = time.perf_counter() - started
+            self._write_sweep(report['sweep'], elapsed, options['top'])
+            best_spec = report['sweep'].pop('best_spec')
+            if best_spec and options['best_spec']:
+                with open(options['best_spec'], 'w', encoding='utf-8') as f:
+                    json.dump(best_spec, f, indent=2)
+                self.stdout.write(f"Best spec written to {options['best_spec']}; load it with load_rule_set.")
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}.")
+
+    def _write_metrics(self, name, metrics):
+        confusion = metrics['confusion']
+        self.stdout.write(
+            f"{name}: precision {metrics['precision']:.3f}, recall {metrics['recall']:.3f}, f1 {metrics['f1']:.3f}, "
+            f"accuracy {metrics['accuracy']:.3f} (TP {confusion['true_positive']}, FP {confusion['false_positive']}, "
+            f"FN {confusion['false_negative']}, TN {confusion['true_negative']})"
+        )
+        for level, outcomes in metrics['by_risk_level'].items():
+            self.stdout.write(f"  {level}: " + ", ".join(f"{outcome} {count}" for outcome, count in outcomes.items()))
+
+    def _write_sweep(self, result, elapsed, top):
+        screened = f", screened on {result['screened_on']} students" if result['screened_on'] else ""
+        self.stdout.write(
+            f"Swept {result['combinations']} combinations in {elapsed:.1f}s{screened}: {result['invalid']} invalid, "
+            f"{result['pruned']} pruned, {len(result['results'])} evaluated in full. Best by {result['objective']}:"
+        )
+        for rank, metrics in enumerate(result['results'][:top], 1):
+            params = ", ".join(f"{path}={value}" for path, value in metrics['params'].items())
+            self.stdout.write(
+                f"{rank:3}. precision {metrics['precision']:.3f}, recall {metrics['recall']:.3f}, f1 {metrics['f1']:.3f}  {params}"
+            )
@@ -0,0 +1,80 @@
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from app.benchmarks import BENCHMARK_MODES, DEFAULT_CONFIG, compare_reports, generate_institution, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a seeded synthetic institution in a throwaway database and times run_attrition_analysis "
+        "in each mode (per-phase wall time, queries, peak RSS, students/sec), writing the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--faculties', type=int, default=DEFAULT_CONFIG['faculties'])
+        parser.add_argument('--courses-per-faculty', type=int, default=DEFAULT_CONFIG['courses_per_faculty'])
+        parser.add_argument('--students', type=int, default=DEFAULT_CONFIG['students'])
+        parser.add_argument('--records-per-student', type=int, default=DEFAULT_CONFIG['records_per_student'])
+        parser.add_argument('--seed', type=int, default=DEFAULT_CONFIG['seed'])
+        parser.add_argument('--single-sample', type=int, default=DEFAULT_CONFIG['single_sample'],
+                            help="Students analysed one by one in the 'single' mode.")
+        parser.add_argument('--workers', type=int, default=DEFAULT_CONFIG['workers'], help="Processes for the 'sharded' mode.")
+        parser.add_argument('--changed-fraction', type=float, default=DEFAULT_CONFIG['changed_fraction'],
+                            help="Share of students whose GPA changes before 'incremental_changed'.")
+        parser.add_argument('--modes', default=','.join(BENCHMARK_MODES),
+                            help=f"Comma-separated modes to run (default: all of {', '.join(BENCHMARK_MODES)}).")
+        parser.add_argument('--output', default='analysis_benchmark.json', help="JSON report to write.")
+        parser.add_argument('--baseline', help="Earlier JSON report to compare against.")
+        parser.add_argument('--db-path', default=os.path.join(tempfile.gettempdir(), 'aisha_benchmark.sqlite3'),
+                            help="SQLite file for the throwaway database (ignored on other backends).")
+
+    def handle(self, *args, **options):
+        modes = [mode.strip() for mode in options['modes'].split(',') if mode.strip()]
+        unknown = set(modes) - set(BENCHMARK_MODES)
+        if unknown:
+            raise CommandError(f"Unknown modes: {', '.join(sorted(unknown))}")
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        config = {name: options[name] for name in DEFAULT_CONFIG}
+
+        # Never benchmark against the real data: create a separate (test) database and drop it afterwards.
+        # SQLite gets a file rather than the in-memory default so the sharded workers can share it.
+        if connection.vendor == 'sqlite':
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = options['db_path']
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(f"Generating synthetic institution (seed {config['seed']})...")
+            created = generate_institution(**config)
+            self.stdout.write(', '.join(f"{count} {name}" for name, count in created.items()))
+
+            report = run_benchmarks(config, modes)
+            report['data'] = created
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for run in report['runs']:
+            if run['error']:
+                self.stderr.write(f"{run['mode']}: failed: {run['error']}")
+                continue
+            phases = ', '.join(f"{phase} {seconds:.3f}s" for phase, seconds in run['phases'].items())
+            self.stdout.write(
+                f"{run['mode']}: {run['students']} students ({run['scored']} scored) in {run['wall_seconds']:.3f}s "
+                f"({run['students_per_sec']:,.0f}/sec), {run['queries']} queries, "
+                f"peak RSS {run['peak_rss_mb']} MB (+{run['rss_growth_mb']} MB)" + (f" [{phases}]" if phases else "")
+            )
+
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(f"Report written to {options['output']}.")
+
+        if baseline:
+            self.stdout.write(f"Compared with {options['baseline']}:")
+            for line in compare_reports(report, baseline):
+                self.stdout.write(f"  {line}")
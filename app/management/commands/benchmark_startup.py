@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.benchmarks import STARTUP_PROFILES, measure_startup
+
+
+class Command(BaseCommand):
+    help = (
+        "Boots fresh web workers (settings, WSGI application, URLconf and views) and reports their import "
+        "time, resident memory and the heavy analysis libraries they load, writing the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="Workers booted per profile; the median is reported.")
+        parser.add_argument('--profiles', default=','.join(STARTUP_PROFILES),
+                            help=f"Comma-separated profiles (default: all of {', '.join(STARTUP_PROFILES)}).")
+        parser.add_argument('--output', default='startup_benchmark.json', help="JSON report to write.")
+
+    def handle(self, *args, **options):
+        profiles = [profile.strip() for profile in options['profiles'].split(',') if profile.strip()]
+        unknown = set(profiles) - set(STARTUP_PROFILES)
+        if unknown:
+            raise CommandError(f"Unknown profiles: {', '.join(sorted(unknown))}")
+
+        report = measure_startup(profiles, runs=options['runs'])
+        for profile, result in report.items():
+            self.stdout.write(
+                f"{profile}: {result['import_seconds']:.3f}s to boot, {result['rss_mb']} MB RSS, "
+                f"{result['modules']} modules, heavy: {', '.join(result['heavy_modules']) or 'none'}"
+            )
+            for entry in result['slowest_imports'][:5]:
+                self.stdout.write(f"  {entry['module']}: {entry['seconds']:.3f}s")
+
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(f"Report written to {options['output']}.")
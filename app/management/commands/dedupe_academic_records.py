@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from app.models import AcademicRecord
+
+
+class Command(BaseCommand):
+    help = (
+        "Lists students with several academic records for the same year, which block the unique "
+        "(student, year) constraint of migration 0006. With --delete, keeps the newest record of each "
+        "and deletes the others, printing every deleted record."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true', help="Delete all but the newest record of each duplicate.")
+
+    def handle(self, *args, **options):
+        duplicates = (
+            AcademicRecord.objects.values('student_id', 'year')
+            .annotate(records=Count('id'))
+            .filter(records__gt=1)
+            .order_by('student_id', 'year')
+        )
+        found = deleted = 0
+        for row in duplicates:
+            found += 1
+            records = list(
+                AcademicRecord.objects.filter(student_id=row['student_id'], year=row['year'])
+                .order_by('-id').values_list('id', 'gpa', 'notes')
+            )
+            (keep_id, keep_gpa, _), *extra = records
+            self.stdout.write(f"Student {row['student_id']}, year {row['year']}: keeping record {keep_id} (GPA {keep_gpa})")
+            for record_id, gpa, notes in extra:
+                self.stdout.write(f"  {'deleting' if options['delete'] else 'duplicate'} record {record_id} (GPA {gpa}) {notes!r}")
+            if options['delete']:
+                # Raw delete: no signals, as the GPA aggregate columns may not be migrated yet;
+                # run repair_gpa_aggregates once the migrations are applied
+                deleted += AcademicRecord.objects.filter(id__in=[record[0] for record in extra])._raw_delete(AcademicRecord.objects.db)
+
+        if not found:
+            self.stdout.write("No duplicate academic records.")
+        elif options['delete']:
+            self.stdout.write(f"Deleted {deleted} duplicate academic records.")
+        else:
+            self.stdout.write("Nothing deleted; rerun with --delete to keep only the newest record of each.")
@@ -0,0 +1,27 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from app.exports import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_queryset, iter_export
+
+
+class Command(BaseCommand):
+    help = "Streams attrition analysis results joined with student, faculty and course as CSV or JSON Lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--output', help="File to write to; defaults to stdout.")
+        parser.add_argument('--risk-level', help="Only export this risk level (e.g. High).")
+        parser.add_argument('--faculty', help="Only export students of this faculty (by name).")
+        parser.add_argument('--year', type=int, help="Only export this academic year.")
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        rows = export_queryset(risk_level=options['risk_level'], faculty=options['faculty'], year=options['year'])
+        output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        try:
+            for line in iter_export(rows, options['format'], options['chunk_size']):
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
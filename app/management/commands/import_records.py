@@ -0,0 +1,8 @@
+from app.bulk_import import import_records
+
+from ._import import BaseImportCommand
+
+
+class Command(BaseImportCommand):
+    help = "Bulk imports academic records (student_id, gpa, year, notes) from CSV or JSON Lines."
+    importer = staticmethod(import_records)
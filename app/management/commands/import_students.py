@@ -0,0 +1,8 @@
+from app.bulk_import import import_students
+
+from ._import import BaseImportCommand
+
+
+class Command(BaseImportCommand):
+    help = "Bulk imports students (first_name, last_name, age, gender, faculty, course, academic_year, financial_status, ...) from CSV or JSON Lines."
+    importer = staticmethod(import_students)
@@ -0,0 +1,46 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+
+from app.models import RuleSet
+from app.rules import load_spec, validate_spec
+
+
+class Command(BaseCommand):
+    help = (
+        "Saves a fuzzy rule spec (JSON) as the next RuleSet version, optionally activating it. "
+        "With --dump, prints an existing version's spec instead, as a starting point for edits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('spec', nargs='?', help="Path of the JSON rule spec to load.")
+        parser.add_argument('--description', default='', help="Short note on what changed.")
+        parser.add_argument('--activate', action='store_true', help="Use the new version for new analysis runs.")
+        parser.add_argument('--dump', type=int, metavar='VERSION', help="Print the spec of this version and exit.")
+
+    def handle(self, *args, **options):
+        if options['dump'] is not None:
+            try:
+                self.stdout.write(json.dumps(load_spec(options['dump']), indent=2))
+            except ValueError as e:
+                raise CommandError(str(e))
+            return
+
+        if not options['spec']:
+            raise CommandError("Give the path of a JSON rule spec, or --dump VERSION.")
+        with open(options['spec'], encoding='utf-8') as f:
+            spec = json.load(f)
+        try:
+            validate_spec(spec)
+        except ValidationError as e:
+            raise CommandError("Invalid rule spec:\n  " + "\n  ".join(e.messages))
+
+        version = (RuleSet.objects.aggregate(latest=Max('version'))['latest'] or 0) + 1
+        rule_set = RuleSet.objects.create(version=version, description=options['description'], spec=spec)
+        if options['activate']:
+            rule_set.activate()
+        self.stdout.write(
+            f"Saved {rule_set}." + (" Run an incremental analysis to re-score students under it." if options['activate'] else "")
+        )
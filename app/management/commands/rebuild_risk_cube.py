@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from app.caching import bump_data_version
+from app.cube import rebuild_risk_cube
+
+
+class Command(BaseCommand):
+    help = "Recomputes the pre-aggregated risk cube used by the dashboards from the per-student tables."
+
+    def handle(self, *args, **options):
+        cells = rebuild_risk_cube()
+        bump_data_version()
+        self.stdout.write(f"Risk cube rebuilt with {cells} cells.")
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Avg, Count, F, Max, Min, Q
+
+from app.aggregates import refresh_gpa_aggregates
+from app.caching import bump_data_version
+from app.models import Student
+
+
+class Command(BaseCommand):
+    help = "Recomputes Student.avg_gpa and Student.record_count from academic records, in id-range chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help="Students per UPDATE (default 10000).")
+        parser.add_argument('--check', action='store_true', help="Only report how many students have drifted.")
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drifted = self.drifted_students().count()
+            self.stdout.write(f"{drifted} students have GPA aggregates that differ from their academic records.")
+            return
+
+        started = time.perf_counter()
+        bounds = Student.objects.aggregate(low=Min('id'), high=Max('id'))
+        updated = 0
+        if bounds['low'] is not None:
+            for low in range(bounds['low'], bounds['high'] + 1, options['chunk_size']):
+                with transaction.atomic():  # Short transactions: each chunk commits on its own
+                    updated += refresh_gpa_aggregates(
+                        Student.objects.filter(id__gte=low, id__lt=low + options['chunk_size'])
+                    )
+        bump_data_version()
+        self.stdout.write(f"Recomputed GPA aggregates for {updated} students in {time.perf_counter() - started:.1f}s.")
+
+    @staticmethod
+    def drifted_students():
+        # Stored values compared against a fresh GROUP BY over academic records
+        students = Student.objects.annotate(
+            actual_count=Count('academic_records'),
+            actual_avg=Avg('academic_records__gpa'),
+        )
+        return students.filter(
+            ~Q(record_count=F('actual_count'))
+            | Q(actual_avg__isnull=False) & ~Q(avg_gpa=F('actual_avg'))
+            | Q(actual_avg__isnull=True) & ~Q(avg_gpa=0)
+        )
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.jobs import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Processes queued attrition analysis jobs (AnalysisJob) outside the web workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Process the queue until empty, then exit.")
+        parser.add_argument('--poll-interval', type=float, default=5.0, help="Seconds to wait when the queue is empty.")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Analysis worker started.")
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f"Running analysis job #{job.pk}...")
+            job = run_job(job)
+            self.stdout.write(f"Analysis job #{job.pk} {job.status.lower()} in {job.elapsed_seconds:.1f}s.")
@@ -0,0 +1,272 @@
+"""
+Metrics for analysis runs and web requests, served in the Prometheus text format at /metrics.
+Counters and histogram buckets live in the 'counters' cache (like the data version), whose
+increments are atomic across processes and whose entries are never evicted, so the web workers,
+the analysis worker and shard processes all add to the same series without losing counts. Each process
+buffers its increments and writes them at most once per FLUSH_INTERVAL seconds, on flush() and at exit.
+Label values are fixed sets (views, phases, risk levels), so a scrape can read every series directly.
+"""
+import atexit
+import contextlib
+import itertools
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.db import connection
+
+from .caching import counters
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'metrics'
+FLUSH_INTERVAL = 1.0  # Seconds between counter writes per process
+SUM_SCALE = 10 ** 6  # Histogram sums are stored as integers in millionths
+
+ANALYSIS_PHASES = ('fetch', 'score', 'persist', 'cube')
+ANALYSIS_MODES = ('cohort', 'subset', 'sharded', 'single')
+RISK_LEVELS = ('High', 'Medium', 'Low')
+STATUS_CLASSES = ('1xx', '2xx', '3xx', '4xx', '5xx')
+OTHER_VIEW = 'other'  # Unresolved URLs
+
+
+def _view_labels():
+    # Named routes of this app, plus one label per included namespace (e.g. 'admin')
+    from django.urls import get_resolver
+    from .urls import urlpatterns
+    return sorted({pattern.name for pattern in urlpatterns if pattern.name} | set(get_resolver().namespace_dict) | {OTHER_VIEW})
+
+
+LABEL_VALUES = {
+    'view': _view_labels,
+    'status': lambda: STATUS_CLASSES,
+    'phase': lambda: ANALYSIS_PHASES,
+    'mode': lambda: ANALYSIS_MODES,
+    'from': lambda: ('none',) + RISK_LEVELS,
+    'to': lambda: RISK_LEVELS,
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+PHASE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# name -> (type, help, label names, histogram buckets)
+METRICS = {
+    'aisha_http_requests_total': ('counter', "HTTP requests by view and status class.", ('view', 'status'), None),
+    'aisha_http_request_duration_seconds': ('histogram', "Request latency by view.", ('view',), LATENCY_BUCKETS),
+    'aisha_http_request_queries': ('histogram', "Database queries per request by view.", ('view',), QUERY_BUCKETS),
+    'aisha_analysis_runs_total': ('counter', "Analysis runs by mode.", ('mode',), None),
+    'aisha_analysis_phase_duration_seconds': ('histogram', "Wall time of each analysis phase.", ('phase',), PHASE_BUCKETS),
+    'aisha_analysis_phase_queries_total': ('counter', "Database queries made by each analysis phase.", ('phase',), None),
+    'aisha_analysis_students_scored_total': ('counter', "Students scored and written by analysis runs.", (), None),
+    'aisha_analysis_students_skipped_total': ('counter', "Students skipped by incremental runs (inputs unchanged).", (), None),
+    'aisha_analysis_risk_transitions_total': ('counter', "Students whose risk level changed ('none' = first result).", ('from', 'to'), None),
+    'aisha_analysis_errors_total': ('counter', "Failed analysis runs and shards.", (), None),
+}
+
+# -----------------------------------------
+# Recording
+# -----------------------------------------
+
+_pending = defaultdict(int)
+_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def _key(name, labels, suffix=''):
+    label_names = METRICS[name][2]
+    values = '|'.join(str((labels or {})[label]) for label in label_names)
+    return f"{KEY_PREFIX}:{name}:{values}:{suffix}"
+
+
+def _add(key, amount):
+    with _lock:
+        _pending[key] += amount
+        due = time.monotonic() - _last_flush >= FLUSH_INTERVAL
+    if due:
+        flush()
+
+
+def flush():
+    """
+    Writes this process's buffered increments to the counters cache.
+    Call before forking workers (they would inherit the buffer) and at the end of a run.
+    """
+    global _last_flush
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    for key, amount in pending.items():
+        try:
+            counters.incr(key, amount)
+        except ValueError:  # First increment of this series
+            counters.add(key, 0, timeout=None)
+            counters.incr(key, amount)
+
+
+atexit.register(flush)
+
+
+def inc(name, amount=1, labels=None):
+    if amount:
+        _add(_key(name, labels), int(amount))
+
+
+def observe(name, value, labels=None):
+    """
+    Records one histogram observation: its bucket (non-cumulative) and the running sum.
+    """
+    buckets = METRICS[name][3]
+    bucket = next((i for i, bound in enumerate(buckets) if value <= bound), 'inf')
+    _add(_key(name, labels, f'bucket{bucket}'), 1)
+    _add(_key(name, labels, 'sum'), round(value * SUM_SCALE))
+
+
+class QueryCounter:
+    """
+    Database execute wrapper that counts queries on the default connection.
+    """
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextlib.contextmanager
+def count_queries():
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+
+@contextlib.contextmanager
+def analysis_phase(phase, stats, record=True):
+    """
+    Times one analysis phase and counts its queries, adding the figures to stats['phases'][phase]
+    as {'seconds', 'queries'}. With record=True the metrics are recorded and one structured line is
+    logged; phases repeated once per chunk pass record=False and call record_phases once at the end.
+    """
+    started = time.perf_counter()
+    with count_queries() as queries:
+        yield
+    seconds = time.perf_counter() - started
+    add_phase(stats, phase, seconds, queries.count)
+    if record:
+        _record_phase(phase, seconds, queries.count)
+
+
+def record_phases(stats, phases):
+    """
+    Records the totals accumulated in stats['phases'] for the given phases as one observation each.
+    """
+    for phase in phases:
+        totals = stats.get('phases', {}).get(phase)
+        if totals:
+            _record_phase(phase, totals['seconds'], totals['queries'])
+
+
+def _record_phase(phase, seconds, queries):
+    observe('aisha_analysis_phase_duration_seconds', seconds, {'phase': phase})
+    inc('aisha_analysis_phase_queries_total', queries, {'phase': phase})
+    logger.info(f"analysis phase={phase} seconds={seconds:.4f} queries={queries}")
+
+
+def add_phase(stats, phase, seconds, queries):
+    totals = stats.setdefault('phases', {}).setdefault(phase, {'seconds': 0.0, 'queries': 0})
+    totals['seconds'] = round(totals['seconds'] + seconds, 4)
+    totals['queries'] += queries
+
+
+def record_run(mode, stats):
+    """
+    Counts a finished run (unless mode is None) with its scored and skipped students and its
+    risk transitions. stats['transitions'] maps 'old->new' to a number of students.
+    """
+    if mode:
+        inc('aisha_analysis_runs_total', labels={'mode': mode})
+    inc('aisha_analysis_students_scored_total', stats.get('inserted', 0) + stats.get('updated', 0))
+    inc('aisha_analysis_students_skipped_total', stats.get('skipped', 0))
+    for transition, count in stats.get('transitions', {}).items():
+        old, new = transition.split('->')
+        inc('aisha_analysis_risk_transitions_total', count, {'from': old, 'to': new})
+    logger.info(
+        f"analysis run mode={mode or 'shard'} inserted={stats.get('inserted', 0)} updated={stats.get('updated', 0)} "
+        f"skipped={stats.get('skipped', 0)} errors={len(stats.get('errors', []))}"
+    )
+
+# -----------------------------------------
+# Request middleware
+# -----------------------------------------
+
+class MetricsMiddleware:
+    """
+    Records latency, query count and status class per view for every request.
+    Queries made while a streaming response is consumed happen after this returns and are not counted.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with count_queries() as queries:
+            response = self.get_response(request)
+        seconds = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = (match.namespace or match.url_name or OTHER_VIEW) if match else OTHER_VIEW
+        observe('aisha_http_request_duration_seconds', seconds, {'view': view})
+        observe('aisha_http_request_queries', queries.count, {'view': view})
+        inc('aisha_http_requests_total', labels={'view': view, 'status': f'{response.status_code // 100}xx'})
+        return response
+
+# -----------------------------------------
+# Exposition
+# -----------------------------------------
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+def render_metrics():
+    """
+    Returns every recorded series in the Prometheus text exposition format (histogram buckets cumulative).
+    """
+    flush()
+    lines = []
+    for name, (kind, help_text, label_names, buckets) in METRICS.items():
+        combinations = list(itertools.product(*(LABEL_VALUES[label]() for label in label_names)))
+        suffixes = [f'bucket{i}' for i in range(len(buckets))] + ['bucketinf', 'sum'] if buckets else ['']
+        keys = {
+            (values, suffix): _key(name, dict(zip(label_names, values)), suffix)
+            for values in combinations for suffix in suffixes
+        }
+        stored = counters.get_many(list(keys.values()))
+
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for values in combinations:
+            pairs = list(zip(label_names, values))
+            if not buckets:
+                value = stored.get(keys[(values, '')])
+                if value is not None:
+                    lines.append(f"{name}{_format_labels(pairs)} {value}")
+                continue
+
+            counts = [stored.get(keys[(values, f'bucket{i}')], 0) for i in range(len(buckets))]
+            total = sum(counts) + stored.get(keys[(values, 'bucketinf')], 0)
+            if not total:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(pairs + [('le', f'{bound:g}')])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(pairs + [('le', '+Inf')])} {total}")
+            lines.append(f"{name}_sum{_format_labels(pairs)} {stored.get(keys[(values, 'sum')], 0) / SUM_SCALE:g}")
+            lines.append(f"{name}_count{_format_labels(pairs)} {total}")
+    return '\n'.join(lines) + '\n'
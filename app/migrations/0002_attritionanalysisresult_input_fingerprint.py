@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attritionanalysisresult',
+            name='input_fingerprint',
+            field=models.CharField(blank=True, default='', help_text='Hash of the inputs and rule version that produced this result.', max_length=32),
+        ),
+    ]
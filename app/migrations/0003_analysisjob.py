@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_attritionanalysisresult_input_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('Queued', 'Queued'), ('Running', 'Running'), ('Completed', 'Completed'), ('Failed', 'Failed')], default='Queued', max_length=10)),
+                ('phase', models.CharField(blank=True, max_length=20)),
+                ('incremental', models.BooleanField(default=False)),
+                ('workers', models.PositiveIntegerField(default=1)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('stats', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
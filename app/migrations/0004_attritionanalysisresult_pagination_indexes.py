@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-18 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_analysisjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attritionanalysisresult',
+            index=models.Index(fields=['certainty_score', 'id'], name='result_certainty_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attritionanalysisresult',
+            index=models.Index(fields=['risk_level', 'id'], name='result_risk_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attritionanalysisresult',
+            index=models.Index(fields=['risk_level', 'certainty_score', 'id'], name='result_risk_certainty_idx'),
+        ),
+    ]
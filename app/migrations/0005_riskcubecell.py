@@ -0,0 +1,56 @@
+# Generated by Django 5.2 on 2026-10-18 19:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def build_risk_cube(apps, schema_editor):
+    # Same aggregation as app.cube.rebuild_risk_cube, on the historical models
+    Student = apps.get_model('app', 'Student')
+    RiskCubeCell = apps.get_model('app', 'RiskCubeCell')
+    dimensions = ('faculty_id', 'course_id', 'academic_year', 'gender', 'financial_status')
+    rows = (
+        Student.objects
+        .values(*dimensions, risk=Coalesce('attrition_result__risk_level', Value('')))
+        .annotate(students=Count('id'), certainty=Coalesce(Sum('attrition_result__certainty_score'), Value(0.0)))
+        .order_by()
+    )
+    RiskCubeCell.objects.bulk_create([
+        RiskCubeCell(
+            **{field: row[field] for field in dimensions},
+            risk_level=row['risk'],
+            student_count=row['students'],
+            certainty_sum=row['certainty'],
+        )
+        for row in rows
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_attritionanalysisresult_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiskCubeCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('academic_year', models.PositiveIntegerField()),
+                ('gender', models.CharField(max_length=10)),
+                ('financial_status', models.CharField(max_length=15)),
+                ('risk_level', models.CharField(blank=True, max_length=10)),
+                ('student_count', models.IntegerField(default=0)),
+                ('certainty_sum', models.FloatField(default=0)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.course')),
+                ('faculty', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.faculty')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('faculty', 'course', 'academic_year', 'gender', 'financial_status', 'risk_level'), name='unique_risk_cube_cell')],
+            },
+        ),
+        migrations.RunPython(build_risk_cube, migrations.RunPython.noop),
+    ]
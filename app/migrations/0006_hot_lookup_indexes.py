@@ -0,0 +1,57 @@
+# Generated by Django 5.2 on 2026-10-18 19:31
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_records(apps, schema_editor):
+    # The unique constraint can't be added while a student has several records for one year, and
+    # which of them is right is not for a migration to guess: list the conflicts and stop
+    AcademicRecord = apps.get_model('app', 'AcademicRecord')
+    duplicates = list(
+        AcademicRecord.objects.values('student_id', 'year')
+        .annotate(records=Count('id'))
+        .filter(records__gt=1)
+        .order_by('student_id', 'year')
+    )
+    if duplicates:
+        conflicts = '\n'.join(
+            f"  student {row['student_id']}, year {row['year']}: {row['records']} records" for row in duplicates[:50]
+        )
+        more = f"\n  ... and {len(duplicates) - 50} more" if len(duplicates) > 50 else ''
+        raise RuntimeError(
+            f"{len(duplicates)} (student, year) pairs have more than one academic record:\n{conflicts}{more}\n"
+            "Resolve them (python manage.py dedupe_academic_records lists them and, with --delete, "
+            "keeps the newest of each), then migrate again."
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_riskcubecell'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_records, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='analysisjob',
+            index=models.Index(fields=['status', 'created_at'], name='job_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['academic_year'], name='student_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['gender'], name='student_gender_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['financial_status'], name='student_finance_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='academicrecord',
+            constraint=models.UniqueConstraint(fields=('student', 'year'), name='unique_student_record_year'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 19:34
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_gpa_aggregates(apps, schema_editor):
+    # Same UPDATE as app.aggregates.refresh_gpa_aggregates, on the historical models
+    Student = apps.get_model('app', 'Student')
+    AcademicRecord = apps.get_model('app', 'AcademicRecord')
+    records = AcademicRecord.objects.filter(student=OuterRef('pk')).order_by().values('student')
+    Student.objects.update(
+        avg_gpa=Coalesce(Subquery(records.annotate(value=Avg('gpa')).values('value')), Value(0.0)),
+        record_count=Coalesce(Subquery(records.annotate(value=Count('id')).values('value')), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='avg_gpa',
+            field=models.FloatField(default=0.0, help_text='Average GPA over all academic records (0 without records).'),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='record_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_gpa_aggregates, migrations.RunPython.noop),
+    ]
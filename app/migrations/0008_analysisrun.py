@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 19:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_student_gpa_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('Running', 'Running'), ('Interrupted', 'Interrupted'), ('Completed', 'Completed'), ('Abandoned', 'Abandoned')], default='Running', max_length=12)),
+                ('rule_version', models.PositiveIntegerField()),
+                ('incremental', models.BooleanField(default=False)),
+                ('exact', models.BooleanField(default=False)),
+                ('last_student_id', models.BigIntegerField(blank=True, null=True)),
+                ('chunks_committed', models.PositiveIntegerField(default=0)),
+                ('attempts', models.PositiveIntegerField(default=1)),
+                ('stats', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'started_at'], name='run_status_started_idx')],
+            },
+        ),
+    ]
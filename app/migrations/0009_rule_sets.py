@@ -0,0 +1,97 @@
+# Generated by Django 5.2 on 2026-10-18 20:02
+
+from django.db import migrations, models
+
+# Frozen copy of app.rules.DEFAULT_RULE_SPEC as of this migration: later edits to the module
+# must not change what version 1 was
+DEFAULT_RULE_SPEC = {
+    'variables': {
+        'gpa': {
+            'input': 'avg_gpa',
+            'universe': [0, 5, 0.1],  # min, max, step of the sampled membership functions
+            'resolution': 0.001,      # Inputs are rounded to this step for the score tables (exact=True interpolates)
+            'sets': {
+                'low': {'shape': 'trimf', 'points': [0, 0, 2.0]},
+                'medium': {'shape': 'trimf', 'points': [1.8, 3.0, 3.8]},
+                'high': {'shape': 'trimf', 'points': [3.7, 4.3, 5.0]},
+            },
+        },
+        'finance': {
+            'input': 'finance_score',
+            'universe': [0, 10, 1],
+            'resolution': 1,
+            'sets': {
+                'struggling': {'shape': 'trimf', 'points': [0, 0, 3]},
+                'good': {'shape': 'trimf', 'points': [2, 5, 7]},
+                'scholarship': {'shape': 'trimf', 'points': [6, 9, 10]},
+            },
+        },
+        'complexity': {
+            'input': 'complexity_level',
+            'universe': [0, 10, 1],
+            'resolution': 1,
+            'sets': {
+                'easy': {'shape': 'trimf', 'points': [0, 0, 3]},
+                'moderate': {'shape': 'trimf', 'points': [2, 5, 8]},
+                'hard': {'shape': 'trimf', 'points': [7, 10, 10]},
+            },
+        },
+    },
+    'rules': {
+        'High': [
+            {'variable': 'gpa', 'set': 'low', 'weight': 0.6},
+            {'variable': 'finance', 'set': 'struggling', 'weight': 0.25},
+            {'variable': 'complexity', 'set': 'hard', 'weight': 0.15},
+        ],
+        'Medium': [
+            {'variable': 'gpa', 'set': 'medium', 'weight': 0.4},
+            {'variable': 'finance', 'set': 'good', 'weight': 0.3},
+            {'variable': 'complexity', 'set': 'moderate', 'weight': 0.3},
+        ],
+        'Low': [
+            {'variable': 'gpa', 'set': 'high', 'weight': 0.6},
+            {'variable': 'finance', 'set': 'scholarship', 'weight': 0.25},
+            {'variable': 'complexity', 'set': 'easy', 'weight': 0.15},
+        ],
+    },
+    'borderline': {'margin': 0.12, 'tie_break': 'more_severe'},
+}
+
+
+def create_default_rule_set(apps, schema_editor):
+    # Version 1 is the rule set the analysis shipped with (immutable, like every saved version)
+    RuleSet = apps.get_model('app', 'RuleSet')
+    RuleSet.objects.get_or_create(
+        version=1,
+        defaults={'description': 'Original membership functions and weights', 'spec': DEFAULT_RULE_SPEC, 'is_active': True},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_analysisrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attritionanalysisresult',
+            name='rule_version',
+            field=models.PositiveIntegerField(default=1, help_text='Version of the RuleSet that produced this result.'),
+        ),
+        migrations.CreateModel(
+            name='RuleSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(unique=True)),
+                ('description', models.CharField(blank=True, max_length=200)),
+                ('spec', models.JSONField()),
+                ('is_active', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('is_active',), name='single_active_rule_set')],
+            },
+        ),
+        migrations.RunPython(create_default_rule_set, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_analysisjob_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='student',
+            name='student_year_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='student',
+            name='student_gender_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='student',
+            name='student_finance_idx',
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['academic_year', 'id'], name='student_year_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['gender', 'id'], name='student_gender_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['financial_status', 'id'], name='student_finance_id_idx'),
+        ),
+    ]
@@ -1,4 +1,7 @@
-from django.db import models
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.utils import timezone
 
 # Create your models here.
 # 1. Faculty Model this model will store all infomation about the faculty
@@ -69,6 +72,31 @@ class Student(models.Model):
     financial_status = models.CharField(max_length=15, choices=FINANCIAL_STATUS_CHOICES, default=GOOD)
     enrollment_status = models.CharField(max_length=15, choices=ENROLLMENT_STATUS_CHOICES, default=ACTIVE)
     gpa = models.FloatField(default=1.0)  # GPA added here
+    # Denormalized from academic_records; kept exact by the AcademicRecord signals and
+    # recomputable with the repair_gpa_aggregates command. Never written by Student.save()
+    avg_gpa = models.FloatField(default=0.0, help_text="Average GPA over all academic records (0 without records).")
+    record_count = models.PositiveIntegerField(default=0)
+
+    AGGREGATE_FIELDS = ('avg_gpa', 'record_count')
+
+    class Meta:
+        # Dimensions the dashboard slices and analysis subsets filter on; students are read in id
+        # order (keyset chunks: WHERE dimension = ... AND id > ... ORDER BY id), so id comes second
+        indexes = [
+            models.Index(fields=['academic_year', 'id'], name='student_year_id_idx'),
+            models.Index(fields=['gender', 'id'], name='student_gender_id_idx'),
+            models.Index(fields=['financial_status', 'id'], name='student_finance_id_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # An instance loaded before its records changed holds stale aggregates; don't write them back
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.AGGREGATE_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
@@ -79,6 +107,19 @@ class AcademicRecord(models.Model):
     year = models.PositiveIntegerField()
     notes = models.TextField(blank=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so moving a record to another student refreshes the old student's aggregates too
+        instance._loaded_student_id = instance.__dict__.get('student_id')
+        return instance
+
+    class Meta:
+        # One record per student per year; also the index behind the signal's get(student=, year=)
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'year'], name='unique_student_record_year'),
+        ]
+
     def __str__(self):
         return f"Record for {self.student.first_name} {self.student.last_name} - Year {self.year}"
 
@@ -100,16 +141,199 @@ class AttritionAnalysisResult(models.Model):
     risk_level = models.CharField(max_length=10, choices=RISK_LEVEL_CHOICES)
     reason = models.TextField(blank=True)
     certainty_score = models.FloatField(help_text="Certainty percentage between 0 and 100.")
+    input_fingerprint = models.CharField(max_length=32, blank=True, default='', help_text="Hash of the inputs and rule version that produced this result.")
+    rule_version = models.PositiveIntegerField(default=1, help_text="Version of the RuleSet that produced this result.")
+
+    class Meta:
+        # Keyset pagination on the results page walks (sort column, id)
+        indexes = [
+            models.Index(fields=['certainty_score', 'id'], name='result_certainty_id_idx'),
+            models.Index(fields=['risk_level', 'id'], name='result_risk_id_idx'),
+            models.Index(fields=['risk_level', 'certainty_score', 'id'], name='result_risk_certainty_idx'),
+        ]
 
     def __str__(self):
         return f"Risk Analysis for {self.student.first_name} {self.student.last_name}"
 
+# 6. Analysis Job Model, a DB-backed queue entry for batch analysis runs started from the web
+class AnalysisJob(models.Model):
+    QUEUED = 'Queued'
+    RUNNING = 'Running'
+    COMPLETED = 'Completed'
+    FAILED = 'Failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    ]
+    ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    phase = models.CharField(max_length=20, blank=True)  # fetch, score, persist...
+    incremental = models.BooleanField(default=False)
+    workers = models.PositiveIntegerField(default=1)
+    processed = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    stats = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)  # Times a worker has claimed the job
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # Last sign of life from the running worker
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # Workers claim the oldest queued job: WHERE status = ... ORDER BY created_at
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='job_status_created_idx'),
+        ]
+
+    @property
+    def elapsed_seconds(self):
+        if not self.started_at:
+            return 0.0
+        end = self.finished_at or timezone.now()
+        return (end - self.started_at).total_seconds()
+
+    def __str__(self):
+        return f"Analysis job #{self.pk} ({self.status})"
+
+# 7. Risk Cube Model, pre-aggregated student counts and certainty sums per dimension combination,
+#    so dashboard slices never touch the per-student tables
+class RiskCubeCell(models.Model):
+    NOT_ANALYSED = ''  # risk_level of students without an AttritionAnalysisResult yet
+
+    faculty = models.ForeignKey(Faculty, on_delete=models.CASCADE)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    academic_year = models.PositiveIntegerField()
+    gender = models.CharField(max_length=10)
+    financial_status = models.CharField(max_length=15)
+    risk_level = models.CharField(max_length=10, blank=True)
+    student_count = models.IntegerField(default=0)
+    certainty_sum = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['faculty', 'course', 'academic_year', 'gender', 'financial_status', 'risk_level'],
+                name='unique_risk_cube_cell',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.faculty_id}/{self.course_id}/{self.academic_year}/{self.gender}/{self.financial_status}/{self.risk_level}: {self.student_count}"
+
+# 8. Analysis Run Model, the checkpoint of a batch run over the whole cohort: every student up to
+#    last_student_id has committed results, so an interrupted run resumes from there
+class AnalysisRun(models.Model):
+    RUNNING = 'Running'
+    INTERRUPTED = 'Interrupted'
+    COMPLETED = 'Completed'
+    ABANDONED = 'Abandoned'
+    STATUS_CHOICES = [
+        (RUNNING, 'Running'),
+        (INTERRUPTED, 'Interrupted'),  # Failed partway; resumable
+        (COMPLETED, 'Completed'),  # Every chunk committed: the results are consistent
+        (ABANDONED, 'Abandoned'),  # Superseded by a fresh run (e.g. after a rule change)
+    ]
+    RESUMABLE_STATUSES = (RUNNING, INTERRUPTED)
+
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default=RUNNING)
+    rule_version = models.PositiveIntegerField()
+    incremental = models.BooleanField(default=False)
+    exact = models.BooleanField(default=False)
+    last_student_id = models.BigIntegerField(null=True, blank=True)  # Cursor: None until the first chunk commits
+    chunks_committed = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=1)
+    stats = models.JSONField(default=dict, blank=True)  # Rows inserted/updated/skipped and transitions so far
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Moves with every checkpoint
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # Runs look up the latest resumable run: WHERE status IN (...) ORDER BY started_at
+        indexes = [
+            models.Index(fields=['status', 'started_at'], name='run_status_started_idx'),
+        ]
+
+    @property
+    def is_consistent(self):
+        return self.status == self.COMPLETED
+
+    def __str__(self):
+        return f"Analysis run #{self.pk} ({self.status}, rules v{self.rule_version})"
+
+# 9. Rule Set Model, a versioned fuzzy rule specification (variables, fuzzy sets, weighted rules and
+#    the borderline policy; see app/rules.py). Saved versions never change: a tuning change is a new version
+class RuleSet(models.Model):
+    DEFAULT_VERSION = 1  # Built into app/rules.py; used when no rule set is active
+    ACTIVE_VERSION_KEY = 'rules:active_version'
+
+    version = models.PositiveIntegerField(unique=True)
+    description = models.CharField(max_length=200, blank=True)
+    spec = models.JSONField()
+    is_active = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['is_active'], condition=models.Q(is_active=True), name='single_active_rule_set'),
+        ]
+
+    def clean(self):
+        from .rules import validate_spec  # Loads NumPy; only needed when a rule set is edited
+        validate_spec(self.spec)
+        if self.pk:
+            saved = RuleSet.objects.filter(pk=self.pk).values('version', 'spec').first()
+            if saved and (saved['version'], saved['spec']) != (self.version, self.spec):
+                raise ValidationError("Rule set versions are immutable; save the change as a new version.")
+
+    def activate(self):
+        """
+        Makes this the rule set used by new analysis runs.
+        """
+        with transaction.atomic():
+            RuleSet.objects.filter(is_active=True).exclude(pk=self.pk).update(is_active=False)
+            RuleSet.objects.filter(pk=self.pk).update(is_active=True)
+            RuleSet.forget_active_version()
+        self.is_active = True
+
+    @classmethod
+    def forget_active_version(cls):
+        """
+        Drops the cached active version now, for the rest of the current transaction, and again
+        once it commits: until then other requests still read (and may re-cache) the old one.
+        """
+        cache.delete(cls.ACTIVE_VERSION_KEY)
+        transaction.on_commit(lambda: cache.delete(cls.ACTIVE_VERSION_KEY))
+
+    @classmethod
+    def active_version(cls):
+        """
+        Version of the active rule set (DEFAULT_VERSION when none is active), cached until a rule set changes.
+        """
+        version = cache.get(cls.ACTIVE_VERSION_KEY)
+        if version is None:
+            version = cls.objects.filter(is_active=True).values_list('version', flat=True).first() or cls.DEFAULT_VERSION
+            cache.set(cls.ACTIVE_VERSION_KEY, version, timeout=None)
+        return version
+
+    def __str__(self):
+        return f"Rule set v{self.version}" + (" (active)" if self.is_active else "")
+
 '''
 Summary of What This Code Does
 Faculty and Course are linked.
 Student is linked to Faculty and Course.
 Student has multiple AcademicRecords (one for each academic year).
+Student also keeps avg_gpa and record_count over its AcademicRecords, maintained by signals.
 Student has one AttritionAnalysisResult (one-to-one link).
+AnalysisJob queues batch analysis runs and tracks their progress.
+RiskCubeCell holds pre-aggregated risk counts for the dashboards.
+AnalysisRun checkpoints batch runs so an interrupted run resumes after its last committed chunk.
+RuleSet stores versioned fuzzy rules; each AttritionAnalysisResult records the version that produced it.
 Choices fields (dropdowns) are used for controlled inputs like gender, financial status, risk level, etc.
 Easy __str__ methods for better display in admin panel.
  
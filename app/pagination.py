@@ -0,0 +1,84 @@
+"""
+Keyset (cursor) pagination: each page continues from the (sort value, id) of the last row shown,
+so fetching a page costs the same whatever its position, unlike OFFSET which scans every skipped row.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+def encode_cursor(value, pk):
+    return base64.urlsafe_b64encode(json.dumps([value, pk]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Returns the (value, pk) pair stored in a cursor, or None if it is missing or malformed.
+    Cursors come from the query string, so anything but an integer pk and a string, number or
+    null sort value is rejected rather than passed on to the query.
+    """
+    if not cursor:
+        return None
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    if type(pk) is not int or not (value is None or type(value) in (str, int, float)):
+        return None
+    return value, pk
+
+
+def _decode_for_field(cursor, field):
+    # decode_cursor, also rejecting sort values the sort field can't take (e.g. text for a float)
+    cursor = decode_cursor(cursor)
+    if cursor is None or (cursor[0] is None and not field.null):
+        return None
+    try:
+        return field.to_python(cursor[0]), cursor[1]
+    except ValidationError:
+        return None
+
+
+def keyset_page(queryset, sort_field, descending=False, after=None, before=None, page_size=50):
+    """
+    Returns one page of `queryset` ordered by (sort_field, pk) as a dict with the rows and the
+    cursors for the next and previous pages (None at either end).
+    `sort_field` must be a concrete field of the model, ideally indexed together with the pk.
+    """
+    field = queryset.model._meta.get_field(sort_field)
+    cursor = _decode_for_field(before, field)
+    backwards = cursor is not None
+    if not backwards:
+        cursor = _decode_for_field(after, field)
+
+    # Walking backwards flips the ordering; the rows are put back in display order below
+    reverse = descending != backwards
+    lookup = 'lt' if reverse else 'gt'
+    ordering = [f'-{sort_field}', '-pk'] if reverse else [sort_field, 'pk']
+
+    if cursor is not None:
+        value, pk = cursor
+        queryset = queryset.filter(
+            Q(**{f'{sort_field}__{lookup}': value}) | Q(**{sort_field: value, f'pk__{lookup}': pk})
+        )
+
+    rows = list(queryset.order_by(*ordering)[:page_size + 1])  # One extra row tells us if there is more
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    if not rows:
+        return {'items': rows, 'next_cursor': None, 'prev_cursor': None}
+
+    first, last = rows[0], rows[-1]
+    has_next = has_more if not backwards else True
+    has_prev = (cursor is not None) if not backwards else has_more
+    return {
+        'items': rows,
+        'next_cursor': encode_cursor(getattr(last, sort_field), last.pk) if has_next else None,
+        'prev_cursor': encode_cursor(getattr(first, sort_field), first.pk) if has_prev else None,
+    }
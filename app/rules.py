@@ -0,0 +1,325 @@
+"""
+Declarative, versioned fuzzy rule sets (stored as RuleSet rows) and their compiled evaluators.
+A spec names the input variables (cohort column, universe, lookup resolution and triangular or
+trapezoidal fuzzy sets), one weighted rule per risk level and the borderline tie-break policy.
+Each version is compiled once per process. Rules are weighted sums of memberships, so every variable
+compiles to a table of its contribution to each risk level's score: scoring is one lookup and add
+per variable, then the ranking. Another variable costs one more lookup, not a bigger table.
+"""
+import copy
+import functools
+
+import numpy as np
+from django.core.exceptions import ValidationError
+
+from .models import RuleSet
+
+RISK_LEVELS = ('High', 'Medium', 'Low')  # Most severe first; the score columns follow this order
+INPUT_COLUMNS = ('avg_gpa', 'finance_score', 'complexity_level')  # Columns built by annalysis.fetch_student_data
+SET_SHAPES = {'trimf': 3, 'trapmf': 4}  # Membership shape -> number of breakpoints
+TIE_BREAK_POLICIES = (
+    'more_severe',  # Borderline students take the more severe of the two closest levels
+    'less_severe',  # ... or the less severe one
+    'top_score',    # No borderline handling: the top score wins
+)
+MAX_GRID_POINTS = 1_000_000  # Per variable: (max - min) / resolution
+
+# Version 1: the rules the analysis shipped with
+DEFAULT_RULE_SPEC = {
+    'variables': {
+        'gpa': {
+            'input': 'avg_gpa',
+            'universe': [0, 5, 0.1],  # min, max, step of the sampled membership functions
+            'resolution': 0.001,      # Inputs are rounded to this step for the score tables (exact=True interpolates)
+            'sets': {
+                'low': {'shape': 'trimf', 'points': [0, 0, 2.0]},
+                'medium': {'shape': 'trimf', 'points': [1.8, 3.0, 3.8]},
+                'high': {'shape': 'trimf', 'points': [3.7, 4.3, 5.0]},
+            },
+        },
+        'finance': {
+            'input': 'finance_score',
+            'universe': [0, 10, 1],
+            'resolution': 1,
+            'sets': {
+                'struggling': {'shape': 'trimf', 'points': [0, 0, 3]},
+                'good': {'shape': 'trimf', 'points': [2, 5, 7]},
+                'scholarship': {'shape': 'trimf', 'points': [6, 9, 10]},
+            },
+        },
+        'complexity': {
+            'input': 'complexity_level',
+            'universe': [0, 10, 1],
+            'resolution': 1,
+            'sets': {
+                'easy': {'shape': 'trimf', 'points': [0, 0, 3]},
+                'moderate': {'shape': 'trimf', 'points': [2, 5, 8]},
+                'hard': {'shape': 'trimf', 'points': [7, 10, 10]},
+            },
+        },
+    },
+    'rules': {
+        'High': [
+            {'variable': 'gpa', 'set': 'low', 'weight': 0.6},
+            {'variable': 'finance', 'set': 'struggling', 'weight': 0.25},
+            {'variable': 'complexity', 'set': 'hard', 'weight': 0.15},
+        ],
+        'Medium': [
+            {'variable': 'gpa', 'set': 'medium', 'weight': 0.4},
+            {'variable': 'finance', 'set': 'good', 'weight': 0.3},
+            {'variable': 'complexity', 'set': 'moderate', 'weight': 0.3},
+        ],
+        'Low': [
+            {'variable': 'gpa', 'set': 'high', 'weight': 0.6},
+            {'variable': 'finance', 'set': 'scholarship', 'weight': 0.25},
+            {'variable': 'complexity', 'set': 'easy', 'weight': 0.15},
+        ],
+    },
+    'borderline': {'margin': 0.12, 'tie_break': 'more_severe'},
+}
+
+# -----------------------------------------
+# Validation
+# -----------------------------------------
+
+def validate_spec(spec):
+    """
+    Checks a rule spec's structure and raises ValidationError listing every problem found.
+    """
+    errors = []
+    variables = spec.get('variables') if isinstance(spec, dict) else None
+    if not isinstance(variables, dict) or not variables:
+        raise ValidationError("The spec needs a non-empty 'variables' mapping.")
+
+    for name, variable in variables.items():
+        if not isinstance(variable, dict):
+            errors.append(f"{name}: must be a mapping.")
+            continue
+        if variable.get('input') not in INPUT_COLUMNS:
+            errors.append(f"{name}: input must be one of {', '.join(INPUT_COLUMNS)}.")
+        try:
+            low, high, step = (float(value) for value in variable['universe'])
+            resolution = float(variable['resolution'])
+        except (KeyError, TypeError, ValueError):
+            errors.append(f"{name}: needs a numeric universe [min, max, step] and resolution.")
+            continue
+        if high <= low or step <= 0 or resolution <= 0:
+            errors.append(f"{name}: universe max must exceed min, and step and resolution must be positive.")
+        elif (high - low) / resolution > MAX_GRID_POINTS:
+            errors.append(f"{name}: resolution is too fine (over {MAX_GRID_POINTS} points).")
+        sets = variable.get('sets')
+        if not isinstance(sets, dict) or not sets:
+            errors.append(f"{name}: needs a non-empty 'sets' mapping.")
+            continue
+        for set_name, fuzzy_set in sets.items():
+            if not isinstance(fuzzy_set, dict):
+                errors.append(f"{name}.{set_name}: must be a mapping.")
+                continue
+            shape, points = fuzzy_set.get('shape'), fuzzy_set.get('points')
+            size = SET_SHAPES.get(shape) if isinstance(shape, str) else None
+            if size is None:
+                errors.append(f"{name}.{set_name}: shape must be one of {', '.join(SET_SHAPES)}.")
+            elif not isinstance(points, list) or len(points) != size or not all(_is_number(point) for point in points):
+                errors.append(f"{name}.{set_name}: {shape} needs {size} numeric points.")
+            elif points != sorted(points) or points[0] < low or points[-1] > high:
+                errors.append(f"{name}.{set_name}: points must be ascending and inside the universe.")
+
+    rules = spec.get('rules')
+    if not isinstance(rules, dict) or set(rules) != set(RISK_LEVELS):
+        errors.append(f"rules must have exactly one entry per risk level ({', '.join(RISK_LEVELS)}).")
+    else:
+        for level, terms in rules.items():
+            if not isinstance(terms, list) or not terms:
+                errors.append(f"rules.{level}: needs a non-empty list of terms.")
+                continue
+            for term in terms:
+                if not isinstance(term, dict):
+                    errors.append(f"rules.{level}: each term must be a mapping.")
+                    continue
+                variable = variables.get(term.get('variable')) if isinstance(term.get('variable'), str) else None
+                sets = variable.get('sets') if isinstance(variable, dict) else None
+                if not isinstance(sets, dict) or not isinstance(term.get('set'), str) or term['set'] not in sets:
+                    errors.append(f"rules.{level}: unknown variable or set {term.get('variable')}.{term.get('set')}.")
+                if not _is_number(term.get('weight')) or term['weight'] < 0:
+                    errors.append(f"rules.{level}: weights must be non-negative numbers.")
+
+    borderline = spec.get('borderline', {})
+    if not isinstance(borderline, dict):
+        errors.append("borderline must be a mapping with a margin and a tie_break.")
+    else:
+        if not _is_number(borderline.get('margin')) or borderline['margin'] < 0:
+            errors.append("borderline.margin must be a non-negative number.")
+        if borderline.get('tie_break') not in TIE_BREAK_POLICIES:
+            errors.append(f"borderline.tie_break must be one of {', '.join(TIE_BREAK_POLICIES)}.")
+
+    if errors:
+        raise ValidationError(errors)
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+# -----------------------------------------
+# Compiled evaluator
+# -----------------------------------------
+
+class CompiledRuleSet:
+    """
+    Evaluator for one rule set version. For each variable used by a rule it keeps the sampled
+    membership functions and a score table: the variable's weighted contribution to each risk level
+    at every `resolution` step of its universe.
+    """
+    def __init__(self, version, spec):
+        import skfuzzy as fuzz  # Only needed to sample the membership functions
+
+        validate_spec(spec)
+        self.version = self.rule_version = version
+        self.margin = spec['borderline']['margin']
+        self.tie_break = spec['borderline']['tie_break']
+        self.variables = []
+
+        for name, variable in spec['variables'].items():
+            terms = [
+                (RISK_LEVELS.index(level), term['set'], term['weight'])
+                for level, level_terms in spec['rules'].items()
+                for term in level_terms if term['variable'] == name
+            ]
+            if not terms:
+                continue  # Declared but unused
+            low, high, step = (float(value) for value in variable['universe'])
+            resolution = float(variable['resolution'])
+            universe = np.arange(low, high + step / 2, step)
+            memberships = {
+                set_name: getattr(fuzz, fuzzy_set['shape'])(universe, fuzzy_set['points'])
+                for set_name, fuzzy_set in variable['sets'].items()
+            }
+            grid = np.round(low + np.arange(round((high - low) / resolution) + 1) * resolution, 10)
+            self.variables.append({
+                'input': variable['input'],
+                'universe': universe,
+                'memberships': memberships,
+                'terms': terms,
+                'low': low,
+                'high': high,
+                'resolution': resolution,
+                'table': self._contributions(grid, universe, memberships, terms),
+            })
+
+    @staticmethod
+    def _contributions(values, universe, memberships, terms):
+        # Weighted membership of each value in every risk level's rule, as a (levels, n) array
+        scores = np.zeros((len(RISK_LEVELS), len(values)))
+        for level, set_name, weight in terms:
+            scores[level] += weight * np.interp(values, universe, memberships[set_name], left=0.0, right=0.0)
+        return scores
+
+    def table_error_bound(self):
+        """
+        The largest difference between a table and an exact rule score, per risk level. Rounding
+        moves an input by at most half its variable's resolution, and each term's membership
+        changes by at most its steepest slope times that.
+        """
+        bound = np.zeros(len(RISK_LEVELS))
+        for variable in self.variables:
+            for level, set_name, weight in variable['terms']:
+                slopes = np.diff(variable['memberships'][set_name]) / np.diff(variable['universe'])
+                bound[level] += weight * np.abs(slopes).max() * variable['resolution'] / 2
+        return bound
+
+    def with_borderline(self, borderline):
+        """
+        A copy with another borderline policy ({'margin', 'tie_break'}), sharing the compiled tables.
+        """
+        rule_set = copy.copy(self)
+        rule_set.margin, rule_set.tie_break = borderline['margin'], borderline['tie_break']
+        return rule_set
+
+    def risk_scores(self, columns, exact=False):
+        """
+        The (3, n) High/Medium/Low rule scores for cohort columns (a dict of equal-length arrays
+        keyed by input column). Inputs are rounded to each variable's resolution unless exact=True;
+        rounding moves each score by at most table_error_bound(). In both modes an input outside
+        its variable's universe is clipped to the nearest end, so it scores like the most extreme
+        value the rule set describes (a GPA above the scale as the top GPA) rather than belonging to
+        no fuzzy set at all.
+        """
+        scores = None
+        for variable in self.variables:
+            values = np.clip(np.asarray(columns[variable['input']], dtype=float), variable['low'], variable['high'])
+            if exact:
+                contribution = self._contributions(values, variable['universe'], variable['memberships'], variable['terms'])
+            else:
+                index = np.rint((values - variable['low']) / variable['resolution'])
+                contribution = np.take(variable['table'], index.astype(np.intp), axis=1)
+            scores = contribution if scores is None else scores + contribution
+        return scores
+
+    def score(self, columns, exact=False):
+        """
+        Scores cohort columns; returns an array of risk levels and an array of certainty percentages.
+        """
+        return self.rank(self.risk_scores(columns, exact))
+
+    def score_one(self, inputs, exact=False):
+        """
+        Scores a single student from a dict of input values; returns (risk_level, certainty).
+        """
+        risk_levels, certainties = self.score({name: [value] for name, value in inputs.items()}, exact)
+        return str(risk_levels[0]), int(certainties[0])
+
+    def rank(self, scores):
+        """
+        Picks each student's risk level and certainty from their rule scores, applying the borderline policy.
+        """
+        risk_index, certainty = self.rank_indices(scores)
+        return np.array(RISK_LEVELS)[risk_index], certainty
+
+    def rank_indices(self, scores):
+        """
+        As rank(), with each risk level as its index into RISK_LEVELS (for counting without string compares).
+        """
+        # Top two scores per student by selection (no sort, no arithmetic, so no rounding);
+        # on ties the more severe level ranks first, as a stable sort over High, Medium, Low would
+        high, medium, low = scores
+        high_or_medium = np.maximum(high, medium)
+        top_score = np.maximum(high_or_medium, low)
+        runner_up = np.maximum(np.minimum(high, medium), np.minimum(high_or_medium, low))
+        first = np.where(high == top_score, 0, np.where(medium == top_score, 1, 2)).astype(np.int8)
+        second = np.where(
+            (first != 0) & (high == runner_up), 0, np.where((first != 1) & (medium == runner_up), 1, 2)
+        ).astype(np.int8)
+
+        risk_index = first
+        certainty = (top_score * 100).astype(int)  # Convert to percentage
+
+        if self.tie_break != 'top_score':
+            # Borderline results, where the two closest levels are within the margin, go to the policy's pick
+            borderline = (top_score - runner_up) < self.margin
+            pick = np.minimum if self.tie_break == 'more_severe' else np.maximum
+            risk_index = np.where(borderline, pick(risk_index, second), risk_index)
+            certainty = np.where(borderline, ((top_score + runner_up) / 2 * 100).astype(int), certainty)
+
+        return risk_index, certainty
+
+# -----------------------------------------
+# Loading
+# -----------------------------------------
+
+@functools.lru_cache(maxsize=None)
+def get_rule_set(version):
+    """
+    Returns the compiled evaluator for a rule version, loading and compiling it on first use.
+    Versions are immutable once saved, so the evaluator is kept for the life of the process.
+    """
+    return CompiledRuleSet(version, load_spec(version))
+
+def load_spec(version):
+    """
+    The stored spec of a rule version (DEFAULT_RULE_SPEC for the default version if it was never saved).
+    Raises ValueError for an unknown version.
+    """
+    spec = RuleSet.objects.filter(version=version).values_list('spec', flat=True).first()
+    if spec is None:
+        if version != RuleSet.DEFAULT_VERSION:
+            raise ValueError(f"No rule set with version {version}")
+        spec = DEFAULT_RULE_SPEC
+    return spec
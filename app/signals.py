@@ -1,8 +1,21 @@
-from django.db.models.signals import post_save
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
-from .models import Student, AcademicRecord
-from .annalysis import run_attrition_analysis
+from .models import Faculty, Course, Student, AcademicRecord, AttritionAnalysisResult, RuleSet
+from .aggregates import refresh_gpa_aggregates
+from .caching import bump_data_version
+from .cube import add_student_to_cube, move_student_in_cube, remove_students_from_cube, snapshot_students
 import datetime
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Students waiting for the debounce window to close (shared by all threads)
+_debounced_ids = set()
+_debounce_lock = threading.Lock()
+_debounce_timer = None
 
 @receiver(post_save, sender=Student)
 def create_or_update_academic_record_for_student(sender, instance, created, **kwargs):
@@ -16,7 +29,9 @@ def create_or_update_academic_record_for_student(sender, instance, created, **kw
             year=current_year,
             notes='Initial record from student creation'
         )
-        print(f"Created AcademicRecord for {instance.first_name} {instance.last_name} (GPA: {instance.gpa})")
+        logger.debug(f"Created AcademicRecord for student {instance.pk} (GPA: {instance.gpa})")
+        # Count the new student in the cube as not analysed yet; analysis then moves it to its risk level
+        add_student_to_cube(instance)
     else:
         try:
             academic_record = AcademicRecord.objects.get(student=instance, year=current_year)
@@ -24,7 +39,7 @@ def create_or_update_academic_record_for_student(sender, instance, created, **kw
                 old_gpa = academic_record.gpa
                 academic_record.gpa = instance.gpa
                 academic_record.save()
-                print(f"Updated GPA for {instance.first_name} {instance.last_name} from {old_gpa} to {instance.gpa}")
+                logger.debug(f"Updated GPA for student {instance.pk} from {old_gpa} to {instance.gpa}")
         except AcademicRecord.DoesNotExist:
             # If no record exists, create one
             AcademicRecord.objects.create(
@@ -33,11 +48,166 @@ def create_or_update_academic_record_for_student(sender, instance, created, **kw
                 year=current_year,
                 notes='Auto-created record due to missing academic record'
             )
-            print(f"Auto-created missing AcademicRecord for {instance.first_name} {instance.last_name} (GPA: {instance.gpa})")
+            logger.debug(f"Auto-created missing AcademicRecord for student {instance.pk} (GPA: {instance.gpa})")
+
+# Keep the student's cube cell in step with its dimensions (faculty, course, year, gender,
+# financial status): its stored cell is read before a save or delete, and the student is moved
+# or taken out once the write has happened
+@receiver(pre_save, sender=Student)
+@receiver(pre_delete, sender=Student)
+def snapshot_student_cube_cell(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    instance._cube_snapshot = snapshot_students(Student.objects.filter(pk=instance.pk)).get(instance.pk)
+
+
+@receiver(post_save, sender=Student)
+def move_student_cube_cell(sender, instance, created, raw=False, **kwargs):
+    before = instance.__dict__.pop('_cube_snapshot', None)
+    if before and not created:
+        move_student_in_cube(before, instance)
+
+
+@receiver(post_delete, sender=Student)
+def remove_student_cube_cell(sender, instance, **kwargs):
+    before = instance.__dict__.pop('_cube_snapshot', None)
+    if before:
+        remove_students_from_cube({instance.pk: before})
+
 
 # Automatically run analysis when AcademicRecord is created or updated
 @receiver(post_save, sender=AcademicRecord)
 def analyze_student_attrition(sender, instance, created, **kwargs):
-    # Automatically run analysis when AcademicRecord is created or updated
-    run_attrition_analysis(student=instance.student)
+    student_ids = {instance.student_id, getattr(instance, '_loaded_student_id', None)} - {None}
+    # Keep Student.avg_gpa / record_count exact, then mark the student dirty;
+    # one batch analysis runs for all of them when the transaction commits
+    refresh_gpa_aggregates(Student.objects.filter(id__in=student_ids))
+    instance._loaded_student_id = instance.student_id
+    for student_id in student_ids:
+        mark_student_for_analysis(student_id)
+
+
+@receiver(post_delete, sender=AcademicRecord)
+def forget_academic_record(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Student) or getattr(origin, 'model', None) is Student:
+        return  # The student itself is being deleted
+    refresh_gpa_aggregates(Student.objects.filter(id=instance.student_id))
+    mark_student_for_analysis(instance.student_id)
+
+
+class _CommitCallback:
+    """
+    on_commit callback that later changes in the same savepoint join (see _transaction_callback)
+    until it has run. Subclasses implement run().
+    """
+    ran = False
+
+    def __call__(self):
+        self.ran = True
+        self.run()
+
+
+def _transaction_callback(kind):
+    """
+    Returns the _CommitCallback of type `kind` registered with on_commit in the current savepoint
+    of the current transaction and not run yet, or None (always None outside a transaction).
+    Django drops the callbacks of a savepoint that rolls back, so whatever such a callback
+    collects is discarded with it.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return None
+    savepoints = set(connection.savepoint_ids)
+    return next(
+        (
+            callback for sids, callback, _ in connection.run_on_commit
+            if type(callback) is kind and sids == savepoints and not callback.ran
+        ),
+        None,
+    )
+
+
+def mark_student_for_analysis(student_id):
+    """
+    Collects a student id for analysis; the students marked in one transaction are analysed
+    together when it commits. The ids are held by the transaction's on_commit callback, so a
+    rollback discards them with it. Outside a transaction the analysis runs straight away.
+    """
+    pending = _transaction_callback(_PendingAnalysis)
+    if pending is not None:
+        pending.student_ids.add(student_id)
+    else:
+        transaction.on_commit(_PendingAnalysis({student_id}))
+
+
+class _PendingAnalysis(_CommitCallback):
+    def __init__(self, student_ids):
+        self.student_ids = student_ids
+
+    def run(self):
+        _flush_pending_students(self.student_ids)
+
+
+def _flush_pending_students(student_ids):
+    debounce = getattr(settings, 'ATTRITION_SIGNAL_DEBOUNCE_SECONDS', 0)
+    if debounce <= 0:
+        _analyse_students(student_ids)
+        return
+
+    # Hold the ids for the debounce window so commits arriving meanwhile are analysed in the same batch
+    global _debounce_timer
+    with _debounce_lock:
+        _debounced_ids.update(student_ids)
+        if _debounce_timer is None:
+            _debounce_timer = threading.Timer(debounce, _flush_debounced_students)
+            _debounce_timer.daemon = True
+            _debounce_timer.start()
+
+
+def _flush_debounced_students():
+    global _debounce_timer
+    with _debounce_lock:
+        student_ids = set(_debounced_ids)
+        _debounced_ids.clear()
+        _debounce_timer = None
+    try:
+        _analyse_students(student_ids)
+    finally:
+        connections.close_all()  # The timer thread opened its own connection
+
+
+def _analyse_students(student_ids):
+    # Imported here so web workers only load NumPy / scikit-fuzzy once a record actually changes
+    from .annalysis import run_attrition_analysis
+    run_attrition_analysis(students=Student.objects.filter(id__in=student_ids))
+
+
+
+# Any change to the data behind the dashboards and results pages invalidates their cached copies
+@receiver(post_save, sender=Faculty)
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=AcademicRecord)
+@receiver(post_save, sender=AttritionAnalysisResult)
+@receiver(post_delete, sender=Faculty)
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=AcademicRecord)
+@receiver(post_delete, sender=AttritionAnalysisResult)
+def invalidate_cached_views(sender, **kwargs):
+    # Bumped only once the change is committed, or a request in between would cache the old
+    # rows under the new version; one bump per transaction covers all of its changes
+    if _transaction_callback(_BumpDataVersion) is None:
+        transaction.on_commit(_BumpDataVersion())  # Runs straight away outside a transaction
+
+
+class _BumpDataVersion(_CommitCallback):
+    def run(self):
+        bump_data_version()
+
 
+# The active rule version is cached; any saved or deleted rule set may change it
+@receiver(post_save, sender=RuleSet)
+@receiver(post_delete, sender=RuleSet)
+def forget_active_rule_version(sender, **kwargs):
+    RuleSet.forget_active_version()
@@ -0,0 +1,195 @@
+"""
+What-if simulations for student-affairs staff: re-scores a cohort in memory under hypothetical
+changes to its inputs (financial status, GPA, course complexity) and compares the risk
+distributions before and after, overall and by faculty, course and academic year.
+Both sides are scored from the same current inputs with the same rule set, so the comparison
+never mixes in stale stored results. Nothing is written: results, the risk cube and the data
+version are left alone.
+"""
+import numpy as np
+from django.core.exceptions import ValidationError
+
+from .annalysis import get_compiled_fis, map_complexity_to_fuzzy_set, map_complexity_to_numeric, map_financial_status_to_score
+from .models import Course, Faculty, Student
+from .rules import RISK_LEVELS
+
+FINANCIAL_STATUSES = tuple(value for value, _ in Student.FINANCIAL_STATUS_CHOICES)
+COMPLEXITY_LEVELS = tuple(value for value, _ in Course.COMPLEXITY_CHOICES)
+GPA_RANGE = (0.0, 5.0)  # Shifted GPAs are clipped to the grading scale
+
+# Scenario filter -> Student lookup narrowing the simulated cohort
+COHORT_FILTERS = {'faculty': 'faculty_id', 'course': 'course_id', 'year': 'academic_year'}
+# Breakdown in the report -> cohort column it groups by
+BREAKDOWNS = {'by_faculty': 'faculty_id', 'by_course': 'course_id', 'by_year': 'academic_year'}
+
+COHORT_COLUMNS = (
+    'faculty_id', 'course_id', 'academic_year', 'financial_status', 'course__complexity_level', 'avg_gpa', 'record_count',
+)
+
+# -----------------------------------------
+# Scenarios
+# -----------------------------------------
+
+def build_scenario(faculty=None, course=None, year=None, financial_status=(), complexity=(), gpa_delta=0):
+    """
+    Validates a scenario and returns it as a JSON-serialisable dict.
+    faculty, course and year (ids, as ints or digit strings) narrow the cohort. Each financial
+    status or complexity change is 'From:To' (e.g. 'Struggling:Scholarship') or just 'To' for
+    every student in the cohort; later changes override earlier ones. gpa_delta is added to the
+    average GPA of every student with academic records.
+    Raises ValidationError listing every problem found.
+    """
+    errors = []
+    filters = {}
+    for name, value in (('faculty', faculty), ('course', course), ('year', year)):
+        if value in (None, ''):
+            continue
+        if not str(value).isdigit():
+            errors.append(f"{name} must be a number.")
+            continue
+        filters[COHORT_FILTERS[name]] = int(value)
+
+    changes = {}
+    for field, values, labels in (
+        ('financial_status', financial_status, FINANCIAL_STATUSES),
+        ('complexity_level', complexity, COMPLEXITY_LEVELS),
+    ):
+        mapping = {}
+        for change in values:
+            old, _, new = change.rpartition(':')
+            if new not in labels or (old and old not in labels):
+                errors.append(f"{field} changes must be 'From:To' or 'To' with values from {', '.join(labels)}.")
+                continue
+            mapping.update({label: new for label in ((old,) if old else labels)})
+        changes[field] = {old: new for old, new in mapping.items() if old != new}
+
+    try:
+        gpa_delta = float(gpa_delta or 0)
+    except (TypeError, ValueError):
+        errors.append("gpa_delta must be a number.")
+    else:
+        if not np.isfinite(gpa_delta):
+            errors.append("gpa_delta must be a number.")
+
+    if errors:
+        raise ValidationError(errors)
+    return {'filters': filters, **changes, 'gpa_delta': gpa_delta}
+
+# -----------------------------------------
+# Cohort loading
+# -----------------------------------------
+
+def load_cohort(filters):
+    """
+    Loads the scenario's cohort in one query as NumPy columns. Financial status and complexity
+    are kept as codes into FINANCIAL_STATUSES / COMPLEXITY_LEVELS (unknown labels get the last
+    code), so changes are remapped per label rather than per student.
+    """
+    rows = list(Student.objects.filter(**filters).values_list(*COHORT_COLUMNS))
+    faculties, courses, years, statuses, complexities, gpas, records = zip(*rows) if rows else ((),) * len(COHORT_COLUMNS)
+    return {
+        'faculty_id': np.array(faculties, dtype=np.int64),
+        'course_id': np.array(courses, dtype=np.int64),
+        'academic_year': np.array(years, dtype=np.int64),
+        'financial_status': _encode(statuses, FINANCIAL_STATUSES),
+        'complexity_level': _encode(complexities, COMPLEXITY_LEVELS),
+        'avg_gpa': np.array(gpas, dtype=float),
+        'has_records': np.array(records, dtype=np.int64) > 0,
+    }
+
+def _encode(values, labels):
+    index = {label: code for code, label in enumerate(labels)}
+    return np.fromiter((index.get(value, len(labels)) for value in values), dtype=np.int8, count=len(values))
+
+def _remap(codes, labels, mapping):
+    # Applies a {from label: to label} change to a code column
+    lookup = np.arange(len(labels) + 1, dtype=np.int8)
+    for old, new in mapping.items():
+        lookup[labels.index(old)] = labels.index(new)
+    return lookup[codes]
+
+# Score of every code (unknown labels last), mapped as the analysis maps stored labels
+FINANCE_SCORES = np.array([map_financial_status_to_score(label) for label in FINANCIAL_STATUSES + (None,)], dtype=float)
+COMPLEXITY_SCORES = np.array(
+    [map_complexity_to_numeric(map_complexity_to_fuzzy_set(label)) for label in COMPLEXITY_LEVELS + (None,)], dtype=float
+)
+
+def _rule_inputs(statuses, complexities, gpas):
+    return {'avg_gpa': gpas, 'finance_score': FINANCE_SCORES[statuses], 'complexity_level': COMPLEXITY_SCORES[complexities]}
+
+# -----------------------------------------
+# Simulation
+# -----------------------------------------
+
+def simulate(scenario, rule_version=None, exact=False):
+    """
+    Scores the scenario's cohort as it is and with the scenario's changes applied, using the
+    active (or given) rule set. Returns the students in the cohort, how many the scenario changes,
+    the before/after risk distributions overall and per faculty, course and year, and the
+    risk transitions (e.g. High->Medium).
+    """
+    fis = get_compiled_fis(rule_version)
+    cohort = load_cohort(scenario['filters'])
+
+    statuses = _remap(cohort['financial_status'], FINANCIAL_STATUSES, scenario['financial_status'])
+    complexities = _remap(cohort['complexity_level'], COMPLEXITY_LEVELS, scenario['complexity_level'])
+    gpas = cohort['avg_gpa']
+    if scenario['gpa_delta']:
+        gpas = np.where(cohort['has_records'], np.clip(gpas + scenario['gpa_delta'], *GPA_RANGE), gpas)
+    changed = (statuses != cohort['financial_status']) | (complexities != cohort['complexity_level']) | (gpas != cohort['avg_gpa'])
+
+    before = _risk_codes(fis, _rule_inputs(cohort['financial_status'], cohort['complexity_level'], cohort['avg_gpa']), exact)
+    after = before.copy()
+    if changed.any():  # Only students whose inputs moved need scoring again
+        changed_inputs = _rule_inputs(statuses[changed], complexities[changed], gpas[changed])
+        after[changed] = _risk_codes(fis, changed_inputs, exact)
+
+    levels = len(RISK_LEVELS)
+    moves = np.bincount(before * levels + after, minlength=levels * levels).reshape(levels, levels)
+    report = {
+        'rule_version': fis.rule_version,
+        'scenario': scenario,
+        'students': len(before),
+        'changed_students': int(changed.sum()),
+        'before': _distribution(np.bincount(before, minlength=levels)),
+        'after': _distribution(np.bincount(after, minlength=levels)),
+        'transitions': {
+            f'{RISK_LEVELS[old]}->{RISK_LEVELS[new]}': int(moves[old, new])
+            for old in range(levels) for new in range(levels) if old != new and moves[old, new]
+        },
+    }
+    names = {
+        'faculty_id': dict(Faculty.objects.filter(id__in=np.unique(cohort['faculty_id']).tolist()).values_list('id', 'name')),
+        'course_id': dict(Course.objects.filter(id__in=np.unique(cohort['course_id']).tolist()).values_list('id', 'name')),
+        'academic_year': {year: f'Year {year}' for year in np.unique(cohort['academic_year']).tolist()},
+    }
+    for breakdown, column in BREAKDOWNS.items():
+        report[breakdown] = _breakdown(cohort[column], before, after, names[column])
+    return report
+
+def _risk_codes(fis, inputs, exact):
+    # Index into RISK_LEVELS of each student's risk level
+    risk_index, _ = fis.rank_indices(fis.risk_scores(inputs, exact))
+    return risk_index.astype(np.intp)
+
+def _distribution(counts):
+    return dict(zip(RISK_LEVELS, counts.tolist()))
+
+def _breakdown(groups, before, after, names):
+    """
+    Before/after risk counts per distinct value of `groups`, one bincount per side.
+    """
+    keys, inverse = np.unique(groups, return_inverse=True)
+    levels = len(RISK_LEVELS)
+    counts_before = np.bincount(inverse * levels + before, minlength=len(keys) * levels).reshape(-1, levels)
+    counts_after = np.bincount(inverse * levels + after, minlength=len(keys) * levels).reshape(-1, levels)
+    return [
+        {
+            'id': key,
+            'name': names.get(key, str(key)),
+            'students': int(counts_before[i].sum()),
+            'before': _distribution(counts_before[i]),
+            'after': _distribution(counts_after[i]),
+        }
+        for i, key in enumerate(keys.tolist())
+    ]
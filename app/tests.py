@@ -1,3 +1,928 @@
-from django.test import TestCase
+import base64
+import datetime
+import io
+import multiprocessing
+import tempfile
+from unittest import mock
+
+import numpy as np
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import annalysis, backtesting, checkpoints, jobs, metrics, rules, signals, simulations
+from .annalysis import analyse_cohort, run_attrition_analysis
+from .cache_backends import CounterFileBasedCache
+from .benchmarks import BENCHMARK_MODES, DEFAULT_CONFIG, generate_institution, measure_startup, run_benchmarks
+from .aggregates import CHART_DATASETS, refresh_gpa_aggregates
+from .caching import counters, get_data_version
+from .bulk_import import import_students
+from .management.commands import _import as import_command
+from .cube import CELL_FIELDS, rebuild_risk_cube
+from .pagination import decode_cursor, encode_cursor, keyset_page
+from .models import Faculty, Course, Student, AcademicRecord, AttritionAnalysisResult, AnalysisJob, AnalysisRun, RiskCubeCell, RuleSet
 
 # Create your tests here.
+
+LOCMEM_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'counters': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'counters', 'TIMEOUT': None},
+}
+
+
+def make_students(count, year=2025):
+    """
+    Bulk creates `count` students with one academic record each (no signals fire).
+    """
+    faculty = Faculty.objects.get_or_create(name='Science')[0]
+    courses = [
+        Course.objects.get_or_create(name=name, faculty=faculty, defaults={'complexity_level': level})[0]
+        for name, level in (('Physics', Course.DIFFICULT), ('Biology', Course.MODERATE))
+    ]
+    first = Student.objects.count()
+    students = Student.objects.bulk_create([
+        Student(
+            first_name=f'Student{first + i}',
+            last_name='Test',
+            age=20,
+            gender=Student.MALE if i % 2 else Student.FEMALE,
+            faculty=faculty,
+            course=courses[i % 2],
+            academic_year=1 + i % 4,
+            financial_status=Student.FINANCIAL_STATUS_CHOICES[i % 3][0],
+            gpa=1.0 + (i % 40) / 10,
+        )
+        for i in range(count)
+    ])
+    AcademicRecord.objects.bulk_create([
+        AcademicRecord(student=student, gpa=student.gpa, year=year) for student in students
+    ])
+    return students
+
+
+# -----------------------------------------
+# Query-count regression tests: each view and analysis mode runs a fixed number of
+# queries, whatever the number of students. A new N+1 pattern makes these fail.
+# -----------------------------------------
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ViewQueryCountTests(TestCase):
+    # Session and user lookups made by login_required on every request
+    AUTH_QUERIES = 2
+
+    def setUp(self):
+        cache.clear()
+        make_students(30)
+        analyse_cohort()
+        self.user = User.objects.create_user('staff', password='secret')
+        self.client.force_login(self.user)
+
+    def assertViewQueries(self, expected, url, **headers):
+        with self.assertNumQueries(self.AUTH_QUERIES + expected):
+            response = self.client.get(url, **headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return response
+
+    def test_dashboard_reads_the_cube_once_then_the_cache(self):
+        self.assertViewQueries(1, reverse('dashboard'))
+        self.assertViewQueries(0, reverse('dashboard'))
+
+    def test_attrition_dashboard_is_a_page_shell(self):
+        self.assertViewQueries(0, reverse('attrition_dashboard'))
+
+    def test_chart_data_is_cached_and_revalidated(self):
+        url = reverse('chart_data', args=['high_risk_by_faculty'])
+        response = self.assertViewQueries(1, url)
+        self.assertViewQueries(0, url)
+        not_modified = self.assertViewQueries(0, url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_results_page_does_not_grow_with_students(self):
+        url = reverse('view_analysis_results') + '?sort=certainty&dir=desc'
+        self.assertViewQueries(3, url)  # Page, faculty options, course options
+
+        make_students(60)
+        analyse_cohort()
+        self.assertViewQueries(3, url + '&risk_level=High')
+
+    def test_export_streams_in_one_query(self):
+        self.assertViewQueries(1, reverse('export_analysis_results') + '?format=jsonl')
+
+    def test_simulation_is_read_only_and_cached(self):
+        annalysis.get_compiled_fis()
+        url = reverse('simulate_scenario') + '?financial_status=Struggling:Scholarship&gpa_delta=0.5'
+        response = self.assertViewQueries(3, url)  # Cohort, faculty names, course names
+        self.assertViewQueries(0, url)
+        self.assertEqual(response.json()['students'], 30)
+        self.assertEqual(self.client.get(reverse('simulate_scenario') + '?complexity=Impossible').status_code, 400)
+
+    def test_job_status(self):
+        job = AnalysisJob.objects.create()
+        self.assertViewQueries(1, reverse('analysis_job_status', args=[job.pk]))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ChartDataTests(TestCase):
+    # Dataset -> (Student field charted, whether only High risk students count); risk_levels charts
+    # every analysed student by risk level
+    STUDENT_FIELDS = {
+        'students_per_year': ('academic_year', False),
+        'students_by_gender': ('gender', False),
+        'students_by_faculty': ('faculty__name', False),
+        'students_by_course': ('course__name', False),
+        'risk_levels': ('attrition_result__risk_level', False),
+        'high_risk_by_faculty': ('faculty__name', True),
+        'high_risk_by_year': ('academic_year', True),
+        'high_risk_by_course': ('course__name', True),
+        'high_risk_by_gender': ('gender', True),
+    }
+
+    def setUp(self):
+        cache.clear()
+        make_students(40)
+        analyse_cohort()
+        # Patch the cube after the analysis too: a student moves faculty, another leaves
+        self.arts = Faculty.objects.create(name='Arts')
+        moved = Student.objects.filter(attrition_result__risk_level='High').first()
+        moved.faculty = self.arts
+        moved.course = Course.objects.create(name='History', faculty=self.arts, complexity_level=Course.MODERATE)
+        moved.save()
+        Student.objects.exclude(pk=moved.pk).first().delete()
+        self.client.force_login(User.objects.create_user('staff', password='secret'))
+
+    def expected(self, dataset, filters):
+        field, high_only = self.STUDENT_FIELDS[dataset]
+        students = Student.objects.filter(**filters)
+        if high_only:
+            students = students.filter(attrition_result__risk_level='High')
+        elif dataset == 'risk_levels':
+            students = students.filter(attrition_result__isnull=False)
+        rows = sorted(students.values_list(field).annotate(count=Count('id')).order_by())
+        return {'labels': [label for label, _ in rows], 'counts': [count for _, count in rows]}
+
+    def test_chart_data_matches_the_students(self):
+        physics = Course.objects.get(name='Physics')
+        cases = [
+            ({}, {}),
+            ({'faculty': self.arts.pk}, {'faculty_id': self.arts.pk}),
+            ({'year': 2}, {'academic_year': 2}),
+            ({'gender': 'Female', 'financial_status': 'Good'}, {'gender': 'Female', 'financial_status': 'Good'}),
+            ({'course': physics.pk, 'year': 1}, {'course_id': physics.pk, 'academic_year': 1}),
+        ]
+        self.assertEqual(set(self.STUDENT_FIELDS), set(CHART_DATASETS))
+        for params, filters in cases:
+            for dataset in CHART_DATASETS:
+                with self.subTest(dataset=dataset, params=params):
+                    response = self.client.get(reverse('chart_data', args=[dataset]), params)
+                    self.assertEqual(response.json(), self.expected(dataset, filters))
+
+
+def _increment_counter(location, times):
+    counters = CounterFileBasedCache(location, {'TIMEOUT': None})
+    for _ in range(times):
+        counters.incr('counter')
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class DataVersionTests(TestCase):
+
+    def test_version_moves_once_the_transaction_commits(self):
+        version = get_data_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            faculty = Faculty.objects.create(name='Arts')
+            Course.objects.create(name='History', faculty=faculty, complexity_level=Course.MODERATE)
+            self.assertEqual(get_data_version(), version)  # Readers still see the old rows
+        self.assertEqual(get_data_version(), version + 1)  # One bump for the whole transaction
+
+    def test_rolled_back_changes_keep_the_version(self):
+        version = get_data_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Faculty.objects.create(name='Arts')
+                transaction.set_rollback(True)
+        self.assertEqual(get_data_version(), version)
+
+    def test_concurrent_increments_are_not_lost(self):
+        with tempfile.TemporaryDirectory() as location:
+            counters = CounterFileBasedCache(location, {'TIMEOUT': None, 'OPTIONS': {'MAX_ENTRIES': 1}})
+            counters.add('counter', 0)
+            context = multiprocessing.get_context('fork')
+            processes = [context.Process(target=_increment_counter, args=(location, 50)) for _ in range(4)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            counters.add('other', 0)  # Past MAX_ENTRIES: nothing is culled
+            self.assertEqual(counters.get('counter'), 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        make_students(30)
+        analyse_cohort()
+        self.results = AttritionAnalysisResult.objects.filter(risk_level__in=['High', 'Medium'])
+
+    def test_pages_forward_and_back_through_sorted_filtered_results(self):
+        expected = list(self.results.order_by('-certainty_score', '-pk').values_list('pk', flat=True))
+        self.assertGreater(len(expected), 8)
+
+        pages, after = [], None
+        while True:
+            page = keyset_page(self.results, 'certainty_score', descending=True, after=after, page_size=4)
+            pages.append([result.pk for result in page['items']])
+            after = page['next_cursor']
+            if after is None:
+                break
+        self.assertEqual([pk for items in pages for pk in items], expected)
+
+        # Back from the last page, each previous page is the one shown before it
+        before = page['prev_cursor']
+        for items in reversed(pages[:-1]):
+            page = keyset_page(self.results, 'certainty_score', descending=True, before=before, page_size=4)
+            self.assertEqual([result.pk for result in page['items']], items)
+            before = page['prev_cursor']
+        self.assertIsNone(before)
+
+    def test_tampered_cursor_is_ignored(self):
+        first_page = keyset_page(self.results, 'id', page_size=4)['items']
+        for value, pk in (('ab', 1), (1, 'ab'), ([1], 2), (None, 3), ('ab', None)):
+            cursor = encode_cursor(value, pk)
+            self.assertEqual(keyset_page(self.results, 'certainty_score', after=cursor, page_size=4)['items'],
+                             keyset_page(self.results, 'certainty_score', page_size=4)['items'])
+            self.assertEqual(keyset_page(self.results, 'id', before=cursor, page_size=4)['items'], first_page)
+        self.assertIsNone(decode_cursor(base64.urlsafe_b64encode(b'"ab"').decode()))
+
+        self.client.force_login(User.objects.create_user('staff', password='secret'))
+        for cursor in ('ImFiIg==', encode_cursor('ab', 1), 'not base64'):
+            url = reverse('view_analysis_results') + f'?sort=certainty&after={cursor}'
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class AnalysisQueryCountTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        annalysis.get_compiled_fis()  # Active rule version is cached and its evaluator compiled once per process
+
+    def assertSameQueriesForMoreStudents(self, expected, run):
+        # Runs `run` on a small and a larger cohort; both must take exactly `expected` queries
+        for count in (10, 40):
+            make_students(count)
+            with self.assertNumQueries(expected):
+                run()
+
+    def test_full_cohort_analysis(self):
+        # Run checkpoint (savepoint, resumable lookup, abandon stale, insert, release), fetch,
+        # persist chunk (savepoint, existing count, upsert, checkpoint, release), cube rebuild
+        # (select, savepoint, delete, insert, release), run completed
+        self.assertSameQueriesForMoreStudents(19, analyse_cohort)
+
+    def test_incremental_analysis_of_unchanged_cohort(self):
+        make_students(20)
+        analyse_cohort()
+        # Run checkpoint, inputs and stored fingerprints; nothing to persist but the checkpoint,
+        # then the cube rebuild and the completed run
+        with self.assertNumQueries(16):
+            stats = analyse_cohort(incremental=True)
+        self.assertEqual(stats['skipped'], 20)
+
+    def test_students_subset_analysis(self):
+        students = make_students(20)
+        analyse_cohort()
+        subset = Student.objects.filter(id__in=[student.id for student in students[:5]])
+        with self.assertNumQueries(9):  # Cube snapshots before/after plus the patched cells
+            run_attrition_analysis(students=subset)
+
+    def test_single_student_analysis(self):
+        student = make_students(1)[0]
+        rebuild_risk_cube()
+        # Snapshot, stored average GPA, result upsert, snapshot again, then moving the student's cube cell
+        with self.assertNumQueries(16):
+            run_attrition_analysis(student)
+        self.assertTrue(AttritionAnalysisResult.objects.filter(student=student).exists())
+
+    def test_new_student_signal_path(self):
+        template = make_students(5)[0]
+        # Student, record, GPA aggregates, cube cell, then the on-commit analysis
+        with self.assertNumQueries(19):
+            with self.captureOnCommitCallbacks(execute=True):
+                student = Student.objects.create(
+                    first_name='New', last_name='Student', age=19, gender=Student.FEMALE,
+                    faculty=template.faculty, course=template.course, academic_year=1, gpa=2.5,
+                )
+        self.assertTrue(AttritionAnalysisResult.objects.filter(student=student).exists())
+
+    def test_rolled_back_changes_are_not_analysed(self):
+        kept, discarded = make_students(2)
+        with mock.patch.object(signals, '_analyse_students') as analyse:
+            with self.captureOnCommitCallbacks(execute=True):
+                AcademicRecord.objects.create(student=kept, gpa=3.0, year=2026)
+                with transaction.atomic():
+                    AcademicRecord.objects.create(student=discarded, gpa=3.0, year=2026)
+                    transaction.set_rollback(True)
+            with self.captureOnCommitCallbacks(execute=True):
+                AcademicRecord.objects.create(student=kept, gpa=3.5, year=2027)
+        # The rolled-back student is neither analysed with this commit nor left over for the next
+        self.assertEqual([call.args[0] for call in analyse.call_args_list], [{kept.id}, {kept.id}])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ImportTests(TestCase):
+
+    def import_records(self, students, gpa):
+        out = io.StringIO()
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write('student_id,gpa,year\n' + ''.join(f'{student.id},{gpa},2026\n' for student in students))
+            f.flush()
+            call_command('import_records', f.name, stdout=out)
+        return out.getvalue()
+
+    def test_import_analyses_only_the_imported_students(self):
+        students = make_students(20)
+        analyse_cohort()
+        output = self.import_records(students[:2], 0.5)
+        # Only the two imported students are read and re-scored; the other 18 are not even counted as unchanged
+        self.assertIn('Analysis: 0 results inserted, 2 updated, 0 unchanged.', output)
+
+    def test_large_imports_are_analysed_in_batches_or_in_one_pass(self):
+        students = make_students(20)
+        analyse_cohort()
+        with mock.patch.object(import_command, 'ANALYSIS_BATCH_SIZE', 2), \
+                mock.patch.object(annalysis, 'run_attrition_analysis', wraps=annalysis.run_attrition_analysis) as run:
+            output = self.import_records(students[::4], 0.5)  # 5 students, not consecutive: 3 batches
+            self.assertIn('Analysis: 0 results inserted, 5 updated, 0 unchanged.', output)
+            self.assertEqual(run.call_count, 3)
+
+            run.reset_mock()
+            output = self.import_records(students[:15], 4.9)  # Most of the cohort: one incremental run
+            self.assertIn('Analysis: 0 results inserted, 15 updated, 5 unchanged.', output)
+            self.assertEqual(run.call_count, 1)
+
+    def test_import_leaves_the_cube_consistent(self):
+        make_students(4)
+        analyse_cohort()
+        for skip_analysis in (True, False):
+            with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+                f.write('first_name,last_name,age,gender,faculty,course,academic_year,gpa\n')
+                f.write(''.join(f'New{i},Student,20,Male,Science,Biology,2,2.5\n' for i in range(3)))
+                f.flush()
+                call_command('import_students', f.name, skip_analysis=skip_analysis, stdout=io.StringIO())
+            patched = self.cube_cells()
+            rebuild_risk_cube()
+            self.assertEqual(patched, self.cube_cells())
+            self.assertEqual(sum(count for *_, count in patched), Student.objects.count())
+
+    def cube_cells(self):
+        return set(RiskCubeCell.objects.exclude(student_count=0).values_list(*CELL_FIELDS, 'student_count'))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class RiskCubeTests(TestCase):
+
+    def setUp(self):
+        make_students(12)
+        analyse_cohort()
+        self.student = Student.objects.filter(attrition_result__risk_level='High').first()
+
+    def assertCubeMatchesRebuild(self):
+        def cells():
+            rows = RiskCubeCell.objects.filter(student_count__gt=0).values_list(*CELL_FIELDS, 'student_count', 'certainty_sum')
+            return {row[:-1] + (round(row[-1], 6),) for row in rows}
+        patched = cells()
+        rebuild_risk_cube()
+        self.assertEqual(patched, cells())
+
+    def test_dimension_change_moves_the_student(self):
+        arts = Faculty.objects.create(name='Arts')
+        self.student.faculty = arts
+        self.student.course = Course.objects.create(name='History', faculty=arts, complexity_level=Course.MODERATE)
+        self.student.academic_year = 6
+        self.student.financial_status = 'Scholarship'
+        self.student.save()
+        self.assertTrue(RiskCubeCell.objects.filter(faculty=arts, academic_year=6, risk_level='High', student_count=1).exists())
+        self.assertCubeMatchesRebuild()
+
+    def test_deleted_student_leaves_the_cube(self):
+        self.student.delete()
+        self.assertCubeMatchesRebuild()
+
+    def test_imported_students_are_counted(self):
+        rows = [
+            (line, {'first_name': f'Imported{line}', 'last_name': 'Test', 'age': 20, 'gender': 'Female',
+                    'faculty': 'Science', 'course': 'Physics', 'academic_year': 1, 'gpa': 2.0})
+            for line in range(3)
+        ]
+        imported = Student.objects.filter(id__in=import_students(rows)['student_ids'])
+        self.assertEqual(RiskCubeCell.objects.aggregate(total=Sum('student_count'))['total'], Student.objects.count())
+        run_attrition_analysis(students=imported)
+        self.assertFalse(RiskCubeCell.objects.filter(student_count__lt=0).exists())
+        self.assertEqual(RiskCubeCell.objects.aggregate(total=Sum('student_count'))['total'], Student.objects.count())
+        self.assertCubeMatchesRebuild()
+
+    def test_queryset_delete_leaves_the_cube(self):
+        Student.objects.filter(academic_year__in=[1, 2]).delete()
+        self.assertCubeMatchesRebuild()
+
+    def test_deleted_course_takes_its_cells_and_students_along(self):
+        self.student.course.delete()
+        connection.check_constraints()  # No cell was recreated for the deleted course
+        self.assertCubeMatchesRebuild()
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class GpaAggregateTests(TestCase):
+
+    def setUp(self):
+        self.first, self.second = make_students(2)
+        refresh_gpa_aggregates()
+
+    def assertAggregates(self, student, avg_gpa, record_count):
+        student.refresh_from_db()
+        self.assertAlmostEqual(student.avg_gpa, avg_gpa)
+        self.assertEqual(student.record_count, record_count)
+
+    def test_record_changes_keep_the_aggregates_exact(self):
+        first_gpa, second_gpa = self.first.gpa, self.second.gpa
+        record = AcademicRecord.objects.create(student=self.first, gpa=4.0, year=2026)
+        self.assertAggregates(self.first, (first_gpa + 4.0) / 2, 2)
+
+        record.gpa = 2.0
+        record.save()
+        self.assertAggregates(self.first, (first_gpa + 2.0) / 2, 2)
+
+        record = AcademicRecord.objects.get(pk=record.pk)  # Loaded, as the admin would
+        record.student = self.second
+        record.save()
+        self.assertAggregates(self.first, first_gpa, 1)
+        self.assertAggregates(self.second, (second_gpa + 2.0) / 2, 2)
+
+        record.delete()
+        self.assertAggregates(self.second, second_gpa, 1)
+        AcademicRecord.objects.filter(student=self.second).get().delete()
+        self.assertAggregates(self.second, 0.0, 0)
+
+    def test_cascade_deletes_leave_the_other_students_exact(self):
+        biology = self.second.course
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.delete()
+            AcademicRecord.objects.create(student=self.second, gpa=4.0, year=2026)
+        self.assertAggregates(self.second, (self.second.gpa + 4.0) / 2, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            biology.delete()  # Cascades to the second student and its records
+        self.assertFalse(Student.objects.exists())
+        self.assertFalse(AcademicRecord.objects.exists())
+
+    def test_repair_command_reports_and_fixes_drift(self):
+        Student.objects.filter(pk=self.first.pk).update(avg_gpa=0.0, record_count=5)
+        Student.objects.filter(pk=self.second.pk).update(avg_gpa=1.23)
+
+        out = io.StringIO()
+        call_command('repair_gpa_aggregates', check=True, stdout=out)
+        self.assertIn("2 students have GPA aggregates that differ", out.getvalue())
+        self.assertEqual(Student.objects.filter(record_count=5).count(), 1)  # --check changes nothing
+
+        out = io.StringIO()
+        call_command('repair_gpa_aggregates', chunk_size=1, stdout=out)
+        self.assertIn("Recomputed GPA aggregates for 2 students", out.getvalue())
+        self.assertAggregates(self.first, self.first.gpa, 1)
+        self.assertAggregates(self.second, self.second.gpa, 1)
+
+        out = io.StringIO()
+        call_command('repair_gpa_aggregates', check=True, stdout=out)
+        self.assertIn("0 students have GPA aggregates that differ", out.getvalue())
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class StreamingAnalysisTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        make_students(25)
+
+    def test_chunked_run_matches_a_single_chunk(self):
+        analyse_cohort(chunk_size=1000)
+        single = list(AttritionAnalysisResult.objects.order_by('student_id').values_list('student_id', 'risk_level', 'certainty_score'))
+
+        AttritionAnalysisResult.objects.all().delete()
+        stats = analyse_cohort(chunk_size=4)
+        self.assertEqual(stats['inserted'], 25)
+        self.assertEqual(list(AttritionAnalysisResult.objects.order_by('student_id').values_list('student_id', 'risk_level', 'certainty_score')), single)
+
+    def test_failed_run_keeps_committed_chunks(self):
+        persist = annalysis.persist_results
+        calls = []
+
+        def fail_on_third_chunk(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 3:
+                raise RuntimeError("worker killed")
+            return persist(*args, **kwargs)
+
+        with mock.patch.object(annalysis, 'persist_results', fail_on_third_chunk):
+            with self.assertRaises(RuntimeError):
+                analyse_cohort(chunk_size=10)
+        self.assertEqual(AttritionAnalysisResult.objects.count(), 20)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CheckpointedRunTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        make_students(25)
+
+    def interrupt_after_chunks(self, chunks):
+        persist = annalysis.persist_results
+        calls = []
+
+        def fail_after(*args, **kwargs):
+            calls.append(1)
+            if len(calls) > chunks:
+                raise RuntimeError("worker killed")
+            return persist(*args, **kwargs)
+
+        with mock.patch.object(annalysis, 'persist_results', fail_after), self.assertRaises(RuntimeError):
+            analyse_cohort(chunk_size=10)
+
+    def test_interrupted_run_resumes_from_its_checkpoint(self):
+        self.interrupt_after_chunks(2)
+        run = AnalysisRun.objects.get()
+        self.assertEqual((run.status, run.chunks_committed, run.stats['inserted']), (AnalysisRun.INTERRUPTED, 2, 20))
+        self.assertFalse(run.is_consistent)
+
+        with mock.patch.object(annalysis, 'persist_results', wraps=annalysis.persist_results) as persist:
+            stats = analyse_cohort(chunk_size=10)
+        self.assertEqual(len(persist.call_args.args[0]), 5)  # Only the chunk that never committed
+        self.assertEqual(persist.call_count, 1)
+
+        run.refresh_from_db()
+        self.assertEqual(stats['run'], run.pk)
+        self.assertEqual((run.status, run.attempts, stats['inserted']), (AnalysisRun.COMPLETED, 2, 25))
+        self.assertEqual(AttritionAnalysisResult.objects.count(), 25)
+
+    def test_rule_change_abandons_the_interrupted_run(self):
+        self.interrupt_after_chunks(1)
+        run = checkpoints.start_run(RuleSet.DEFAULT_VERSION + 1)
+        self.assertIsNone(run.last_student_id)
+        self.assertEqual(
+            list(AnalysisRun.objects.order_by('id').values_list('status', flat=True)),
+            [AnalysisRun.ABANDONED, AnalysisRun.RUNNING],
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class AnalysisJobTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        make_students(5)
+        self.job, _ = jobs.enqueue_analysis()
+
+    def crash_worker(self):
+        # A worker claims the job, then dies: no more heartbeats
+        job = jobs.claim_next_job()
+        AnalysisJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - jobs.JOB_STALE_AFTER - datetime.timedelta(seconds=1))
+        return job
+
+    def test_job_of_a_crashed_worker_is_requeued(self):
+        self.crash_worker()
+        job, created = jobs.enqueue_analysis()
+        self.assertEqual((job.pk, job.status, created), (self.job.pk, AnalysisJob.QUEUED, False))
+
+        job = jobs.run_job(jobs.claim_next_job())
+        self.assertEqual((job.pk, job.status, job.attempts), (self.job.pk, AnalysisJob.COMPLETED, 2))
+
+    def test_job_dying_on_every_attempt_fails(self):
+        for _ in range(jobs.MAX_JOB_ATTEMPTS):
+            self.crash_worker()
+        job, created = jobs.enqueue_analysis()
+        self.assertTrue(created)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, AnalysisJob.FAILED)
+
+    def test_queueing_needs_a_login(self):
+        response = self.client.post(reverse('trigger_analysis'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('login', response['Location'])
+        self.assertEqual(AnalysisJob.objects.count(), 1)
+
+    def test_queueing_errors_are_reported_not_raised(self):
+        self.client.force_login(User.objects.create_user('staff', password='secret'))
+        for view in ('trigger_analysis', 'view_analysis_results'):
+            with self.subTest(view=view), mock.patch('app.views.enqueue_analysis', side_effect=RuntimeError('queue down')), \
+                    mock.patch('app.views.traceback.print_exc'):
+                response = self.client.post(reverse(view), follow=True)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('queue down', ' '.join(str(message) for message in response.context['messages']))
+
+    def test_late_result_of_a_recovered_job_is_dropped(self):
+        stalled = self.crash_worker()
+        jobs.enqueue_analysis()  # Recovers the job while its worker is still, slowly, running it
+        jobs.run_job(stalled)
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.processed), (AnalysisJob.QUEUED, 0))
+
+
+def _per_student_risk(gpa, finance_score, complexity_level):
+    """
+    The per-student evaluation the vectorised scorer replaced, kept as the reference it must match.
+    """
+    import skfuzzy as fuzz
+    universes = {'gpa': np.arange(0, 5.1, 0.1), 'finance': np.arange(0, 11, 1), 'complexity': np.arange(0, 11, 1)}
+    sets = {
+        'gpa': {'low': [0, 0, 2.0], 'medium': [1.8, 3.0, 3.8], 'high': [3.7, 4.3, 5.0]},
+        'finance': {'struggling': [0, 0, 3], 'good': [2, 5, 7], 'scholarship': [6, 9, 10]},
+        'complexity': {'easy': [0, 0, 3], 'moderate': [2, 5, 8], 'hard': [7, 10, 10]},
+    }
+    inputs = {'gpa': gpa, 'finance': finance_score, 'complexity': complexity_level}
+    member = {
+        (variable, name): fuzz.interp_membership(universes[variable], fuzz.trimf(universes[variable], points), inputs[variable])
+        for variable, variable_sets in sets.items() for name, points in variable_sets.items()
+    }
+    scores = {
+        'High': 0.6 * member['gpa', 'low'] + 0.25 * member['finance', 'struggling'] + 0.15 * member['complexity', 'hard'],
+        'Medium': 0.4 * member['gpa', 'medium'] + 0.3 * member['finance', 'good'] + 0.3 * member['complexity', 'moderate'],
+        'Low': 0.6 * member['gpa', 'high'] + 0.25 * member['finance', 'scholarship'] + 0.15 * member['complexity', 'easy'],
+    }
+    (risk_level, top_score), (alt, second_score), _ = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+    certainty = int(top_score * 100)
+    if top_score - second_score < 0.12:
+        risk_level = 'High' if 'High' in (risk_level, alt) else 'Medium' if 'Medium' in (risk_level, alt) else risk_level
+        certainty = int((top_score + second_score) / 2 * 100)
+    return risk_level, certainty
+
+
+class ScoringTests(TestCase):
+
+    def setUp(self):
+        self.fis = rules.CompiledRuleSet(1, rules.DEFAULT_RULE_SPEC)
+        # Every combination of GPAs (on and off the table's resolution), finance scores and complexities
+        gpas = np.concatenate([np.linspace(0, 5, 101), np.random.default_rng(0).uniform(0, 5, 100)])
+        grid = np.meshgrid(gpas, np.arange(0, 10.5, 0.5), np.arange(0, 10.5, 2.5), indexing='ij')
+        self.columns = {name: values.ravel() for name, values in zip(rules.INPUT_COLUMNS, grid)}
+
+    def test_exact_mode_matches_the_per_student_evaluation(self):
+        expected = [_per_student_risk(*inputs) for inputs in zip(*self.columns.values())]
+        risk_levels, certainties = self.fis.score(self.columns, exact=True)
+        self.assertEqual(list(zip(risk_levels.tolist(), certainties.tolist())), expected)
+
+    def test_table_mode_is_within_the_documented_tolerance(self):
+        exact = self.fis.risk_scores(self.columns, exact=True)
+        table = self.fis.risk_scores(self.columns)
+        bound = self.fis.table_error_bound()
+        self.assertTrue((np.abs(table - exact) <= bound[:, None] + 1e-9).all())
+
+        # Risk levels agree wherever rounding did not move the scores across a decision (top level,
+        # borderline margin, runner-up)
+        ordered = -np.sort(-exact, axis=0)
+        gap, next_gap = ordered[0] - ordered[1], ordered[1] - ordered[2]
+        slack = 2 * np.abs(table - exact).max(axis=0)
+        clear = (gap > slack) & (np.abs(gap - self.fis.margin) > slack) & (next_gap > slack)
+        self.assertGreater(clear.mean(), 0.25)  # Not vacuous: half the finance scores are off the table
+        exact_levels, _ = self.fis.score(self.columns, exact=True)
+        table_levels, _ = self.fis.score(self.columns)
+        np.testing.assert_array_equal(table_levels[clear], exact_levels[clear])
+
+    def test_out_of_range_inputs_score_like_the_nearest_edge_in_both_modes(self):
+        columns = {
+            'avg_gpa': np.array([-1.0, 5.7, 3.0, 0.0, 5.0]),
+            'finance_score': np.array([5.0, 5.0, -3.0, 12.0, 5.0]),
+            'complexity_level': np.array([5.0, 5.0, 15.0, 5.0, -2.0]),
+        }
+        clipped = {
+            'avg_gpa': np.array([0.0, 5.0, 3.0, 0.0, 5.0]),
+            'finance_score': np.array([5.0, 5.0, 0.0, 10.0, 5.0]),
+            'complexity_level': np.array([5.0, 5.0, 10.0, 5.0, 0.0]),
+        }
+        for exact in (False, True):
+            np.testing.assert_allclose(self.fis.risk_scores(columns, exact), self.fis.risk_scores(clipped, exact))
+        np.testing.assert_allclose(self.fis.risk_scores(columns, exact=True), self.fis.risk_scores(columns, exact=False))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class RuleSetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        rules.get_rule_set.cache_clear()
+        self.addCleanup(rules.get_rule_set.cache_clear)
+        make_students(10)
+
+    def save_version(self, **borderline):
+        spec = {**rules.DEFAULT_RULE_SPEC, 'borderline': {**rules.DEFAULT_RULE_SPEC['borderline'], **borderline}}
+        rule_set = RuleSet(version=2, spec=spec)
+        rule_set.full_clean()
+        rule_set.save()
+        return rule_set
+
+    def test_results_record_the_active_rule_version(self):
+        analyse_cohort()
+        self.assertEqual(set(AttritionAnalysisResult.objects.values_list('rule_version', flat=True)), {RuleSet.DEFAULT_VERSION})
+
+    def test_activating_a_version_rescores_on_the_next_incremental_run(self):
+        analyse_cohort()
+        self.save_version(tie_break='top_score').activate()
+        self.assertEqual(RuleSet.active_version(), 2)
+
+        stats = analyse_cohort(incremental=True)
+        self.assertEqual(stats['skipped'], 0)  # A new rule version changes every fingerprint
+        self.assertEqual(set(AttritionAnalysisResult.objects.values_list('rule_version', flat=True)), {2})
+
+    def test_saved_versions_are_immutable(self):
+        rule_set = self.save_version(margin=0.05)
+        rule_set.spec = rules.DEFAULT_RULE_SPEC
+        with self.assertRaises(ValidationError):
+            rule_set.full_clean()
+
+    def test_invalid_spec_is_rejected(self):
+        spec = {**rules.DEFAULT_RULE_SPEC, 'borderline': {'margin': -1, 'tie_break': 'coin_flip'}}
+        with self.assertRaises(ValidationError) as raised:
+            rules.validate_spec(spec)
+        self.assertEqual(len(raised.exception.messages), 2)
+
+    def test_active_version_is_forgotten_when_the_activation_commits(self):
+        rule_set = self.save_version(margin=0.05)
+        with self.captureOnCommitCallbacks(execute=True):
+            rule_set.activate()
+            self.assertEqual(RuleSet.active_version(), 2)  # Fresh within the activating transaction
+            cache.set(RuleSet.ACTIVE_VERSION_KEY, 1)  # Another request reads the still-committed version
+        self.assertEqual(RuleSet.active_version(), 2)
+
+    def test_malformed_spec_is_rejected_not_crashed_on(self):
+        gpa = rules.DEFAULT_RULE_SPEC['variables']['gpa']
+        malformed = [
+            {'variables': {'gpa': 5}},
+            {'variables': {'gpa': {**gpa, 'sets': ['low', 'high']}}},
+            {'variables': {'gpa': {**gpa, 'sets': {'low': 1}}}},
+            {'variables': {'gpa': {**gpa, 'sets': {'low': {'shape': ['trimf'], 'points': [0, 1, 2]}}}}},
+            {'variables': {'gpa': {**gpa, 'sets': {'low': {'shape': 'trimf', 'points': [0, 'a', 2]}}}}},
+            {**rules.DEFAULT_RULE_SPEC, 'rules': {'High': 1, 'Medium': [2], 'Low': [{'variable': ['gpa'], 'weight': True}]}},
+            {**rules.DEFAULT_RULE_SPEC, 'borderline': 0.1},
+        ]
+        for spec in malformed:
+            with self.assertRaises(ValidationError):
+                rules.validate_spec(spec)
+            with self.assertRaises(ValidationError):
+                RuleSet(version=99, spec=spec).full_clean()
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class SimulationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        make_students(30)
+        refresh_gpa_aggregates()
+        analyse_cohort()
+
+    def test_scenario_is_scored_in_memory(self):
+        stored = list(AttritionAnalysisResult.objects.order_by('id').values_list('risk_level', 'certainty_score'))
+        version = get_data_version()
+
+        report = simulations.simulate(simulations.build_scenario(financial_status=['Scholarship'], gpa_delta=1.0, year=1))
+        self.assertEqual(report['students'], Student.objects.filter(academic_year=1).count())
+        self.assertEqual(report['changed_students'], report['students'])
+        self.assertNotIn('Low->High', report['transitions'])
+        self.assertLess(report['after']['High'], report['before']['High'])
+        self.assertEqual(sum(report['before'].values()), sum(report['after'].values()))
+        self.assertEqual([(group['name'], group['students']) for group in report['by_year']], [('Year 1', report['students'])])
+        self.assertEqual(report['by_course'][0]['after'], report['after'])  # Year 1 is all Physics
+
+        self.assertEqual(list(AttritionAnalysisResult.objects.order_by('id').values_list('risk_level', 'certainty_score')), stored)
+        self.assertEqual(get_data_version(), version)
+
+    def test_unchanged_scenario_matches_stored_results(self):
+        report = simulations.simulate(simulations.build_scenario())
+        self.assertEqual(report['changed_students'], 0)
+        self.assertEqual(report['transitions'], {})
+        for level in rules.RISK_LEVELS:
+            self.assertEqual(report['before'][level], AttritionAnalysisResult.objects.filter(risk_level=level).count())
+
+    def test_invalid_scenario_is_rejected(self):
+        with self.assertRaises(ValidationError) as raised:
+            simulations.build_scenario(faculty='science', complexity=['Difficult:Trivial'], gpa_delta='lots')
+        self.assertEqual(len(raised.exception.messages), 3)
+
+
+class BacktestTests(TestCase):
+
+    def setUp(self):
+        students = make_students(40)
+        refresh_gpa_aggregates()
+        # Low GPAs dropped out, except a few; the rest graduated
+        dropped = [student.id for student in students if student.gpa < 2.2 or student.gpa > 4.6]
+        Student.objects.filter(id__in=dropped).update(enrollment_status=Student.DROPPED_OUT)
+        Student.objects.exclude(id__in=dropped).update(enrollment_status=Student.GRADUATED)
+        self.history = backtesting.load_history()
+
+    def test_metrics_against_outcomes(self):
+        risk_index = np.array([0, 0, 0, 1, 1, 2])  # High, High, High, Medium, Medium, Low
+        dropped_out = np.array([True, True, False, True, False, False])
+        metrics = backtesting.evaluate(risk_index, dropped_out)
+        self.assertEqual(metrics['confusion'], {'true_positive': 2, 'false_positive': 1, 'false_negative': 1, 'true_negative': 2})
+        self.assertEqual((metrics['precision'], metrics['recall']), (0.6667, 0.6667))
+        self.assertEqual(metrics['by_risk_level']['Medium'], {Student.GRADUATED: 1, Student.DROPPED_OUT: 1})
+        self.assertEqual(backtesting.evaluate(risk_index, dropped_out, flagged=('High', 'Medium'))['recall'], 1.0)
+
+    def test_sweep_ranks_every_valid_combination(self):
+        grid = backtesting.parse_grid([
+            'variables.gpa.sets.low.points.2=1.5,2.0,9',  # 9 is outside the GPA universe
+            'rules.High.gpa.weight=0.5,0.7',
+            'borderline.margin=0,0.12',
+        ])
+        result = backtesting.sweep(rules.DEFAULT_RULE_SPEC, grid, self.history, workers=1)
+        self.assertEqual((result['combinations'], result['invalid'], result['pruned']), (12, 4, 0))
+        f1_scores = [metrics['f1'] for metrics in result['results']]
+        self.assertEqual(f1_scores, sorted(f1_scores, reverse=True))
+
+        best = backtesting.backtest(rules.CompiledRuleSet(0, result['best_spec']), self.history)
+        self.assertEqual(best['f1'], f1_scores[0])
+        self.assertEqual(set(best['by_year']), {1, 2, 3, 4})
+
+    def test_unknown_parameter_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            list(backtesting.expand_grid(rules.DEFAULT_RULE_SPEC, {'rules.High.attendance.weight': [0.5]}))
+
+
+# -----------------------------------------
+# Benchmark suite smoke test: the synthetic data is reproducible and every in-process
+# mode produces a complete report (the sharded mode needs a file database; see benchmark_analysis)
+# -----------------------------------------
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class BenchmarkTests(TestCase):
+    CONFIG = {**DEFAULT_CONFIG, 'faculties': 2, 'courses_per_faculty': 3, 'students': 120, 'single_sample': 10}
+
+    def test_synthetic_institution_is_reproducible(self):
+        created = generate_institution(**self.CONFIG)
+        self.assertEqual(created, {'faculties': 2, 'courses': 6, 'students': 120, 'academic_records': 360})
+        first = list(Student.objects.order_by('id').values_list('avg_gpa', 'financial_status', 'course__name'))
+
+        Faculty.objects.all().delete()
+        generate_institution(**self.CONFIG)
+        self.assertEqual(list(Student.objects.order_by('id').values_list('avg_gpa', 'financial_status', 'course__name')), first)
+
+    def test_every_mode_reports_its_measurements(self):
+        generate_institution(**self.CONFIG)
+        modes = [mode for mode in BENCHMARK_MODES if mode != 'sharded']
+        report = run_benchmarks(self.CONFIG, modes)
+
+        runs = {run['mode']: run for run in report['runs']}
+        self.assertEqual(list(runs), modes)
+        for run in runs.values():
+            self.assertIsNone(run['error'], run['mode'])
+            self.assertGreater(run['queries'], 0)
+            self.assertGreater(run['peak_rss_mb'], 0)
+        self.assertEqual(runs['single']['students'], 10)
+        self.assertEqual(runs['batch']['scored'], 120)
+        self.assertEqual(set(runs['batch']['phases']), {'fetch', 'score', 'persist', 'cube'})
+        self.assertEqual(runs['incremental_unchanged']['scored'], 0)
+        self.assertIn(runs['incremental_changed']['scored'], range(1, 13))  # 10% changed; GPAs already at 5.0 can't move
+
+    def test_web_workers_do_not_load_the_analysis_stack(self):
+        report = measure_startup(['web'], runs=1)
+        self.assertEqual(report['web']['heavy_modules'], [])
+
+
+@override_settings(CACHES=LOCMEM_CACHE, METRICS_TOKEN='', METRICS_ALLOWED_IPS=['127.0.0.1'])
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        metrics.flush()  # Drop increments buffered by earlier tests along with the counters
+        counters.clear()
+
+    def test_metrics_expose_requests_and_analysis_phases(self):
+        make_students(10)
+        analyse_cohort()
+        self.client.get(reverse('home'))
+
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('aisha_http_requests_total{view="home",status="2xx"} 1', body)
+        self.assertIn('aisha_http_request_duration_seconds_bucket{view="home",le="+Inf"} 1', body)
+        self.assertIn('aisha_analysis_runs_total{mode="cohort"} 1', body)
+        self.assertIn('aisha_analysis_students_scored_total 10', body)
+        for phase in ('fetch', 'score', 'persist', 'cube'):
+            self.assertIn(f'aisha_analysis_phase_duration_seconds_count{{phase="{phase}"}} 1', body)
+
+    @override_settings(METRICS_ALLOWED_IPS=[])
+    def test_metrics_are_denied_by_default(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret', METRICS_ALLOWED_IPS=[])
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
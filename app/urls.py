@@ -5,9 +5,15 @@ from django.contrib.auth.views import LogoutView
 urlpatterns = [
     path('',views.home, name = 'home'),
     path('run_analysis/', views.trigger_analysis, name='trigger_analysis'),
+    path('analysis_jobs/<int:job_id>/', views.analysis_job_status, name='analysis_job_status'),
     path('analysis_results/', views.view_analysis_results, name='view_analysis_results'),
+    path('analysis_results/export/', views.export_analysis_results, name='export_analysis_results'),
     path('dashboard/', views.dashboard_view, name='dashboard'),
     path('attrition_dashboard/', views.risk_level_distribution, name='attrition_dashboard'),
+    path('charts/<slug:dataset>/', views.chart_data, name='chart_data'),
+    path('simulate/', views.simulate_scenario, name='simulate_scenario'),
+    path('cache_stats/', views.view_cache_stats, name='cache_stats'),
+    path('metrics', views.metrics_view, name='metrics'),
     path('login/', views.admin_login, name='admin_login'),
     path('logout/', LogoutView.as_view(), name='logout'),
     path('register/', views.register_user, name='register'),
@@ -1,10 +1,14 @@
 from django.shortcuts import render
 from django.shortcuts import render, redirect
 from django.contrib import messages
-from .annalysis import run_attrition_analysis
-from .models import AttritionAnalysisResult,AcademicRecord
-from .models import Student
-from django.db import models
+from .jobs import enqueue_analysis
+from .models import AttritionAnalysisResult,AnalysisJob,RuleSet
+from .models import Faculty, Course
+from .pagination import keyset_page
+from .aggregates import CHART_DATASETS, OVERVIEWS, cube_filters, student_overview
+from .caching import cache_stats, cached_data, data_etag
+from .metrics import render_metrics
+from django.conf import settings
 import traceback
 from threading import Thread
 import threading
@@ -13,6 +17,14 @@ from .forms import AdminLoginForm
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse, HttpResponseBadRequest
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import cache_control
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
+from .exports import EXPORT_FORMATS, export_queryset, iter_export
+from django.shortcuts import get_object_or_404
+from django.core.exceptions import ValidationError
  
  
  # Create your views here.
@@ -32,17 +44,44 @@ def register_user(request):
     return render(request, 'register.html', {'form': form})
 
  
+def _queue_analysis(request):
+    # Runs happen in the analysis worker; the request only queues (or joins) a job
+    try:
+        job, created = enqueue_analysis()
+    except Exception as e:
+        traceback.print_exc()
+        messages.error(request, f'❌ An error occurred while queueing the analysis: {str(e)}')
+        return None
+    if created:
+        messages.success(request, f'✅ Student attrition analysis has been queued (job #{job.pk}).')
+    else:
+        messages.info(request, f'ℹ️ An analysis is already {job.status.lower()} (job #{job.pk}).')
+    return job
+
+
+@login_required
 def trigger_analysis(request):
     if request.method == 'POST':
-        try:
-            run_attrition_analysis()
-            messages.success(request, '✅ Student attrition analysis has been completed.')
-        except Exception as e:
-            traceback.print_exc()
-            messages.error(request, f'❌ An error occurred during analysis: {str(e)}')
+        _queue_analysis(request)
         return redirect('view_analysis_results')
     
-    return render(request, 'trigger_analysis.html')
+    latest_job = AnalysisJob.objects.order_by('-created_at').first()
+    return render(request, 'trigger_analysis.html', {'job': latest_job})
+
+
+@login_required
+def analysis_job_status(request, job_id):
+    job = get_object_or_404(AnalysisJob, pk=job_id)
+    return JsonResponse({
+        'id': job.pk,
+        'status': job.status,
+        'phase': job.phase,
+        'processed': job.processed,
+        'total': job.total,
+        'elapsed_seconds': round(job.elapsed_seconds, 1),
+        'stats': job.stats,
+        'error': job.error,
+    })
   
 
 
@@ -63,102 +102,176 @@ def admin_login(request):
     return render(request, 'admin_login.html', {'form': form})
  
 
+# Sort options for the results page; each maps to an AttritionAnalysisResult column indexed with id
+RESULT_SORT_FIELDS = {
+    'id': 'id',
+    'certainty': 'certainty_score',
+    'risk': 'risk_level',
+}
+RESULTS_PAGE_SIZE = 50
+
+
+def _float_param(params, name):
+    try:
+        return float(params[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def _filter_results(params):
+    # Server-side filters: risk level, faculty, course, academic year and a certainty range
+    results = AttritionAnalysisResult.objects.select_related('student__course', 'student__faculty')
+    if params.get('risk_level'):
+        results = results.filter(risk_level=params['risk_level'])
+    if params.get('faculty', '').isdigit():
+        results = results.filter(student__faculty_id=params['faculty'])
+    if params.get('course', '').isdigit():
+        results = results.filter(student__course_id=params['course'])
+    if params.get('year', '').isdigit():
+        results = results.filter(student__academic_year=params['year'])
+    min_certainty = _float_param(params, 'min_certainty')
+    if min_certainty is not None:
+        results = results.filter(certainty_score__gte=min_certainty)
+    max_certainty = _float_param(params, 'max_certainty')
+    if max_certainty is not None:
+        results = results.filter(certainty_score__lte=max_certainty)
+    return results
+
+
 @login_required
 def view_analysis_results(request):
     if request.method == 'POST':
-        run_attrition_analysis()  # Run for all students
-        messages.success(request, 'Attrition analysis updated for all students.')
+        _queue_analysis(request)  # Run for all students in the analysis worker
         return redirect('view_analysis_results')
 
-    results = AttritionAnalysisResult.objects.select_related('student').all()
-    return render(request, 'view_analysis_results.html', {'results': results})
+    params = request.GET
+    sort = params.get('sort') if params.get('sort') in RESULT_SORT_FIELDS else 'id'
+    descending = params.get('dir') == 'desc'
+    page = cached_data('results', dict(params.items()), lambda: keyset_page(
+        _filter_results(params),
+        RESULT_SORT_FIELDS[sort],
+        descending=descending,
+        after=params.get('after'),
+        before=params.get('before'),
+        page_size=RESULTS_PAGE_SIZE,
+    ))
 
+    # Query string of the current filters, for the next/previous links
+    base_query = params.copy()
+    base_query.pop('after', None)
+    base_query.pop('before', None)
 
-@login_required 
-def dashboard_view(request):
-    total_students = Student.objects.count()  # counts all students
-    # Students per Academic Year (assuming academic_year values are like 1,2,3,4)
-    students_per_year = (
-        Student.objects.values('academic_year')
-        .order_by('academic_year')
-        .annotate(count=models.Count('id'))
-    )
-    # styudents per gender
-    gender_data = Student.objects.values('gender').annotate(count=models.Count('id'))
-    genders = [item['gender'] for item in gender_data]
-    gender_counts = [item['count'] for item in gender_data]
-
-   # Students per faculty (getting faculty names)
-    faculty_data = Student.objects.values('faculty__name').annotate(count=models.Count('id'))
-    faculties = [entry['faculty__name'] for entry in faculty_data]
-    faculty_counts = [entry['count'] for entry in faculty_data]
-
-    # Students per course (getting course names)
-    course_data = Student.objects.values('course__name').annotate(count=models.Count('id'))
-    courses = [entry['course__name'] for entry in course_data]
-    course_counts = [entry['count'] for entry in course_data]
-   
-   
-   
     context = {
-        'total_students': total_students,
-        'students_per_year': students_per_year,
-        'genders': genders,
-        'gender_counts': gender_counts,
-        'faculties': faculties,
-        'faculty_counts': faculty_counts,
-        'courses': courses,
-        'course_counts': course_counts,
+        'results': page['items'],
+        'next_cursor': page['next_cursor'],
+        'prev_cursor': page['prev_cursor'],
+        'base_query': base_query.urlencode(),
+        'filters': params,
+        'sort': sort,
+        'descending': descending,
+        'risk_levels': [level for level, _ in AttritionAnalysisResult.RISK_LEVEL_CHOICES],
+        **cached_data('result_filter_options', {}, lambda: {
+            'faculties': list(Faculty.objects.order_by('name').values('id', 'name')),
+            'courses': list(Course.objects.order_by('name').values('id', 'name')),
+        }),
     }
-    return render(request, 'dashboard.html', context)  
+    return render(request, 'view_analysis_results.html', context)
+
 
 @login_required
-def risk_level_distribution(request):
-    risk_data =AttritionAnalysisResult.objects.values('risk_level').annotate(count=models.Count('id'))
+def export_analysis_results(request):
+    # Streams every matching result; ?format=csv|jsonl&risk_level=High&faculty=<name>&year=<academic year>
+    file_format = request.GET.get('format', 'csv')
+    if file_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest(f"Unsupported format '{file_format}'.")
+    year = request.GET.get('year')
+    if year and not year.isdigit():
+        return HttpResponseBadRequest("year must be a number.")
 
-    # Prepare data for Chart.js
-    labels = []
-    counts = []
-    for entry in risk_data:
-        labels.append(entry['risk_level'])  # e.g., 'Low', 'Medium', 'High'
-        counts.append(entry['count'])
+    rows = export_queryset(
+        risk_level=request.GET.get('risk_level'),
+        faculty=request.GET.get('faculty'),
+        year=year,
+    )
+    response = StreamingHttpResponse(iter_export(rows, file_format), content_type=EXPORT_FORMATS[file_format])
+    response['Content-Disposition'] = f'attachment; filename="attrition_results.{file_format}"'
+    return response
 
- 
-     # Faculties with high risk
-    faculty_risk =  AttritionAnalysisResult.objects.filter(risk_level='High').values('student__faculty__name').annotate(count=models.Count('id'))
 
-    # Years with high risk
-    year_risk = AttritionAnalysisResult.objects.filter(risk_level='High').values('student__academic_year').annotate(count=models.Count('id'))
+@login_required
+def view_cache_stats(request):
+    return JsonResponse(cache_stats())
 
-    # Courses with high risk
-    course_risk = AttritionAnalysisResult.objects.filter(risk_level='High').values('student__course__name').annotate(count=models.Count('id'))
 
-    # Genders with high risk
-    gender_risk = AttritionAnalysisResult.objects.filter(risk_level='High').values('student__gender').annotate(count=models.Count('id'))
-    # Organizing data to pass to the template
-    # Preparing lists
-    faculty_labels = [entry['student__faculty__name'] for entry in faculty_risk]
-    faculty_counts = [entry['count'] for entry in faculty_risk]
+@login_required
+def simulate_scenario(request):
+    # What-if re-scoring, read-only: ?faculty=&course=&year= narrow the cohort; financial_status=Struggling:Scholarship,
+    # complexity=Difficult:Moderate (repeatable, or just the new value for everyone) and gpa_delta=0.3 change it
+    from .simulations import build_scenario, simulate  # Loads the analysis stack on first use, not at worker boot
+    params = request.GET
+    rule_version = params.get('rule_version')
+    if rule_version is None:
+        rule_version = RuleSet.active_version()
+    elif not rule_version.isdigit():
+        return HttpResponseBadRequest("rule_version must be a number.")
+    elif int(rule_version) != RuleSet.DEFAULT_VERSION and not RuleSet.objects.filter(version=rule_version).exists():
+        raise Http404(f"No rule set with version {rule_version}.")
+    try:
+        scenario = build_scenario(
+            faculty=params.get('faculty'),
+            course=params.get('course'),
+            year=params.get('year'),
+            financial_status=params.getlist('financial_status'),
+            complexity=params.getlist('complexity'),
+            gpa_delta=params.get('gpa_delta'),
+        )
+    except ValidationError as e:
+        return HttpResponseBadRequest(' '.join(e.messages))
 
-    year_labels = [entry['student__academic_year'] for entry in year_risk]
-    year_counts = [entry['count'] for entry in year_risk]
+    # Same scenario, rule version and data: same answer, so repeats come from the versioned cache
+    rule_version = int(rule_version)
+    report = cached_data('simulation', {**scenario, 'rule_version': rule_version}, lambda: simulate(scenario, rule_version))
+    return JsonResponse(report)
 
-    course_labels = [entry['student__course__name'] for entry in course_risk]
-    course_counts = [entry['count'] for entry in course_risk]
 
-    gender_labels = [entry['student__gender'] for entry in gender_risk]
-    gender_counts = [entry['count'] for entry in gender_risk]
+def metrics_view(request):
+    # Prometheus scrape endpoint; denied unless the bearer token matches or the scraper's address is allowed
+    token = settings.METRICS_TOKEN
+    authorised = bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorised and request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
-    context = {
-        'labels': labels,
-        'counts': counts,
-        'faculty_labels': faculty_labels,
-        'faculty_counts': faculty_counts,
-        'year_labels': year_labels,
-        'year_counts': year_counts,
-        'course_labels': course_labels,
-        'course_counts': course_counts,
-        'gender_labels': gender_labels,
-        'gender_counts': gender_counts,
-    }
-    return render(request, 'attrition_dashboard.html', context)
+
+@login_required 
+def dashboard_view(request):
+    # The page only carries the total; the charts load their datasets from chart_data in parallel
+    filters = cube_filters(request.GET)
+    overview = cached_data('dashboard', filters, lambda: student_overview(filters))
+    return render(request, 'dashboard.html', {'total_students': overview['total_students']})  
+
+@login_required
+def risk_level_distribution(request):
+    # Page shell only; every chart fetches its own dataset from chart_data (?faculty=&course=&year=&... pass through)
+    return render(request, 'attrition_dashboard.html')
+
+
+def _chart_etag(request, dataset):
+    if dataset not in CHART_DATASETS:
+        return None
+    return data_etag(dataset, cube_filters(request.GET))
+
+
+@login_required
+@gzip_page
+@cache_control(private=True, no_cache=True)  # Browsers keep the copy but revalidate it with If-None-Match
+@condition(etag_func=_chart_etag)
+def chart_data(request, dataset):
+    # One chart's labels and counts as JSON; unchanged data answers 304 without touching the cube
+    if dataset not in CHART_DATASETS:
+        raise Http404(f"Unknown chart dataset '{dataset}'.")
+    overview, labels_key, counts_key = CHART_DATASETS[dataset]
+    cache_name, build = OVERVIEWS[overview]
+    filters = cube_filters(request.GET)
+    data = cached_data(cache_name, filters, lambda: build(filters))
+    return JsonResponse({'labels': data[labels_key], 'counts': data[counts_key]})